@@ -1,10 +1,23 @@
 import os
 from dotenv import load_dotenv
+# the one place env files are read: local .env, then the Render secret file
 load_dotenv()
+load_dotenv("/etc/secrets/.env")
 
 class Settings:
     openai_api_key: str | None = os.getenv("OPENAI_API_KEY")
     timezone: str = os.getenv("APP_TIMEZONE", "America/Los_Angeles")
     city: str = os.getenv("CITY", "San Diego")
+    # upstream base URLs; overridable so bench/ can point the app at local stand-ins
+    # (the OpenAI SDK reads OPENAI_BASE_URL itself)
+    geocode_url: str = os.getenv("GEOCODE_URL", "https://geocoding-api.open-meteo.com/v1/search")
+    weather_url: str = os.getenv("WEATHER_URL", "https://api.open-meteo.com/v1/forecast")
+    news_rss_url: str = os.getenv("NEWS_RSS_URL", "https://news.google.com/rss/search")
+    # where the legacy prefs.json lives; unset keeps each router's historical location
+    data_dir: str | None = os.getenv("APP_DATA_DIR")
+    # Redis for per-user prefs (redis://host:6379, rediss:// if TLS); unset = the SQL database
+    kv_url: str = os.getenv("KV_URL", "")
+    # honour X-User-Id from clients. No auth yet, so off by default: every request is DEFAULT_USER_ID
+    trust_user_header: bool = os.getenv("TRUST_USER_HEADER", "0").lower() in ("1", "true", "yes")
 
 settings = Settings()
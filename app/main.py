@@ -1,10 +1,59 @@
+from contextlib import asynccontextmanager
 from pathlib import Path
-from fastapi import FastAPI, Request
-from fastapi.responses import RedirectResponse, PlainTextResponse, HTMLResponse
+import importlib, logging, math, os, threading
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import JSONResponse, RedirectResponse, PlainTextResponse, HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
-app = FastAPI(title="Personal Agent", version="1.0.0")
+from .db import engine, init_db
+from .services.calendar_store import sync_job as calendar_sync_job
+from .services.limiter import Overloaded
+from .services.prefs import saved_topics
+from .services.search import ensure_index as ensure_search_index
+from .services.users import current_user_id
+from .utils import loopmon, metrics
+from .utils.http import ConditionalMiddleware
+
+# SDKs that are imported lazily on first use; warmed in the background after
+# startup so the port opens fast and the first real request doesn't pay for them
+_PREWARM = ("httpx", "openai", "ics", "numpy")
+
+def _prewarm():
+    for mod in _PREWARM:
+        try:
+            importlib.import_module(mod)
+        except Exception:
+            logging.getLogger(__name__).warning("prewarm: could not import %s", mod)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_db()
+    ensure_search_index(engine)
+    if loopmon.ENABLED:
+        loopmon.monitor.start()
+    from routers.news import ingest_job
+    ingest_job.start(saved_topics)
+    calendar_sync_job.start()
+    if os.getenv("PREWARM_IMPORTS", "1") not in ("0", "false", "no"):
+        threading.Thread(target=_prewarm, name="prewarm", daemon=True).start()
+    yield
+    ingest_job.stop()
+    calendar_sync_job.stop()
+    if loopmon.ENABLED:
+        loopmon.monitor.stop()
+
+app = FastAPI(title="Personal Agent", version="1.0.0", lifespan=lifespan)
+app.add_middleware(metrics.ServerTimingMiddleware)
+app.add_middleware(ConditionalMiddleware)   # ETag/304 + gzip/br for JSON
+if loopmon.ENABLED:
+    app.add_middleware(loopmon.LoopMonitorMiddleware)
+
+@app.exception_handler(Overloaded)
+def overloaded(request: Request, exc: Overloaded):
+    # OpenAI limiter shed the call: tell the client when to come back
+    return JSONResponse({"detail": str(exc)}, status_code=429,
+                        headers={"Retry-After": str(math.ceil(exc.retry_after))})
 
 BASE_DIR = Path(__file__).resolve().parent          # .../app
 REPO_ROOT = BASE_DIR.parent                         # repo root
@@ -19,6 +68,9 @@ for cand in STATIC_DIRS:
 templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
 
 # Routers
+from .routers.users import router as users_router
+app.include_router(users_router)
+
 from .routers.prefs import router as prefs_router
 app.include_router(prefs_router)
 
@@ -28,6 +80,18 @@ app.include_router(study_router)
 from .routers.report import router as report_router
 app.include_router(report_router)
 
+from .routers.search import router as search_router
+app.include_router(search_router)
+
+from .routers.archive import router as archive_router
+app.include_router(archive_router)
+
+from .routers.calendar import router as calendar_router
+app.include_router(calendar_router)
+
+from routers.news import router as news_router
+app.include_router(news_router)
+
 @app.get("/", include_in_schema=False)
 def root():
     return RedirectResponse("/ui")
@@ -49,14 +113,28 @@ def ui(request: Request):
 def healthz():
     return {"status": "ok"}
 
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    # Prometheus text exposition; off unless METRICS_ENABLED=1 so nothing is aggregated by default
+    if not metrics.ENABLED:
+        return PlainTextResponse("metrics disabled (set METRICS_ENABLED=1)\n", status_code=404)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/loop", include_in_schema=False)
+def loop_debug():
+    # event-loop lag, recent stalls with stacks, per-route blocked vs awaiting; off unless LOOP_MONITOR=1
+    if not loopmon.ENABLED:
+        return PlainTextResponse("loop monitor disabled (set LOOP_MONITOR=1)\n", status_code=404)
+    return loopmon.monitor.snapshot()
+
 # Legacy aliases so README curl keeps working
 from .routers.report import morning as r_morning, morning_speak as r_morning_speak
 
 @app.get("/morning", include_in_schema=False)
-def morning_alias():
-    return r_morning()
+def morning_alias(user_id: int = Depends(current_user_id)):
+    return r_morning(user_id=user_id)
 
 @app.get("/morning/speak", include_in_schema=False)
-def morning_speak_alias():
-    return r_morning_speak()
+def morning_speak_alias(user_id: int = Depends(current_user_id)):
+    return r_morning_speak(user_id=user_id)
 
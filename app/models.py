@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Float, Text
+from sqlalchemy import Boolean, Column, Integer, String, Date, DateTime, ForeignKey, Float, Text, Index
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from datetime import datetime
 from .db import Base
@@ -41,6 +41,31 @@ class StudyItem(Base):
     topic: Mapped[str] = mapped_column(String)
     source_doc_id: Mapped[str | None] = mapped_column(String, nullable=True)
     difficulty: Mapped[str] = mapped_column(String, default="mixed")
+    # SM-2 scheduling state; new items are due immediately
+    ease: Mapped[float] = mapped_column(Float, default=2.5)
+    interval_days: Mapped[float] = mapped_column(Float, default=0.0)
+    reps: Mapped[int] = mapped_column(Integer, default=0)
+    lapses: Mapped[int] = mapped_column(Integer, default=0)
+    next_due: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    last_reviewed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+    # due queue: WHERE user_id=? AND next_due<=? ORDER BY next_due is a pure index range scan
+    __table_args__ = (Index("ix_study_items_user_due", "user_id", "next_due"),)
+
+class NoteDoc(Base):
+    __tablename__ = "note_docs"
+    id: Mapped[str] = mapped_column(String, primary_key=True)  # referenced by StudyItem.source_doc_id
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
+    title: Mapped[str] = mapped_column(String)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+class NoteChunk(Base):
+    __tablename__ = "note_chunks"
+    id: Mapped[int] = mapped_column(primary_key=True)  # row key in the vector index
+    doc_id: Mapped[str] = mapped_column(ForeignKey("note_docs.id"), index=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    ord: Mapped[int] = mapped_column(Integer)
+    text: Mapped[str] = mapped_column(Text)
 
 class StudySession(Base):
     __tablename__ = "study_sessions"
@@ -51,6 +76,19 @@ class StudySession(Base):
     accuracy: Mapped[float | None] = mapped_column(Float, nullable=True)
     notes: Mapped[str | None] = mapped_column(Text, nullable=True)
 
+    # stats read a user's sessions by id range: WHERE user_id=? AND id>?
+    __table_args__ = (Index("ix_study_sessions_user", "user_id"),)
+
+class StudyReview(Base):
+    __tablename__ = "study_reviews"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
+    session_id: Mapped[int | None] = mapped_column(ForeignKey("study_sessions.id"), nullable=True, index=True)
+    item_id: Mapped[int] = mapped_column(ForeignKey("study_items.id"), index=True)
+    reviewed_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    quality: Mapped[int] = mapped_column(Integer)  # 0..5 (SM-2 grade)
+    accuracy: Mapped[float | None] = mapped_column(Float, nullable=True)
+
 class Reminder(Base):
     __tablename__ = "reminders"
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -59,6 +97,54 @@ class Reminder(Base):
     due: Mapped[datetime | None] = mapped_column(Date, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
+class UserPrefs(Base):
+    """One JSON prefs document per user (topics, home, calendar); see services/prefs."""
+    __tablename__ = "user_prefs"
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    data: Mapped[str] = mapped_column(Text, default="{}")
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+class ReportSnapshot(Base):
+    """A built morning report, frozen; /report/morning/speak?report_id= reads exactly this text."""
+    __tablename__ = "report_snapshots"
+    id: Mapped[str] = mapped_column(String, primary_key=True)   # content hash, see services/snapshots
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    text: Mapped[str] = mapped_column(Text)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+
+class CalendarEvent(Base):
+    """One event occurrence from a user's ICS feed, kept in sync by services/calendar_store."""
+    __tablename__ = "calendar_events"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    feed: Mapped[str] = mapped_column(String)          # ICS URL it came from
+    uid: Mapped[str] = mapped_column(String)           # UID, or the title for events without one
+    start: Mapped[datetime] = mapped_column(DateTime)  # UTC; all-day events at 00:00 of their date
+    end: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    all_day: Mapped[bool] = mapped_column(Boolean, default=False)
+    title: Mapped[str] = mapped_column(String)
+    location: Mapped[str | None] = mapped_column(String, nullable=True)
+    sequence: Mapped[int] = mapped_column(Integer, default=0)
+    last_modified: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+    # range reads are WHERE user_id=? AND start BETWEEN ..; a recurring series is one row per occurrence
+    __table_args__ = (
+        Index("ix_calendar_events_user_start", "user_id", "start"),
+        Index("ux_calendar_events_occurrence", "user_id", "feed", "uid", "start", unique=True),
+    )
+
+class CalendarFeed(Base):
+    """Sync state per (user, ICS URL): validators for conditional GETs and when it last worked."""
+    __tablename__ = "calendar_feeds"
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    url: Mapped[str] = mapped_column(String, primary_key=True)
+    etag: Mapped[str | None] = mapped_column(String, nullable=True)
+    http_modified: Mapped[str | None] = mapped_column(String, nullable=True)
+    synced_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)    # last successful sync
+    checked_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)   # last attempt
+    parsed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)    # last full expand + diff
+    error: Mapped[str | None] = mapped_column(String, nullable=True)
+
 class NewsPref(Base):
     __tablename__ = "news_prefs"
     id: Mapped[int] = mapped_column(primary_key=True)
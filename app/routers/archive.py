@@ -0,0 +1,49 @@
+from datetime import datetime
+import zlib
+
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from ..db import engine
+from ..services.archive import ArchiveError, Importer, LineReader, export_lines, gzip_stream
+from ..services.users import current_user_id
+from ..utils.metrics import stage
+
+router = APIRouter(tags=["archive"])
+
+@router.get("/export")
+def export(gzip: bool = Query(False, description="gzip the NDJSON"), user_id: int = Depends(current_user_id)):
+    """Everything the user owns, streamed as NDJSON (see services/archive for the format)."""
+    body = export_lines(engine, user_id)
+    name = f"personal-agent-{user_id}-{datetime.utcnow():%Y%m%d}.ndjson"
+    if gzip:
+        return StreamingResponse(gzip_stream(body), media_type="application/gzip",
+                                 headers={"Content-Disposition": f'attachment; filename="{name}.gz"'})
+    return StreamingResponse(body, media_type="application/x-ndjson",
+                             headers={"Content-Disposition": f'attachment; filename="{name}"'})
+
+@router.post("/import")
+async def import_archive(request: Request, user_id: int = Depends(current_user_id)):
+    """
+    Load an /export archive (plain or gzipped NDJSON body) into the current
+    user's account, alongside what is already there. Rows are committed in
+    batches: on a malformed line, what came before it stays imported.
+    """
+    reader = LineReader()
+    importer = Importer(engine, user_id)
+
+    def take(records) -> None:
+        for line, rec in records:
+            importer.add(line, rec)
+
+    try:
+        with stage("import"):
+            async for chunk in request.stream():
+                # parsing is cheap; the inserts block, so they run in the threadpool
+                await run_in_threadpool(take, reader.feed(chunk))
+            await run_in_threadpool(take, reader.close())
+            return await run_in_threadpool(importer.finish)
+    except (ArchiveError, zlib.error) as e:
+        summary = await run_in_threadpool(importer.finish)
+        return JSONResponse({"detail": str(e), **summary}, status_code=400)
@@ -0,0 +1,75 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel
+
+from ..services.calendar import calendar_urls
+from ..services.calendar_store import AHEAD, covers, events_between, sync_user
+from ..services.prefs import get_store
+from ..services.users import current_user_id
+from ..utils.breaker import describe_age
+
+router = APIRouter(prefix="/calendar", tags=["calendar"])
+
+class EventOut(BaseModel):
+    uid: Optional[str] = None
+    title: str
+    start: datetime
+    end: Optional[datetime] = None
+    all_day: bool = False
+    location: Optional[str] = None
+
+class EventsOut(BaseModel):
+    tz: str
+    start: date
+    days: int
+    events: List[EventOut]
+    stale: Optional[str] = None     # "as of 2 h ago" when a feed couldn't be refreshed
+
+def _home_tz(user_id: int) -> ZoneInfo:
+    name = (get_store().get(user_id).get("home") or {}).get("tz")
+    try:
+        return ZoneInfo(name) if name else ZoneInfo("UTC")
+    except Exception:
+        return ZoneInfo("UTC")
+
+@router.get("/events", response_model=EventsOut)
+def events(
+    start: Optional[date] = Query(None, description="first local day, default today"),
+    days: int = Query(1, ge=1, le=AHEAD.days),
+    user_id: int = Depends(current_user_id),
+):
+    """Events from the synced store for `days` local days, in the user's home tz."""
+    tz = _home_tz(user_id)
+    first = start or datetime.now(timezone.utc).astimezone(tz).date()
+    lo = datetime(first.year, first.month, first.day, tzinfo=tz)
+    hi = lo + timedelta(days=days)
+    if not covers(lo, hi):
+        raise HTTPException(status_code=400, detail="range is outside the synced window (past week to next 60 days)")
+    urls = calendar_urls(get_store().get(user_id).get("calendar"))
+    evs, age = events_between(user_id, urls, lo, hi)
+    last = first + timedelta(days=days)
+    out = []
+    for e in evs:
+        if e.all_day:
+            # stored as UTC-midnight spans: in another zone the overlap query also returns
+            # neighbouring days, so match on the calendar dates [day, end) instead
+            if not (e.day < last and max(e.end.date() if e.end else e.day, e.day + timedelta(days=1)) > first):
+                continue
+            out.append(EventOut(uid=e.uid, title=e.title or "Untitled", start=e.begin, end=e.end, all_day=True,
+                                location=e.location))
+        else:
+            out.append(EventOut(uid=e.uid, title=e.title or "Untitled", start=e.begin.astimezone(tz),
+                                end=e.end.astimezone(tz) if e.end else None, location=e.location))
+    return EventsOut(tz=str(tz.key), start=first, days=days, events=out,
+                     stale=describe_age(age) if age is not None else None)
+
+@router.post("/sync")
+def sync(user_id: int = Depends(current_user_id)) -> Dict[str, Dict]:
+    """Sync the user's feeds now; per feed, what changed or why it failed."""
+    urls = calendar_urls(get_store().get(user_id).get("calendar"))
+    if not urls:
+        raise HTTPException(status_code=400, detail="No calendar connected.")
+    return sync_user(user_id, urls)
@@ -3,11 +3,10 @@ from sqlalchemy.orm import Session
 from ..db import get_db
 from ..models import Goal, User
 from ..schemas import GoalIn, GoalOut
+from ..services.users import current_user_id
 
 router = APIRouter()
 
-def current_user_id(): return 1
-
 @router.post("/goals", response_model=GoalOut)
 def create_goal(payload: GoalIn, db: Session = Depends(get_db), user_id: int = Depends(current_user_id)):
     # ensure default user exists
@@ -3,11 +3,10 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func
 from ..db import get_db
 from ..models import Task, Goal
+from ..services.users import current_user_id
 
 router = APIRouter()
 
-def current_user_id(): return 1
-
 @router.get("/metrics/weekly")
 def weekly_metrics(db: Session = Depends(get_db), user_id: int = Depends(current_user_id)):
     total = db.query(func.count(Task.id)).filter(Task.user_id==user_id).scalar() or 0
@@ -7,12 +7,10 @@ from ..services.news import fetch_curated_news
 from ..services.planner import suggest_top3_priorities
 from ..utils.time import blocks_from_events
 from ..schemas import MorningReport
+from ..services.users import current_user_id
 
 router = APIRouter()
 
-# For MVP we assume a single demo user with id=1
-def current_user_id(): return 1
-
 @router.get("/morning", response_model=MorningReport)
 def morning_report(db: Session = Depends(get_db), user_id: int = Depends(current_user_id)):
     events = get_today_calendar(user_id)
@@ -1,90 +1,88 @@
-import json, os
 from typing import Dict, Any, List, Optional
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 
-router = APIRouter(prefix="/prefs", tags=["prefs"])
+from ..services.calendar_store import kick as sync_calendar
+from ..services.prefs import get_store
+from ..services.users import current_user_id
 
-DATA_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "prefs.json"))
-os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
+router = APIRouter(prefix="/prefs", tags=["prefs"])
 
-def _load() -> Dict[str, Any]:
-    if not os.path.exists(DATA_FILE):
-        return {"topics": [], "home": {}, "calendar": {}}
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
-        try:
-            return json.load(f)
-        except Exception:
-            return {"topics": [], "home": {}, "calendar": {}}
+def _load(user_id: int) -> Dict[str, Any]:
+    return get_store().get(user_id)
 
-def _save(d: Dict[str, Any]) -> None:
-    os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(d, f, indent=2)
+def _save(user_id: int, d: Dict[str, Any]) -> None:
+    get_store().put(user_id, d)
 
 # ---- News topics ----
 @router.get("/news")
-def get_news_prefs():
-    return {"topics": _load().get("topics", [])}
+def get_news_prefs(user_id: int = Depends(current_user_id)):
+    return {"topics": _load(user_id).get("topics", [])}
 
 @router.post("/news")
-def upsert_news(payload: Dict[str, List[str]]):
+def upsert_news(payload: Dict[str, List[str]], user_id: int = Depends(current_user_id)):
     topics = payload.get("topics", [])
     if not isinstance(topics, list):
         raise HTTPException(status_code=400, detail="topics must be a list[str]")
-    d = _load()
+    d = _load(user_id)
     merged = list(dict.fromkeys([*d.get("topics", []), *[t for t in topics if t]]))
     d["topics"] = merged
-    _save(d)
+    _save(user_id, d)
     return {"ok": True, "topics": merged}
 
 @router.delete("/news/{topic}")
-def remove_topic(topic: str):
-    d = _load()
+def remove_topic(topic: str, user_id: int = Depends(current_user_id)):
+    d = _load(user_id)
     d["topics"] = [t for t in d.get("topics", []) if t.lower() != (topic or "").lower()]
-    _save(d)
+    _save(user_id, d)
     return {"ok": True, "topics": d["topics"]}
 
 # ---- Home (location + units + tz) ----
 @router.get("/home")
-def get_home():
-    return {"home": _load().get("home", {})}
+def get_home(user_id: int = Depends(current_user_id)):
+    return {"home": _load(user_id).get("home", {})}
 
 @router.post("/home")
-def set_home(payload: Dict[str, Any]):
+def set_home(payload: Dict[str, Any], user_id: int = Depends(current_user_id)):
     allowed = {"city", "zip", "lat", "lon", "tz", "units"}
     if not any(k in payload for k in allowed):
         raise HTTPException(status_code=400, detail="provide city or zip (and optional tz, units)")
-    d = _load()
+    d = _load(user_id)
     home = d.get("home", {}) or {}
     home.update({k: v for k, v in payload.items() if k in allowed and v is not None})
     # sanity
     if "units" in home and str(home["units"]).lower() not in ("imperial", "metric"):
         home["units"] = "imperial"
     d["home"] = home
-    _save(d)
+    _save(user_id, d)
     return {"ok": True, "home": home}
 
 @router.post("/set_home")
-def set_home_alias(payload: Dict[str, Any]):
-    return set_home(payload)
+def set_home_alias(payload: Dict[str, Any], user_id: int = Depends(current_user_id)):
+    return set_home(payload, user_id)
 
 # ---- Calendar (ICS URL) ----
 @router.get("/calendar")
-def get_calendar():
-    return {"calendar": _load().get("calendar", {})}
+def get_calendar(user_id: int = Depends(current_user_id)):
+    return {"calendar": _load(user_id).get("calendar", {})}
 
 @router.post("/calendar")
-def set_calendar(payload: Dict[str, Any]):
-    url = (payload.get("ics_url") or payload.get("url") or "").strip()
-    if not url:
-        raise HTTPException(status_code=400, detail="ics_url is required")
-    d = _load()
-    d["calendar"] = {"ics_url": url}
-    _save(d)
+def set_calendar(payload: Dict[str, Any], user_id: int = Depends(current_user_id)):
+    # accepts {"ics_urls": [...]} for several feeds (school, sports, personal) or a single ics_url/url
+    urls = payload.get("ics_urls") or []
+    if not isinstance(urls, list):
+        raise HTTPException(status_code=400, detail="ics_urls must be a list[str]")
+    urls = [*urls, payload.get("ics_url"), payload.get("url")]
+    urls = list(dict.fromkeys(u.strip() for u in urls if isinstance(u, str) and u.strip()))
+    if not urls:
+        raise HTTPException(status_code=400, detail="ics_url or ics_urls is required")
+    d = _load(user_id)
+    d["calendar"] = {"ics_url": urls[0], "ics_urls": urls}
+    _save(user_id, d)
+    sync_calendar(user_id, urls)   # fill the event store now rather than on the next report
     return {"ok": True, "calendar": d["calendar"]}
 
 @router.post("/set_calendar")
-def set_calendar_alias(payload: Dict[str, Any]):
-    return set_calendar(payload)
+def set_calendar_alias(payload: Dict[str, Any], user_id: int = Depends(current_user_id)):
+    return set_calendar(payload, user_id)
 
 
@@ -1,25 +1,30 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
-from typing import Dict, Any
+from typing import Any, AsyncIterator, Dict, List, Optional
 from datetime import datetime
+from time import perf_counter
 from zoneinfo import ZoneInfo
-import os, json, io
+import asyncio, os, json, io
 
+from ..services import snapshots
+from ..services.dedupe import THRESHOLD, jaccard, normalize
+from ..services.limiter import REPORT, Overloaded, estimate_tokens, limiter, retry_after_of
+from ..services.prefs import get_store
+from ..services.tts import split_segments, stream_speech, synthesize
+from ..services.users import current_user_id
 from ..services.weather import get_weather_summary
-from ..services.calendar import get_today_events
+from ..services.calendar import calendar_urls, get_today_events_aged
+from ..utils.breaker import describe_age
+from ..utils.metrics import stage, upstream_error
+from routers.news import _topic_articles
 
 router = APIRouter(prefix="/report", tags=["report"])
 
-DATA_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "prefs.json"))
+TTS_MODEL = "gpt-4o-mini-tts"
+TTS_VOICE = "alloy"
 
-def _load_prefs() -> Dict[str, Any]:
-    if not os.path.exists(DATA_FILE):
-        return {"topics": [], "home": {}, "calendar": {}}
-    try:
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {"topics": [], "home": {}, "calendar": {}}
+def _load_prefs(user_id: int) -> Dict[str, Any]:
+    return get_store().get(user_id)
 
 def _today_str(tz: str | None) -> str:
     try:
@@ -30,90 +35,229 @@ def _today_str(tz: str | None) -> str:
     return datetime.now().strftime("%A, %B %d")
 
 def _calendar_connected(cal: Dict[str, Any]) -> bool:
-    if not cal:
-        return False
-    for k in ("ics_url", "url", "ics", "calendar_url"):
-        v = cal.get(k)
-        if isinstance(v, str) and v.strip():
-            return True
-    return False
-
-def _build_morning_text(prefs: Dict[str, Any]) -> str:
-    home = prefs.get("home", {}) or {}
-    cal  = prefs.get("calendar", {}) or {}
-    topics = prefs.get("topics", []) or []
+    return bool(calendar_urls(cal))
 
-    tz = home.get("tz")
-    units = (home.get("units") or "imperial").lower()
-    place = home.get("city") or (f"ZIP {home.get('zip')}" if home.get("zip") else "your area")
-
-    weather_s = get_weather_summary(home)
-    cal_lines = get_today_events(cal, tz)
-
-    lines = [f"Good morning. Here’s your report for { _today_str(tz) }."]
-    # Calendar
-    if _calendar_connected(cal):
-        if cal_lines:
-            lines.append("Today’s calendar:")
-            lines.extend([f"• {x}" for x in cal_lines])
-        else:
-            lines.append("Your calendar is connected (no events today).")
-    else:
-        lines.append("No calendar connected yet.")
+def _greeting(tz: str | None) -> str:
+    return f"Good morning. Here’s your report for { _today_str(tz) }."
+
+def _place(home: Dict[str, Any]) -> str:
+    return home.get("city") or (f"ZIP {home.get('zip')}" if home.get("zip") else "your area")
 
-    # Weather
+def _calendar_lines(cal: Dict[str, Any], tz: str | None, user_id: int) -> List[str]:
+    if not _calendar_connected(cal):
+        return ["No calendar connected yet."]
+    with stage("calendar"):
+        cal_lines, cal_age = get_today_events_aged(cal, tz, user_id)
+    if not cal_lines:
+        return ["Your calendar is connected (no events today)."]
+    stale = f" ({describe_age(cal_age)})" if cal_age is not None else ""
+    return [f"Today’s calendar{stale}:"] + [f"• {x}" for x in cal_lines]
+
+def _weather_line(home: Dict[str, Any]) -> str:
+    units = (home.get("units") or "imperial").lower()
+    with stage("weather"):
+        weather_s = get_weather_summary(home)
     if weather_s:
-        lines.append(f"Weather for {place}: {weather_s}.")
-    else:
-        lines.append(f"Weather for {place}: unavailable right now ({'metric' if units=='metric' else 'imperial'}).")
+        return f"Weather for {_place(home)}: {weather_s}."
+    return f"Weather for {_place(home)}: unavailable right now ({'metric' if units=='metric' else 'imperial'})."
 
-    # Topics
+def _topics_line(topics: List[str]) -> str:
     if topics:
-        lines.append("Your topics: " + ", ".join(topics) + ".")
-    else:
-        lines.append("No news topics saved yet.")
+        return "Your topics: " + ", ".join(topics) + "."
+    return "No news topics saved yet."
+
+def _build_morning_text(prefs: Dict[str, Any], user_id: int) -> str:
+    home = prefs.get("home", {}) or {}
+    cal  = prefs.get("calendar", {}) or {}
+    topics = prefs.get("topics", []) or []
+    tz = home.get("tz")
 
+    lines = [_greeting(tz)]
+    lines += _calendar_lines(cal, tz, user_id)
+    lines.append(_weather_line(home))
+    lines.append(_topics_line(topics))
     lines += ["", "(Note: smart summary unavailable.)"]
     return "\n".join(lines).strip()
 
 @router.get("/morning")
-def morning(smart: bool = True):
-    prefs = _load_prefs()
-    text = _build_morning_text(prefs)
-    return {"text": text}
+def morning(smart: bool = True, user_id: int = Depends(current_user_id)):
+    prefs = _load_prefs(user_id)
+    text = _build_morning_text(prefs, user_id)
+    return {"text": text, "report_id": snapshots.save(user_id, text)}
+
+# ---- progressive report: each section is sent the moment it is ready ----
+STREAM_PER_TOPIC = 3
+SMART_MODEL = "gpt-4o-mini"
+
+def _topic_titles(topic: str, per: int) -> List[str]:
+    return [a.title for a in _topic_articles(topic, per, False)]
+
+def _unsent_lines(titles: List[str], sent: List[frozenset]) -> List[str]:
+    # a wire story already read out under an earlier topic isn't repeated. Only the
+    # event-loop thread calls this, in the order sections are sent, so the streamed
+    # events and the final script agree on which topic kept a story
+    out = []
+    for title in titles:
+        words = normalize(title)
+        if any(jaccard(words, w) >= THRESHOLD for w in sent):
+            continue
+        sent.append(words)
+        out.append(f"• {title}")
+    return out
+
+def _smart_summary(script: str) -> Dict[str, Any]:
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        return {"text": None, "reason": "no_api_key"}
+    messages = [
+        {"role": "system", "content": "Rewrite into a crisp 60–90 second spoken brief. Keep names, avoid fluff."},
+        {"role": "user", "content": script},
+    ]
+    try:
+        from openai import OpenAI
+        client = OpenAI(api_key=api_key)
+        with limiter.slot(SMART_MODEL, estimate_tokens(messages, 500), REPORT) as lease, stage("llm_rewrite"):
+            resp = client.chat.completions.create(model=SMART_MODEL, messages=messages,
+                                                  temperature=0.2, max_tokens=500)
+            lease.settle(getattr(resp.usage, "total_tokens", None))
+        return {"text": (resp.choices[0].message.content or "").strip() or None}
+    except Overloaded:
+        return {"text": None, "reason": "busy"}
+    except Exception:
+        upstream_error("openai")
+        return {"text": None, "reason": "error"}
+
+async def _morning_events(prefs: Dict[str, Any], smart: bool, per: int, user_id: int) -> AsyncIterator[Dict[str, Any]]:
+    """greeting, then calendar / weather / one event per news topic in finish order, then smart, then done."""
+    t0 = perf_counter()
+    home = prefs.get("home", {}) or {}
+    cal  = prefs.get("calendar", {}) or {}
+    topics = prefs.get("topics", []) or []
+    tz = home.get("tz")
+
+    greeting = _greeting(tz)
+    yield {"type": "greeting", "text": greeting, "topics": topics}   # lets clients lay out news slots up front
+
+    sent: List[frozenset] = []
+    # asyncio.to_thread copies the context, so each section's stages still land on this request
+    jobs = {
+        asyncio.ensure_future(asyncio.to_thread(_calendar_lines, cal, tz, user_id)): ("calendar", None),
+        asyncio.ensure_future(asyncio.to_thread(_weather_line, home)): ("weather", None),
+    }
+    for t in topics:
+        jobs[asyncio.ensure_future(asyncio.to_thread(_topic_titles, t, per))] = ("news", t)
+    done: Dict[tuple, List[str]] = {}
+    try:
+        pending = set(jobs)
+        while pending:
+            finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for fut in finished:
+                kind, topic = jobs[fut]
+                try:
+                    out = fut.result()
+                except Exception:
+                    out = None
+                lines = [out] if isinstance(out, str) else (out or [])
+                if kind == "news":
+                    lines = _unsent_lines(lines, sent)
+                done[(kind, topic)] = lines
+                event = {"type": kind, "lines": lines}
+                if topic is not None:
+                    event["topic"] = topic
+                yield event
+    finally:
+        for fut in jobs:
+            fut.cancel()
+
+    # the full script in the usual order, whatever order the sections arrived in
+    lines = [greeting, *done.get(("calendar", None), []), *done.get(("weather", None), [])]
+    if not topics:
+        lines.append(_topics_line(topics))
+    for t in topics:
+        if done.get(("news", t)):
+            lines += [f"{t}:", *done[("news", t)]]
+    script = "\n".join(lines).strip()
+
+    spoken = script
+    if smart:
+        summary = await asyncio.to_thread(_smart_summary, script)
+        spoken = summary.get("text") or script
+        yield {"type": "smart", **summary}
+    # report_id names what /speak should read: the smart summary when there is one
+    rid = await asyncio.to_thread(snapshots.save, user_id, spoken)
+    yield {"type": "done", "text": script, "report_id": rid, "ms": round((perf_counter() - t0) * 1000)}
+
+def _ndjson(events: AsyncIterator[Dict[str, Any]]):
+    async def gen():
+        async for ev in events:
+            yield json.dumps(ev, ensure_ascii=False) + "\n"
+    return gen()
+
+def _sse(events: AsyncIterator[Dict[str, Any]]):
+    async def gen():
+        async for ev in events:
+            yield f"event: {ev['type']}\ndata: {json.dumps(ev, ensure_ascii=False)}\n\n"
+    return gen()
+
+@router.get("/morning/stream")
+def morning_stream(
+    request: Request,
+    smart: bool = True,
+    per: int = Query(STREAM_PER_TOPIC, ge=1, le=5),
+    format: Optional[str] = Query(None, pattern="^(ndjson|sse)$"),
+    user_id: int = Depends(current_user_id),
+):
+    """
+    The morning report as a stream of typed events, NDJSON by default or
+    Server-Sent Events with ?format=sse / Accept: text/event-stream.
+    """
+    events = _morning_events(_load_prefs(user_id), smart, per, user_id)
+    sse = format == "sse" or (format is None and "text/event-stream" in request.headers.get("accept", ""))
+    headers = {"Cache-Control": "no-store", "X-Accel-Buffering": "no"}   # no proxy buffering
+    if sse:
+        return StreamingResponse(_sse(events), media_type="text/event-stream", headers=headers)
+    return StreamingResponse(_ndjson(events), media_type="application/x-ndjson", headers=headers)
 
 @router.get("/morning/speak")
-def morning_speak(smart: bool = True):
-    prefs = _load_prefs()
-    text = _build_morning_text(prefs)
+def morning_speak(smart: bool = True, report_id: Optional[str] = None, user_id: int = Depends(current_user_id)):
+    if report_id:
+        # speak exactly what the client is showing; no second trip through the pipeline
+        text = snapshots.load(user_id, report_id)
+        if text is None:
+            raise HTTPException(status_code=404, detail="Report not found or expired; fetch /report/morning again.")
+    else:
+        text = _build_morning_text(_load_prefs(user_id), user_id)
 
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise HTTPException(status_code=400, detail="TTS requires OPENAI_API_KEY.")
 
+    segments = split_segments(text)
+    if not segments:
+        raise HTTPException(status_code=400, detail="No report content.")
     try:
-        from openai import OpenAI
+        from openai import OpenAI, RateLimitError
         client = OpenAI(api_key=api_key)
-
-        # current SDK: no format kw; returns WAV bytes
-        speech = client.audio.speech.create(
-            model="gpt-4o-mini-tts",
-            voice="alloy",
-            input=text,
-        )
-        audio_bytes = speech.read()
+        # the first segment is synthesized before the response starts, so its errors get a status code
+        first = synthesize(client, segments[0], TTS_MODEL, TTS_VOICE)
 
     except ImportError:
         raise HTTPException(status_code=500, detail="OpenAI client not installed on server.")
+    except Overloaded:
+        raise
+    except RateLimitError as e:
+        upstream_error("openai")
+        limiter.pause(TTS_MODEL, retry_after_of(e))
+        raise Overloaded(retry_after_of(e), "upstream")
     except Exception as e:
+        upstream_error("openai")
         raise HTTPException(status_code=500, detail=f"TTS error: {e}")
 
     return StreamingResponse(
-        io.BytesIO(audio_bytes),
-        media_type="audio/wav",
+        stream_speech(client, segments, TTS_MODEL, TTS_VOICE, first=first),
+        media_type="audio/mpeg",
         headers={
-            "Content-Disposition": 'inline; filename="morning.wav"',
+            "Content-Disposition": 'inline; filename="morning.mp3"',
             "Cache-Control": "no-store",
         },
     )
-
@@ -0,0 +1,43 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+from typing import List, Optional
+
+from ..db import get_db
+from ..services.search import KINDS, search
+from ..services.users import current_user_id
+from ..utils.metrics import stage
+
+router = APIRouter(tags=["search"])
+
+class SearchHit(BaseModel):
+    type: str
+    id: int
+    text: str
+    snippet: str     # HTML-escaped, matches in <mark>
+    score: float
+
+class SearchPage(BaseModel):
+    q: str
+    results: List[SearchHit]
+    next_cursor: Optional[str] = None
+
+@router.get("/search", response_model=SearchPage)
+def search_all(
+    q: str = Query(..., min_length=1, max_length=200),
+    types: Optional[str] = Query(None, description="comma-separated: " + ",".join(KINDS)),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    user_id: int = Depends(current_user_id),
+):
+    kinds = [t.strip() for t in (types or "").split(",") if t.strip()]
+    unknown = [t for t in kinds if t not in KINDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"unknown types: {unknown}; use {sorted(KINDS)}")
+    try:
+        with stage("fts"):
+            hits, nxt = search(db, user_id, q, kinds or None, limit, cursor)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="bad cursor")
+    return SearchPage(q=q, results=hits, next_cursor=nxt)
@@ -1,18 +1,44 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from typing import List, Optional
 import os
 
+from ..db import get_db
+from ..models import NoteChunk, NoteDoc, StudyItem, StudyReview, StudySession
+from ..schemas import (NoteIn, NoteOut, QuizIn, QuizOut, ReviewIn, StudyItemIn, StudyItemOut,
+                       StudySessionIn, StudySessionOut, StudyStatsOut)
+from ..services.srs import quality_from_accuracy, schedule
+from ..services.prefs import get_store
+from ..services.limiter import INTERACTIVE, Overloaded, estimate_tokens, limiter, retry_after_of
+from ..services.study import delete_note, ingest_note, quiz_from_doc, relevant_chunks
+from ..services.users import current_user_id
+from ..utils.metrics import stage, upstream_error
+
 router = APIRouter(prefix="/study", tags=["study"])
 
+# SQLite caps bound parameters per statement; keep IN (...) lists well under it
+_IN_CHUNK = 500
+
+ASK_MODEL = "gpt-4o-mini"
+
 class AskIn(BaseModel):
     question: str
+    doc_id: Optional[str] = None    # restrict retrieval to one note
+    use_notes: bool = True
 
 @router.post("/ask")
-def ask(payload: AskIn):
+def ask(payload: AskIn, db: Session = Depends(get_db), user_id: int = Depends(current_user_id)):
     q = (payload.question or "").strip()
     if not q:
         raise HTTPException(status_code=400, detail="Question is empty.")
 
+    chunks = relevant_chunks(db, user_id, q, doc_id=payload.doc_id) if payload.use_notes else []
+    sources = [{"doc_id": c.doc_id, "chunk": c.ord + 1} for c in chunks]
+
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         return {
@@ -22,22 +48,162 @@ def ask(payload: AskIn):
                 "• Outline the mechanism or steps.\n"
                 "• Conclude in one sentence.\n"
                 "Set OPENAI_API_KEY to enable AI-generated answers."
-            )
+            ),
+            "sources": sources,
         }
 
+    messages = [{"role": "system", "content": "You are a study helper. Be concise and correct. Prefer bullet points."}]
+    if chunks:
+        # only the few most relevant chunks go to the model, never whole notes
+        context = "\n\n".join(f"[{i + 1}] {c.text}" for i, c in enumerate(chunks))
+        messages.append({"role": "system", "content": "Ground the answer in these excerpts from the student's notes "
+                                                      "and cite them as [n]:\n\n" + context})
+    messages.append({"role": "user", "content": q})
     try:
-        from openai import OpenAI
+        from openai import OpenAI, RateLimitError
         client = OpenAI(api_key=api_key)
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a study helper. Be concise and correct. Prefer bullet points."},
-                {"role": "user", "content": q},
-            ],
-            temperature=0.2,
-            max_tokens=300,
-        )
-        return {"answer": resp.choices[0].message.content}
+        with limiter.slot(ASK_MODEL, estimate_tokens(messages, 300), INTERACTIVE) as lease, stage("llm_answer"):
+            resp = client.chat.completions.create(
+                model=ASK_MODEL,
+                messages=messages,
+                temperature=0.2,
+                max_tokens=300,
+            )
+            lease.settle(getattr(resp.usage, "total_tokens", None))
+        return {"answer": resp.choices[0].message.content, "sources": sources}
+    except Overloaded:
+        raise
+    except RateLimitError as e:
+        upstream_error("openai")
+        limiter.pause(ASK_MODEL, retry_after_of(e))
+        raise Overloaded(retry_after_of(e), "upstream")
     except Exception as e:
+        upstream_error("openai")
         raise HTTPException(status_code=500, detail=f"Study helper error: {e}")
 
+# ---- Notes (chunked + embedded for retrieval) ----
+@router.post("/notes", response_model=NoteOut)
+def add_note(payload: NoteIn, db: Session = Depends(get_db), user_id: int = Depends(current_user_id)):
+    doc = ingest_note(db, user_id, payload.title, payload.text)
+    n = db.query(NoteChunk).filter(NoteChunk.doc_id==doc.id).count()
+    return NoteOut(id=doc.id, title=doc.title, chunks=n)
+
+@router.get("/notes", response_model=List[NoteOut])
+def list_notes(db: Session = Depends(get_db), user_id: int = Depends(current_user_id)):
+    rows = (db.query(NoteDoc, func.count(NoteChunk.id))
+              .outerjoin(NoteChunk, NoteChunk.doc_id==NoteDoc.id)
+              .filter(NoteDoc.user_id==user_id)
+              .group_by(NoteDoc.id)
+              .order_by(NoteDoc.created_at.desc()))
+    return [NoteOut(id=d.id, title=d.title, chunks=n) for d, n in rows]
+
+@router.delete("/notes/{doc_id}")
+def remove_note(doc_id: str, db: Session = Depends(get_db), user_id: int = Depends(current_user_id)):
+    if not delete_note(db, user_id, doc_id):
+        raise HTTPException(status_code=404, detail="note not found")
+    return {"ok": True}
+
+@router.post("/quiz", response_model=QuizOut)
+def quiz(payload: QuizIn, db: Session = Depends(get_db), user_id: int = Depends(current_user_id)):
+    qs = quiz_from_doc(db, user_id, payload.doc_id, payload.focus, payload.difficulty)
+    if qs is None:
+        raise HTTPException(status_code=404, detail="note not found")
+    return QuizOut(questions=qs)
+
+# ---- Spaced repetition (SM-2) ----
+def _quality(r: ReviewIn) -> int:
+    if r.quality is not None:
+        return r.quality
+    if r.accuracy is None:
+        raise HTTPException(status_code=400, detail=f"item {r.item_id}: provide accuracy or quality")
+    return quality_from_accuracy(r.accuracy)
+
+def _load_items(db: Session, user_id: int, ids: List[int]) -> dict:
+    items = {}
+    uniq = list(dict.fromkeys(ids))
+    for i in range(0, len(uniq), _IN_CHUNK):
+        chunk = uniq[i:i + _IN_CHUNK]
+        for it in db.query(StudyItem).filter(StudyItem.user_id==user_id, StudyItem.id.in_(chunk)):
+            items[it.id] = it
+    missing = [i for i in uniq if i not in items]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"unknown study items: {missing[:20]}")
+    return items
+
+@router.post("/items", response_model=StudyItemOut)
+def create_item(payload: StudyItemIn, db: Session = Depends(get_db), user_id: int = Depends(current_user_id)):
+    it = StudyItem(user_id=user_id, topic=payload.topic, source_doc_id=payload.source_doc_id,
+                   difficulty=payload.difficulty, next_due=datetime.utcnow())
+    db.add(it); db.commit(); db.refresh(it)
+    return it
+
+@router.get("/next", response_model=List[StudyItemOut])
+def next_items(
+    n: int = Query(10, ge=1, le=200),
+    ahead: bool = Query(False, description="also return items not yet due"),
+    db: Session = Depends(get_db),
+    user_id: int = Depends(current_user_id),
+):
+    # served straight off ix_study_items_user_due: O(log N + n) regardless of deck size
+    q = db.query(StudyItem).filter(StudyItem.user_id==user_id)
+    if not ahead:
+        q = q.filter(StudyItem.next_due <= datetime.utcnow())
+    return q.order_by(StudyItem.next_due.asc()).limit(n).all()
+
+@router.post("/items/{item_id}/review", response_model=StudyItemOut)
+def review_item(item_id: int, payload: ReviewIn, db: Session = Depends(get_db), user_id: int = Depends(current_user_id)):
+    payload.item_id = item_id
+    it = _load_items(db, user_id, [item_id])[item_id]
+    q = _quality(payload)
+    now = datetime.utcnow()
+    schedule(it, q, now)
+    db.add(StudyReview(user_id=user_id, item_id=it.id, reviewed_at=now, quality=q, accuracy=payload.accuracy))
+    db.commit(); db.refresh(it)
+    return it
+
+@router.post("/sessions", response_model=StudySessionOut)
+def record_session(payload: StudySessionIn, db: Session = Depends(get_db), user_id: int = Depends(current_user_id)):
+    """Record a whole drill session: one StudySession, one review per result, all in one transaction."""
+    if not payload.results:
+        raise HTTPException(status_code=400, detail="results is empty")
+    grades = [(r, _quality(r)) for r in payload.results]
+    items = _load_items(db, user_id, [r.item_id for r in payload.results])
+
+    now = datetime.utcnow()
+    accs = [r.accuracy if r.accuracy is not None else q / 5 for r, q in grades]
+    sess = StudySession(user_id=user_id, started_at=now, duration_min=payload.duration_min,
+                        accuracy=round(sum(accs) / len(accs), 4), notes=payload.notes)
+    db.add(sess); db.flush()
+    reviews = []
+    for r, q in grades:
+        schedule(items[r.item_id], q, now)
+        reviews.append(StudyReview(user_id=user_id, session_id=sess.id, item_id=r.item_id,
+                                   reviewed_at=now, quality=q, accuracy=r.accuracy))
+    db.add_all(reviews)
+    db.commit()
+    return StudySessionOut(
+        id=sess.id,
+        reviewed=len(grades),
+        accuracy=sess.accuracy,
+        items=[StudyItemOut.model_validate(it) for it in items.values()],
+    )
+
+@router.get("/stats", response_model=StudyStatsOut)
+def stats(
+    heatmap_days: int = Query(365, ge=7, le=3 * 366),
+    db: Session = Depends(get_db),
+    user_id: int = Depends(current_user_id),
+):
+    """Streaks, 7/30-day windows, per-topic mastery and a heatmap, in the user's home tz."""
+    from ..services.study_stats import study_stats   # numpy: loaded on first stats call
+    with stage("study_stats"):
+        return study_stats(db.connection(), user_id, _home_tz_name(user_id), heatmap_days)
+
+def _home_tz_name(user_id: int) -> str:
+    # prefs keep whatever tz string was posted; an unknown zone falls back to UTC rather than a 500
+    name = (get_store().get(user_id).get("home") or {}).get("tz")
+    try:
+        ZoneInfo(name)
+    except Exception:
+        return "UTC"
+    return name
@@ -3,11 +3,10 @@ from sqlalchemy.orm import Session
 from ..db import get_db
 from ..models import Task, User
 from ..schemas import TaskIn, TaskOut
+from ..services.users import current_user_id
 
 router = APIRouter()
 
-def current_user_id(): return 1
-
 @router.post("/tasks", response_model=TaskOut)
 def create_task(payload: TaskIn, db: Session = Depends(get_db), user_id: int = Depends(current_user_id)):
     user = db.query(User).filter(User.id==user_id).first()
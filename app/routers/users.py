@@ -0,0 +1,19 @@
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+
+from ..config import settings
+from ..services.users import USER_HEADER, create_user
+
+router = APIRouter(prefix="/users", tags=["users"])
+
+class UserIn(BaseModel):
+    name: Optional[str] = Field(None, max_length=100)
+
+@router.post("")
+def new_user(payload: UserIn):
+    """Create a user to name in X-User-Id. Only with TRUST_USER_HEADER: otherwise every request is the default user."""
+    if not settings.trust_user_header:
+        raise HTTPException(status_code=403, detail=f"{USER_HEADER} is not trusted here (TRUST_USER_HEADER is off)")
+    return {"id": create_user(payload.name)}
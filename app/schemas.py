@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from typing import Optional, List
-from datetime import date
+from datetime import date, datetime
 
 class GoalIn(BaseModel):
     level: str = Field(description="year|month|week|day")
@@ -49,3 +49,90 @@ class QuizQ(BaseModel):
 
 class QuizOut(BaseModel):
     questions: List[QuizQ]
+
+
+class StudyItemIn(BaseModel):
+    topic: str
+    source_doc_id: Optional[str] = None
+    difficulty: str = "mixed"
+
+class StudyItemOut(BaseModel):
+    id: int
+    topic: str
+    difficulty: str
+    ease: float
+    interval_days: float
+    reps: int
+    next_due: datetime
+    class Config: from_attributes = True
+
+class ReviewIn(BaseModel):
+    item_id: int
+    accuracy: Optional[float] = Field(None, ge=0, le=1)
+    quality: Optional[int] = Field(None, ge=0, le=5, description="SM-2 grade; overrides accuracy")
+
+class StudySessionIn(BaseModel):
+    duration_min: int = 5
+    notes: Optional[str] = None
+    results: List[ReviewIn]
+
+class StudySessionOut(BaseModel):
+    id: int
+    reviewed: int
+    accuracy: Optional[float] = None
+    items: List[StudyItemOut]
+
+class StudyWindow(BaseModel):
+    days: int
+    active_days: int
+    sessions: int
+    minutes: int
+    reviews: int
+    accuracy: Optional[float] = None
+
+class StudyStreak(BaseModel):
+    current: int
+    longest: int
+
+class StudyTotals(BaseModel):
+    sessions: int
+    minutes: int
+    reviews: int
+    active_days: int
+
+class TopicMastery(BaseModel):
+    topic: str
+    reviews: int
+    pass_rate: float
+    mean_quality: float
+    mastery: float = Field(description="smoothed share of reviews passed (quality >= 3)")
+    last_reviewed: date
+
+class StudyHeatmap(BaseModel):
+    start: date
+    minutes: List[int] = Field(description="minutes studied per day from start through today")
+    levels: List[int] = Field(description="0..4 intensity per day, by quartile of active days")
+
+class StudyStatsOut(BaseModel):
+    tz: str
+    today: date
+    streak: StudyStreak
+    last_7: StudyWindow
+    last_30: StudyWindow
+    totals: StudyTotals
+    topics: List[TopicMastery]
+    heatmap: StudyHeatmap
+
+class NoteIn(BaseModel):
+    title: str
+    text: str = Field(min_length=1)
+
+class NoteOut(BaseModel):
+    id: str
+    title: str
+    chunks: int
+
+class QuizIn(BaseModel):
+    doc_id: str
+    focus: Optional[str] = Field(None, description="what to quiz on; defaults to the note title")
+    difficulty: str = "mixed"
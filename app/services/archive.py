@@ -0,0 +1,338 @@
+"""
+Streaming export/import of one user's data as NDJSON.
+
+An archive is one JSON object per line:
+
+    {"type": "header", "version": 1, "exported_at": "...", "user_id": 1}
+    {"type": "prefs", "data": {...}}
+    {"type": "goal", "id": 3, "parent_goal_id": 1, "title": ..., ...}
+    {"type": "task", "id": 7, "goal_id": 3, ...}
+    {"type": "note", "id": "9f2c...", "title": ..., "created_at": ..., "chunks": ["...", ...]}
+    ... reminder, study_item, study_session, study_review
+
+Export reads each table in keyset pages of BATCH rows (id > last id),
+each on its own short connection, so memory stays flat however big the
+account is. No read is held open while a page is being sent: without WAL an
+open SQLite read blocks every writer, and a slow client would otherwise
+lock the app for the whole download. The archive is therefore not a single
+snapshot; a row written mid-export may or may not be in it. Tables are
+written parents first, so on import a row's references have usually been
+seen already.
+
+Import is a line parser fed with raw body chunks. Rows are inserted in
+BATCH-sized transactions, one executemany each. Old ids are mapped to the new
+ones for parent_goal_id, goal_id, session_id and item_id. A goal whose
+parent comes later in the file is patched once the whole archive is in.
+References that can't be resolved become NULL. A review whose item is
+missing is skipped. Everything goes to the importing user, whatever
+user_id the archive came from. Study notes carry their chunk texts (from
+note_chunks); on import they go through ingest_note with those chunks, so
+they are re-embedded into the vector index under new doc ids, and study
+items' source_doc_id is remapped to them. Version 1 archives (no notes)
+still import.
+"""
+import json
+import zlib
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import Date, DateTime, Float, Integer, String, bindparam, insert, select, update
+from sqlalchemy.engine import Engine
+
+from ..models import Goal, NoteChunk, NoteDoc, Reminder, StudyItem, StudyReview, StudySession, Task
+from .prefs import get_store
+
+VERSION = 2
+READS = (1, 2)              # archive versions import accepts
+BATCH = 500
+NOTE_BATCH = 50             # notes per export page: their text is much bigger than a row
+MAX_LINE = 1 << 20          # a single record bigger than 1 MiB is not ours
+
+# type -> model, in dependency order (parents before children); notes are written between
+# reminders and study items (NOTES_AFTER), since items point at them
+KINDS = {
+    "goal": Goal,
+    "task": Task,
+    "reminder": Reminder,
+    "study_item": StudyItem,
+    "study_session": StudySession,
+    "study_review": StudyReview,
+}
+# foreign keys to remap: type -> {column: referenced type}
+REFS = {
+    "goal": {"parent_goal_id": "goal"},
+    "task": {"goal_id": "goal"},
+    "study_item": {"source_doc_id": "note"},
+    "study_review": {"session_id": "study_session", "item_id": "study_item"},
+}
+REQUIRED = {"study_review": "item_id"}      # no item, no review
+NOTES_AFTER = "reminder"
+
+class ArchiveError(ValueError):
+    """Malformed archive; `line` is 1-based."""
+
+    def __init__(self, line: int, msg: str):
+        super().__init__(f"line {line}: {msg}")
+        self.line = line
+
+# ---- export ----
+def _jsonable(v: Any) -> Any:
+    if isinstance(v, (date, datetime)):
+        return v.isoformat()
+    raise TypeError(f"{type(v).__name__} is not JSON serializable")
+
+# one encoder for every line; dates are the only non-JSON values in these tables
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_jsonable).encode
+
+def export_lines(engine: Engine, user_id: int) -> Iterator[bytes]:
+    """The archive, one encoded line at a time."""
+    yield _line({"type": "header", "version": VERSION, "exported_at": datetime.utcnow().isoformat(),
+                 "user_id": user_id})
+    yield _line({"type": "prefs", "data": get_store().get(user_id)})
+    for kind, model in KINDS.items():
+        t = model.__table__
+        cols = [c for c in t.columns if c.name != "user_id"]
+        names = [c.name for c in cols]
+        # `user_id + 0` keeps SQLite off the user_id indexes: with one, every page would re-read and
+        # re-sort all the user's rows to find id > last; without, a page is a rowid range scan
+        for page in _pages(engine, t, select(*cols).where(t.c.user_id + 0 == user_id)):
+            yield "".join(_encode({"type": kind, **dict(zip(names, row))}) + "\n" for row in page).encode()
+        if kind == NOTES_AFTER:
+            yield from _export_notes(engine, user_id)
+
+def _export_notes(engine: Engine, user_id: int) -> Iterator[bytes]:
+    d, c = NoteDoc.__table__, NoteChunk.__table__
+    stmt = select(d.c.id, d.c.title, d.c.created_at).where(d.c.user_id == user_id)
+    for page in _pages(engine, d, stmt, NOTE_BATCH):
+        chunks: Dict[str, List[str]] = {row.id: [] for row in page}
+        with engine.connect() as conn:
+            for doc_id, text in conn.execute(select(c.c.doc_id, c.c.text)
+                                             .where(c.c.doc_id.in_(list(chunks))).order_by(c.c.doc_id, c.c.ord)):
+                chunks[doc_id].append(text)
+        yield "".join(_encode({"type": "note", "id": row.id, "title": row.title, "created_at": row.created_at,
+                               "chunks": chunks[row.id]}) + "\n" for row in page).encode()
+
+def _pages(engine: Engine, t, stmt, size: int = BATCH) -> Iterator[list]:
+    # the connection is closed before each page is yielded: the client reads at its own pace
+    stmt = stmt.order_by(t.c.id).limit(size)
+    last = None
+    while True:
+        with engine.connect() as conn:
+            rows = conn.execute(stmt if last is None else stmt.where(t.c.id > last)).all()
+        if rows:
+            yield rows
+        if len(rows) < size:
+            return
+        last = rows[-1].id
+
+def _line(obj: Dict[str, Any]) -> bytes:
+    return (_encode(obj) + "\n").encode()
+
+def gzip_stream(chunks: Iterator[bytes], level: int = 6) -> Iterator[bytes]:
+    z = zlib.compressobj(level, zlib.DEFLATED, 31)     # wbits 31: gzip container
+    for chunk in chunks:
+        out = z.compress(chunk)
+        if out:
+            yield out
+    yield z.flush()
+
+# ---- import ----
+class LineReader:
+    """Bytes in (gzip or plain, detected from the first bytes), parsed JSON records out."""
+
+    def __init__(self):
+        self._z: Optional[Any] = None
+        self._sniffed = False
+        self._buf = b""
+        self.line = 0
+
+    def feed(self, chunk: bytes) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        if not self._sniffed:
+            self._buf += chunk
+            if len(self._buf) < 2:
+                return iter(())
+            self._sniffed = True
+            chunk, self._buf = self._buf, b""
+            if chunk[:2] == b"\x1f\x8b":
+                self._z = zlib.decompressobj(47)     # gzip or zlib, auto-detected
+        if self._z is not None:
+            chunk = self._z.decompress(chunk)
+        self._buf += chunk
+        *lines, self._buf = self._buf.split(b"\n")
+        if len(self._buf) > MAX_LINE:
+            raise ArchiveError(self.line + 1, "line too long")
+        return self._parse(lines)
+
+    def close(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        if not self._sniffed:
+            self._sniffed = True
+        tail = self._buf + (self._z.flush() if self._z is not None else b"")
+        self._buf = b""
+        return self._parse(tail.split(b"\n"))
+
+    def _parse(self, lines: List[bytes]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        # lazy, so the records before a bad line are taken before it raises
+        for raw in lines:
+            self.line += 1
+            if not raw.strip():
+                continue
+            try:
+                rec = json.loads(raw)
+            except ValueError:
+                raise ArchiveError(self.line, "not JSON")
+            if not isinstance(rec, dict) or not isinstance(rec.get("type"), str):
+                raise ArchiveError(self.line, "record without a type")
+            yield self.line, rec
+
+def _default(c) -> Any:
+    d = c.default
+    if d is None:
+        return None
+    return d.arg(None) if d.is_callable else d.arg
+
+_TYPES = {Integer: (int,), Float: (int, float), String: (str,)}     # Text is a String
+
+def _coerce(kind: str, rec: Dict[str, Any], line: int) -> Dict[str, Any]:
+    # every column gets a value (the model default if the record lacks it): executemany
+    # wants the same keys in every row. Anything the table would reject is an ArchiveError
+    # here, before the batch is written.
+    t = KINDS[kind].__table__
+    refs = REFS.get(kind, {})
+    row = {}
+    for c in t.columns:
+        if c.name in ("id", "user_id"):
+            continue
+        v = rec.get(c.name)
+        if v is None:
+            v = _default(c)
+            if v is None and not c.nullable and c.name not in refs:   # unresolved refs are handled in flush
+                raise ArchiveError(line, f"{c.name} is required")
+            row[c.name] = v
+            continue
+        if isinstance(c.type, (DateTime, Date)):
+            try:
+                v = datetime.fromisoformat(v) if isinstance(c.type, DateTime) else date.fromisoformat(v[:10])
+            except (TypeError, ValueError):
+                raise ArchiveError(line, f"bad {c.name}: {v!r}")
+        else:
+            ok = next((types for base, types in _TYPES.items() if isinstance(c.type, base)), None)
+            if ok is not None and (isinstance(v, bool) or not isinstance(v, ok)):
+                raise ArchiveError(line, f"bad {c.name}: {v!r}")
+        row[c.name] = v
+    return row
+
+class Importer:
+    """Feed it (line, record) pairs; it commits a transaction every BATCH rows. Blocking: run off the event loop."""
+
+    def __init__(self, engine: Engine, user_id: int):
+        self.engine = engine
+        self.user_id = user_id
+        self.ids: Dict[str, Dict[Any, Any]] = {k: {} for k in (*KINDS, "note")}
+        self.counts: Dict[str, int] = {k: 0 for k in (*KINDS, "note")}
+        self.skipped = 0
+        self.prefs = False
+        self._pending: List[Tuple[str, int, Dict[str, Any]]] = []   # (kind, old id, row)
+        self._late_parents: List[Tuple[int, int]] = []               # (old goal id, old parent id)
+        self._header = False
+
+    def add(self, line: int, rec: Dict[str, Any]) -> None:
+        kind = rec["type"]
+        if kind == "header":
+            if rec.get("version") not in READS:
+                raise ArchiveError(line, f"unsupported archive version {rec.get('version')!r}")
+            self._header = True
+            return
+        if not self._header:
+            raise ArchiveError(line, "archive must start with a header")
+        if kind == "prefs":
+            self.flush()
+            if isinstance(rec.get("data"), dict):
+                get_store().put(self.user_id, rec["data"])
+                self.prefs = True
+            return
+        if kind == "note":
+            self.flush()
+            self._note(line, rec)
+            return
+        model = KINDS.get(kind)
+        if model is None:
+            raise ArchiveError(line, f"unknown type {kind!r}")
+        if self._pending and self._pending[-1][0] != kind:
+            self.flush()      # one kind per batch; earlier kinds' ids are then known
+        old_id = rec.get("id")
+        if not isinstance(old_id, int):
+            raise ArchiveError(line, "record without an integer id")
+        row = _coerce(kind, rec, line)
+        self._pending.append((kind, old_id, row))
+        if len(self._pending) >= BATCH:
+            self.flush()
+
+    def _note(self, line: int, rec: Dict[str, Any]) -> None:
+        from sqlalchemy.orm import Session
+        from .study import ingest_note
+        title, chunks = rec.get("title"), rec.get("chunks")
+        if not isinstance(rec.get("id"), str) or not isinstance(title, str):
+            raise ArchiveError(line, "note without a string id and title")
+        if not isinstance(chunks, list) or not all(isinstance(t, str) for t in chunks):
+            raise ArchiveError(line, "note chunks must be a list of strings")
+        created = None
+        if rec.get("created_at") is not None:
+            try:
+                created = datetime.fromisoformat(rec["created_at"])
+            except (TypeError, ValueError):
+                raise ArchiveError(line, f"bad created_at: {rec['created_at']!r}")
+        with Session(self.engine) as db:
+            doc = ingest_note(db, self.user_id, title, "", chunks=chunks)
+            if created is not None:
+                db.query(NoteDoc).filter(NoteDoc.id == doc.id).update({"created_at": created})
+                db.commit()
+            self.ids["note"][rec["id"]] = doc.id
+        self.counts["note"] += 1
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        kind = self._pending[0][0]
+        model = KINDS[kind]
+        batch, self._pending = self._pending, []
+        rows, old_ids = [], []
+        for _, old_id, row in batch:
+            for col, ref in REFS.get(kind, {}).items():
+                old = row.get(col)
+                if old is None:
+                    continue
+                new = self.ids[ref].get(old)
+                if new is None and kind == "goal":
+                    self._late_parents.append((old_id, old))   # parent may still be coming
+                row[col] = new
+            if REQUIRED.get(kind) and row.get(REQUIRED[kind]) is None:
+                self.skipped += 1
+                continue
+            row["user_id"] = self.user_id
+            rows.append(row)
+            old_ids.append(old_id)
+        if not rows:
+            return
+        t = model.__table__
+        with self.engine.begin() as conn:
+            # executemany + RETURNING in parameter order degrades to one INSERT per row on
+            # SQLite. Instead the first row takes the write lock and an id; nobody else can
+            # insert until commit, so the rest get the ids that follow, in one executemany.
+            first = conn.execute(insert(t).returning(t.c.id), rows[0]).scalar_one()
+            new_ids = range(first, first + len(rows))
+            if len(rows) > 1:
+                conn.execute(insert(t), [dict(r, id=i) for r, i in zip(rows[1:], new_ids[1:])])
+        self.ids[kind].update(zip(old_ids, new_ids))
+        self.counts[kind] += len(rows)
+
+    def finish(self) -> Dict[str, Any]:
+        self.flush()
+        fix = [{"gid": self.ids["goal"][g], "pid": self.ids["goal"][p]}
+               for g, p in self._late_parents if g in self.ids["goal"] and p in self.ids["goal"]]
+        if fix:
+            t = Goal.__table__
+            stmt = update(t).where(t.c.id == bindparam("gid")).values(parent_goal_id=bindparam("pid"))
+            for i in range(0, len(fix), BATCH):
+                with self.engine.begin() as conn:
+                    conn.execute(stmt, fix[i:i + BATCH])
+        return {"imported": self.counts, "prefs": self.prefs, "skipped": self.skipped}
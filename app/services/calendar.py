@@ -1,9 +1,51 @@
-from typing import Dict, Any, List
-import httpx
-from ics import Calendar
-from datetime import datetime, timezone
+from typing import Dict, Any, Iterable, List, NamedTuple, Optional, Tuple
+import asyncio
+import contextvars
+import heapq
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 
+from .recurrence import expand
+from ..utils import breaker
+from ..utils.metrics import stage, upstream_error
+
+FEED_TIMEOUT = float(os.getenv("ICS_TIMEOUT", "10"))   # per feed, seconds
+MAX_FEEDS = 8
+
+_pool = ThreadPoolExecutor(max_workers=MAX_FEEDS, thread_name_prefix="ics")
+
+class CalEvent(NamedTuple):
+    begin: datetime          # aware; for all-day events, midnight of `day`
+    end: Optional[datetime]
+    all_day: bool
+    uid: Optional[str]
+    title: str
+    location: Optional[str]
+    sequence: int = 0                  # SEQUENCE: bumped by the organizer on each revision
+    modified: Optional[datetime] = None   # LAST-MODIFIED
+
+    @property
+    def day(self) -> date:
+        return self.begin.date()
+
+    @property
+    def key(self):
+        # occurrences of one recurring series share a UID, so the start is part of the identity
+        return (self.uid or self.title, self.begin)
+
+def calendar_urls(cal: Dict[str, Any]) -> List[str]:
+    """All ICS sources in a calendar pref: `ics_urls` list plus any legacy single-URL keys."""
+    cal = cal or {}
+    urls = list(cal.get("ics_urls") or [])
+    for k in ("ics_url", "url", "ics", "calendar_url"):
+        v = cal.get(k)
+        if isinstance(v, str):
+            urls.append(v)
+    return list(dict.fromkeys(u.strip() for u in urls if isinstance(u, str) and u.strip()))
+
 def _today_window(tz_str: str | None):
     try:
         tz = ZoneInfo(tz_str) if tz_str else timezone.utc
@@ -14,27 +56,183 @@ def _today_window(tz_str: str | None):
     end = start.replace(hour=23, minute=59, second=59)
     return start, end, tz
 
-def get_today_events(cal: Dict[str, Any], tz_str: str | None) -> List[str]:
-    url = (cal or {}).get("ics_url") or (cal or {}).get("url")
-    if not url:
+Window = Tuple[datetime, datetime]
+
+def _to_event(ev, begin: datetime, end: Optional[datetime]) -> CalEvent:
+    all_day = bool(getattr(ev, "all_day", False))
+    if all_day:
+        # all-day dates are floating: keep the calendar date, not a UTC instant
+        span = (end - begin) if end else timedelta(days=1)
+        begin = datetime.combine(begin.date(), datetime.min.time(), tzinfo=timezone.utc)
+        end = begin + span
+    return CalEvent(begin, end, all_day, getattr(ev, "uid", None), ev.name or "Untitled",
+                    getattr(ev, "location", None) or None, _sequence(ev), _modified(ev))
+
+def _sequence(ev) -> int:
+    # ics 0.7 leaves SEQUENCE in `extra`
+    for line in getattr(ev, "extra", ()):
+        if line.name == "SEQUENCE":
+            try:
+                return int(line.value)
+            except ValueError:
+                return 0
+    return 0
+
+def _modified(ev) -> Optional[datetime]:
+    lm = getattr(ev, "last_modified", None)
+    return lm.datetime if lm is not None else None
+
+def parse_events(text: str, window: Optional[Window] = None) -> List[CalEvent]:
+    """
+    Parse one ICS body into CalEvents sorted by start (UTC). With a window,
+    recurring events are expanded lazily inside it (see services/recurrence).
+    """
+    from ics import Calendar   # ics + arrow are slow to import; only pay for it when parsing
+    with stage("ics_parse"):
+        c = Calendar(text)
+        if window is not None:
+            occ = expand(c.events, *window)
+        else:
+            occ = [(ev, ev.begin.datetime, ev.end.datetime if getattr(ev, "end", None) else None)
+                   for ev in c.events if ev.begin]
+        out: List[CalEvent] = []
+        for ev, begin, end in occ:
+            try:
+                out.append(_to_event(ev, begin, end))
+            except Exception:
+                continue
+        out.sort(key=lambda e: e.begin)
+        return out
+
+def merge_events(feeds: Iterable[List[CalEvent]]) -> List[CalEvent]:
+    """k-way heap merge of per-feed sorted events, dropping repeats of the same UID (and start)."""
+    seen = set()
+    out: List[CalEvent] = []
+    for ev in heapq.merge(*feeds, key=lambda e: e.begin):
+        if ev.key in seen:
+            continue
+        seen.add(ev.key)
+        out.append(ev)
+    return out
+
+def _ics_key(url: str) -> tuple:
+    return ("ics", url)
+
+def _unpack(blob: Optional[bytes], window: Optional[Window]) -> List[CalEvent]:
+    # last-good bodies are kept compressed: ICS files run to hundreds of KB and shrink ~10x
+    if blob is None:
         return []
     try:
-        r = httpx.get(url, timeout=15)
-        r.raise_for_status()
-        c = Calendar(r.text)
+        return parse_events(zlib.decompress(blob).decode("utf-8", "replace"), window)
     except Exception:
         return []
 
+def _fetch_one(url: str, timeout: float, window: Optional[Window]) -> Tuple[List[CalEvent], Optional[float]]:
+    import httpx
+
+    def download() -> bytes:
+        try:
+            with stage("ics_fetch"):
+                r = httpx.get(url, timeout=timeout)
+                r.raise_for_status()
+        except Exception:
+            upstream_error("ics")
+            raise
+        return zlib.compress(r.content, 1)
+
+    # a host that keeps failing is skipped and its last good copy re-parsed for this window
+    blob, age = breaker.call(url, _ics_key(url), download)
+    return _unpack(blob, window), age
+
+def _oldest(ages: Iterable[Optional[float]]) -> Optional[float]:
+    return max((a for a in ages if a is not None), default=None)
+
+def fetch_events_aged(urls: List[str], timeout: float = FEED_TIMEOUT,
+                      window: Optional[Window] = None) -> Tuple[List[CalEvent], Optional[float]]:
+    """fetch_events, plus the age in seconds of the oldest feed served from the last good copy (None if all fresh)."""
+    if not urls:
+        return [], None
+    # each worker runs in a copy of the caller's context so its stages land on this request
+    futs = [_pool.submit(contextvars.copy_context().run, _fetch_one, u, timeout, window) for u in urls[:MAX_FEEDS]]
+    feeds, ages = [], []
+    for f in futs:
+        try:
+            events, age = f.result(timeout=timeout + 1)
+        except Exception:
+            events, age = [], None
+        feeds.append(events); ages.append(age)
+    return merge_events(feeds), _oldest(ages)
+
+def fetch_events(urls: List[str], timeout: float = FEED_TIMEOUT, window: Optional[Window] = None) -> List[CalEvent]:
+    """Download + parse every feed in parallel; total latency ~ the slowest feed, capped by `timeout`."""
+    return fetch_events_aged(urls, timeout, window)[0]
+
+async def _afetch_one(client: "httpx.AsyncClient", url: str, timeout: float,
+                      window: Optional[Window]) -> Tuple[List[CalEvent], Optional[float]]:
+    async def download() -> bytes:
+        try:
+            with stage("ics_fetch"):
+                r = await asyncio.wait_for(client.get(url), timeout)
+                r.raise_for_status()
+        except Exception:
+            upstream_error("ics")
+            raise
+        return zlib.compress(r.content, 1)
+
+    blob, age = await breaker.acall(url, _ics_key(url), download)
+    # parsing is CPU-bound; keep it off the event loop
+    ctx = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_pool, ctx.run, _unpack, blob, window), age
+
+async def afetch_events_aged(urls: List[str], timeout: float = FEED_TIMEOUT,
+                             window: Optional[Window] = None) -> Tuple[List[CalEvent], Optional[float]]:
+    if not urls:
+        return [], None
+    import httpx
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        got = await asyncio.gather(*(_afetch_one(client, u, timeout, window) for u in urls[:MAX_FEEDS]))
+    return merge_events([events for events, _ in got]), _oldest(age for _, age in got)
+
+async def afetch_events(urls: List[str], timeout: float = FEED_TIMEOUT, window: Optional[Window] = None) -> List[CalEvent]:
+    """Async twin of fetch_events for async routes."""
+    return (await afetch_events_aged(urls, timeout, window))[0]
+
+def get_today_events_aged(cal: Dict[str, Any], tz_str: str | None,
+                          user_id: Optional[int] = None) -> Tuple[List[str], Optional[float]]:
+    """
+    Today's event lines, and the age of the oldest feed that came from the
+    last good copy. With a user_id they are read from the synced event
+    store (services/calendar_store) instead of the feeds themselves.
+    """
+    urls = calendar_urls(cal)
+    if not urls:
+        return [], None
     start, end, tz = _today_window(tz_str)
-    items = []
-    for ev in c.events:
+    window = (start, start + timedelta(days=1))
+    if user_id is not None:
+        from .calendar_store import events_between
+        events, age = events_between(user_id, urls, *window)
+    else:
+        events, age = fetch_events_aged(urls, window=window)
+
+    today = start.date()
+    all_day, items = [], []
+    for ev in events:
         try:
-            # ics uses arrow; get datetimes
-            begin = ev.begin.to("UTC").naive.replace(tzinfo=timezone.utc).astimezone(tz)
+            if ev.all_day:
+                last = ev.end.date() if ev.end else ev.day   # ICS all-day end is exclusive
+                if ev.day <= today < max(last, ev.day + timedelta(days=1)):
+                    all_day.append(f"All day — {ev.title}")
+                continue
+            begin = ev.begin.astimezone(tz)
             if not (start <= begin <= end):
                 continue
-            t = begin.strftime("%-I:%M %p") if hasattr(begin, "strftime") else str(begin)
-            items.append(f"{t} — {ev.name}")
+            t = begin.strftime("%-I:%M %p")
+            items.append(f"{t} — {ev.title}")
         except Exception:
             continue
-    return sorted(items)[:6]
+    # events arrive merged in start order, so no re-sort (string sort put 10 AM before 9 AM)
+    return (all_day + items)[:6], age
+
+def get_today_events(cal: Dict[str, Any], tz_str: str | None, user_id: Optional[int] = None) -> List[str]:
+    return get_today_events_aged(cal, tz_str, user_id)[0]
@@ -0,0 +1,322 @@
+"""
+Persistent calendar: users' ICS feeds synced into the calendar_events table.
+
+A sync downloads a feed (conditionally: ETag / Last-Modified, so an
+unchanged feed costs a 304 and no parsing, until the window has moved
+REPARSE since the last expansion), expands it over the sync
+window [now - PAST, now + AHEAD), and diffs it against the stored rows
+of that feed. An occurrence is identified by (UID, start). It is written
+only if it is new, or if its SEQUENCE or LAST-MODIFIED differs from the
+stored one (for feeds that set neither, its title, end and location).
+Stored occurrences inside the window that the feed no longer has are
+deleted. Rows before the window stay, as history, until KEEP.
+
+Reads (`events_between`) are one indexed range scan on (user_id, start).
+A background job re-syncs every feed each SYNC_INTERVAL. Only a feed that
+was never synced is fetched inline by a read; one not checked for
+FRESH_FOR (twice the interval, so the job's own pace never trips it) is
+served from the table while a background sync is kicked off. While a host
+is down (circuit open or request failing) reads keep serving the table,
+with the age of the last successful sync. The table only covers the sync
+window (`covers`); outside it, deletions and recurrences aren't tracked.
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, bindparam, delete, or_, select, update
+from sqlalchemy.dialects.sqlite import insert
+
+from ..db import engine
+from ..models import CalendarEvent, CalendarFeed
+from ..utils import breaker
+from ..utils.metrics import stage, upstream_error
+from .calendar import FEED_TIMEOUT, MAX_FEEDS, CalEvent, calendar_urls, parse_events
+from .prefs import get_store
+
+log = logging.getLogger(__name__)
+
+SYNC_INTERVAL = float(os.getenv("CALENDAR_SYNC_INTERVAL", "900"))   # seconds between background passes; 0 disables
+FRESH_FOR = 2 * (SYNC_INTERVAL or 900.0)   # a read kicks a background sync of a feed not checked for this long
+PAST = timedelta(days=7)               # sync window: recurrences are expanded and deletions detected inside it
+AHEAD = timedelta(days=60)
+KEEP = timedelta(days=365)             # occurrences that started longer ago than this are pruned
+REPARSE = timedelta(hours=12)          # re-expand an unchanged feed this often, as the window moves
+MAX_SPAN = timedelta(days=35)          # longest event a range read finds when it started before the range
+BATCH = 500
+
+_pool = ThreadPoolExecutor(max_workers=MAX_FEEDS, thread_name_prefix="ics-sync")
+
+_E = CalendarEvent.__table__
+_F = CalendarFeed.__table__
+
+def _naive(dt: datetime) -> datetime:
+    # stored as naive UTC, like every other DateTime column here
+    return dt.astimezone(timezone.utc).replace(tzinfo=None) if dt.tzinfo else dt
+
+def _aware(dt: Optional[datetime]) -> Optional[datetime]:
+    return dt.replace(tzinfo=timezone.utc) if dt is not None else None
+
+_locks: Dict[Tuple[int, str], threading.Lock] = {}
+_locks_lock = threading.Lock()
+
+def _feed_lock(user_id: int, url: str) -> threading.Lock:
+    # the job and an inline read-through may want the same feed at once; one sync per feed at a time
+    with _locks_lock:
+        return _locks.setdefault((user_id, url), threading.Lock())
+
+# ---- sync ----
+def _download(url: str, etag: Optional[str], modified: Optional[str]) -> Tuple[Optional[bytes], Optional[str], Optional[str]]:
+    """(body, ETag, Last-Modified); body None when the server says 304."""
+    import httpx
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if modified:
+        headers["If-Modified-Since"] = modified
+    with stage("ics_fetch"):
+        r = httpx.get(url, headers=headers, timeout=FEED_TIMEOUT)
+        if r.status_code == 304:
+            return None, etag, modified
+        r.raise_for_status()
+    return r.content, r.headers.get("etag"), r.headers.get("last-modified")
+
+def _row(ev: CalEvent) -> Dict:
+    return {
+        "uid": ev.uid or ev.title,
+        "start": _naive(ev.begin),
+        "end": _naive(ev.end) if ev.end else None,
+        "all_day": ev.all_day,
+        "title": ev.title,
+        "location": ev.location,
+        "sequence": ev.sequence,
+        "last_modified": _naive(ev.modified) if ev.modified else None,
+    }
+
+def _changed(old, new: Dict) -> bool:
+    if old.sequence != new["sequence"] or old.last_modified != new["last_modified"]:
+        return True
+    if new["sequence"] or new["last_modified"]:
+        return False          # same revision markers: same event
+    return (old.end, old.all_day, old.title, old.location) != (new["end"], new["all_day"], new["title"], new["location"])
+
+def _apply(conn, user_id: int, url: str, events: List[CalEvent], lo: datetime, hi: datetime) -> Dict[str, int]:
+    """Diff one feed's parsed window against its stored rows; write only the differences."""
+    lo_n, hi_n = _naive(lo), _naive(hi)
+    # events that started before the window but run into it come back from the parse too
+    existing = {
+        (r.uid, r.start): r
+        for r in conn.execute(
+            select(_E.c.id, _E.c.uid, _E.c.start, _E.c.end, _E.c.all_day, _E.c.title, _E.c.location,
+                   _E.c.sequence, _E.c.last_modified)
+            .where(_E.c.user_id == user_id, _E.c.feed == url, _E.c.start >= lo_n - MAX_SPAN, _E.c.start < hi_n))
+    }
+    inserts, updates, unchanged = [], [], 0
+    seen = set()
+    for ev in events:
+        row = _row(ev)
+        key = (row["uid"], row["start"])
+        if key in seen:
+            continue
+        seen.add(key)
+        old = existing.get(key)
+        if old is None:
+            inserts.append({"user_id": user_id, "feed": url, **row})
+        elif _changed(old, row):
+            updates.append({"eid": old.id, **row})
+        else:
+            unchanged += 1
+    gone = [r.id for k, r in existing.items() if k not in seen and r.start >= lo_n]
+
+    if inserts:
+        conn.execute(insert(_E), inserts)
+    if updates:
+        conn.execute(update(_E).where(_E.c.id == bindparam("eid")), updates)
+    for i in range(0, len(gone), BATCH):
+        conn.execute(delete(_E).where(_E.c.id.in_(gone[i:i + BATCH])))
+    conn.execute(delete(_E).where(_E.c.user_id == user_id, _E.c.feed == url,
+                                  _E.c.start < _naive(datetime.now(timezone.utc) - KEEP)))
+    return {"inserted": len(inserts), "updated": len(updates), "deleted": len(gone), "unchanged": unchanged}
+
+def _save_state(conn, user_id: int, url: str, **values) -> None:
+    stmt = insert(_F).values(user_id=user_id, url=url, **values)
+    conn.execute(stmt.on_conflict_do_update(index_elements=[_F.c.user_id, _F.c.url], set_=values))
+
+def sync_feed(user_id: int, url: str) -> Dict:
+    """Bring one feed's rows up to date. Returns what changed, or {"error": ...}."""
+    with _feed_lock(user_id, url):
+        now = datetime.now(timezone.utc)
+        with engine.connect() as conn:
+            state = conn.execute(select(_F.c.etag, _F.c.http_modified, _F.c.parsed_at)
+                                 .where(_F.c.user_id == user_id, _F.c.url == url)).first()
+        # a 304 means the file is the same, but the window has moved since it was last expanded:
+        # go unconditional once the newest expanded day is REPARSE old
+        conditional = state is not None and state.parsed_at is not None \
+            and _naive(now) - state.parsed_at < REPARSE
+        b = breaker.breaker_for(url)
+        if not b.allow():
+            with engine.begin() as conn:
+                _save_state(conn, user_id, url, checked_at=_naive(now), error="circuit open")
+            return {"error": "circuit open"}
+        t0 = time.perf_counter()
+        try:
+            body, etag, modified = _download(url, *(state[:2] if conditional else (None, None)))
+        except Exception as e:
+            b.record(False, time.perf_counter() - t0)
+            upstream_error("ics")
+            with engine.begin() as conn:
+                _save_state(conn, user_id, url, checked_at=_naive(now), error=type(e).__name__)
+            return {"error": type(e).__name__}
+        b.record(True, time.perf_counter() - t0)
+
+        counts: Dict = {"not_modified": body is None}
+        lo, hi = now - PAST, now + AHEAD
+        events = parse_events(body.decode("utf-8", "replace"), (lo, hi)) if body is not None else None
+        state = {"etag": etag, "http_modified": modified, "synced_at": _naive(now), "checked_at": _naive(now),
+                 "error": None}
+        with engine.begin() as conn:
+            if events is not None:
+                with stage("calendar_sync"):
+                    counts.update(_apply(conn, user_id, url, events, lo, hi))
+                state["parsed_at"] = _naive(now)
+            _save_state(conn, user_id, url, **state)
+        return counts
+
+def _sync_feeds(user_id: int, urls: List[str]) -> Dict[str, Dict]:
+    futs = {u: _pool.submit(contextvars.copy_context().run, sync_feed, user_id, u) for u in urls}
+    out = {}
+    for u, f in futs.items():
+        try:
+            out[u] = f.result(timeout=FEED_TIMEOUT + 30)
+        except Exception as e:
+            log.exception("calendar sync failed for user %s", user_id)
+            out[u] = {"error": type(e).__name__}
+    return out
+
+def sync_user(user_id: int, urls: Iterable[str]) -> Dict[str, Dict]:
+    """Sync the user's feeds in parallel and drop rows of feeds they no longer follow."""
+    urls = list(dict.fromkeys(urls))[:MAX_FEEDS]
+    out = _sync_feeds(user_id, urls)
+    with engine.begin() as conn:
+        conn.execute(delete(_E).where(_E.c.user_id == user_id, _E.c.feed.not_in(urls)))
+        conn.execute(delete(_F).where(_F.c.user_id == user_id, _F.c.url.not_in(urls)))
+    return out
+
+def sync_all() -> int:
+    n = 0
+    for user_id, prefs in get_store().iter_all():
+        urls = calendar_urls(prefs.get("calendar"))
+        sync_user(user_id, urls)
+        n += len(urls)
+    return n
+
+def kick(user_id: int, urls: Iterable[str]) -> None:
+    """Sync one user's feeds in the background (after they change their calendar prefs)."""
+    urls = list(urls)
+    threading.Thread(target=sync_user, args=(user_id, urls), name="calendar-kick", daemon=True).start()
+
+_refreshing: set = set()
+_refreshing_lock = threading.Lock()
+
+def _refresh_later(user_id: int, urls: List[str]) -> None:
+    # stale feeds found by reads; at most one queued sync per feed however many reads see it
+    for url in urls:
+        key = (user_id, url)
+        with _refreshing_lock:
+            if key in _refreshing:
+                continue
+            _refreshing.add(key)
+
+        def done(_, key=key):
+            with _refreshing_lock:
+                _refreshing.discard(key)
+
+        _pool.submit(sync_feed, user_id, url).add_done_callback(done)
+
+def covers(start: datetime, end: datetime) -> bool:
+    """Is [start, end) inside the window the table is kept complete for?"""
+    now = datetime.now(timezone.utc)
+    return start >= now - PAST and end <= now + AHEAD
+
+# ---- reads ----
+def _states(user_id: int, urls: List[str]) -> Dict[str, tuple]:
+    with engine.connect() as conn:
+        rows = conn.execute(select(_F.c.url, _F.c.synced_at, _F.c.checked_at, _F.c.error)
+                            .where(_F.c.user_id == user_id, _F.c.url.in_(urls))).all()
+    return {r.url: r for r in rows}
+
+def events_between(user_id: int, urls: Iterable[str], start: datetime,
+                   end: datetime) -> Tuple[List[CalEvent], Optional[float]]:
+    """
+    Stored events overlapping [start, end) from the given feeds, in start
+    order, and the age in seconds of the oldest feed whose last sync
+    failed (None if every feed is current).
+    """
+    urls = list(dict.fromkeys(urls))[:MAX_FEEDS]
+    if not urls:
+        return [], None
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    states = _states(user_id, urls)
+    never = [u for u in urls if u not in states or states[u].checked_at is None]
+    if never:
+        _sync_feeds(user_id, never)     # nothing to serve yet: the first read waits for the download
+        states = _states(user_id, urls)
+    stale = [u for u in urls if u in states and states[u].checked_at is not None
+             and (now - states[u].checked_at).total_seconds() > FRESH_FOR]
+    if stale:
+        _refresh_later(user_id, stale)
+
+    s, e = _naive(start), _naive(end)
+    with stage("calendar_read"), engine.connect() as conn:
+        rows = conn.execute(
+            select(_E.c.uid, _E.c.start, _E.c.end, _E.c.all_day, _E.c.title, _E.c.location,
+                   _E.c.sequence, _E.c.last_modified)
+            .where(_E.c.user_id == user_id, _E.c.feed.in_(urls),
+                   _E.c.start >= s - MAX_SPAN, _E.c.start < e,
+                   or_(_E.c.end > s, and_(_E.c.end.is_(None), _E.c.start >= s)))
+            .order_by(_E.c.start)).all()
+    out, seen = [], set()
+    for r in rows:
+        if (r.uid, r.start) in seen:     # the same event in two of the user's feeds
+            continue
+        seen.add((r.uid, r.start))
+        out.append(CalEvent(_aware(r.start), _aware(r.end), bool(r.all_day), r.uid, r.title, r.location,
+                            r.sequence, _aware(r.last_modified)))
+
+    ages = [(now - st.synced_at).total_seconds() for st in states.values() if st.error and st.synced_at]
+    return out, max(ages, default=None)
+
+# ---- background job ----
+class _SyncJob:
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, interval: float = SYNC_INTERVAL) -> None:
+        if interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    sync_all()
+                except Exception:
+                    log.exception("calendar sync pass failed")
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=loop, name="calendar-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+sync_job = _SyncJob()
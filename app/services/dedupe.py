@@ -0,0 +1,106 @@
+"""
+Near-duplicate headline collapsing (MinHash + LSH banding).
+
+Google News returns the same wire story under several topics ("Padres",
+"San Diego sports"), usually with a different " - Source" suffix or a word
+or two changed. `collapse` groups such headlines and keeps the first one.
+
+Headlines are short, so a single swapped word moves a 64-bit SimHash by
+~10 bits; MinHash over the word set tracks Jaccard similarity directly and
+holds up much better. LSH bands only produce candidates; every candidate
+pair is confirmed with the exact Jaccard of the word sets.
+"""
+import hashlib
+import re
+from functools import lru_cache
+from typing import Callable, Dict, FrozenSet, List, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+NUM_PERM = 24
+ROWS = 3                     # 8 bands of 3 rows: candidate threshold ~0.5 Jaccard
+BANDS = NUM_PERM // ROWS
+THRESHOLD = 0.6              # confirmed duplicates need this word-set Jaccard
+
+_MERSENNE = (1 << 61) - 1
+_PERMS = [
+    (int.from_bytes(hashlib.blake2b(b"a%d" % i, digest_size=8).digest(), "big") % _MERSENNE | 1,
+     int.from_bytes(hashlib.blake2b(b"b%d" % i, digest_size=8).digest(), "big") % _MERSENNE)
+    for i in range(NUM_PERM)
+]
+
+_SOURCE_SUFFIX = re.compile(r"\s+[-–—|]\s+[^-–—|]{2,60}$")
+_WORD = re.compile(r"[a-z0-9]+")
+_STOP = frozenset("a an and the of to in on at for with by from is are as vs".split())
+
+def normalize(title: str) -> FrozenSet[str]:
+    """Lowercased content words with the trailing ' - Publisher' dropped."""
+    t = _SOURCE_SUFFIX.sub("", title or "").lower()
+    return frozenset(w for w in _WORD.findall(t) if w not in _STOP)
+
+@lru_cache(maxsize=65536)
+def _word_sig(word: str) -> Tuple[int, ...]:
+    # headline vocabulary repeats a lot, so permute each word's hash once
+    h = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "big")
+    return tuple((a * h + b) % _MERSENNE for a, b in _PERMS)
+
+def minhash(words: FrozenSet[str]) -> Tuple[int, ...]:
+    if not words:
+        return (0,) * NUM_PERM
+    return tuple(map(min, zip(*map(_word_sig, words))))
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+def _find(parent: List[int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+def clusters(titles: Sequence[str], threshold: float = THRESHOLD) -> List[List[int]]:
+    """
+    Group indexes of near-duplicate titles. Each cluster is sorted, so its
+    first index is the earliest occurrence. Clusters come back in the order
+    of their first member.
+    """
+    n = len(titles)
+    sets = [normalize(t) for t in titles]
+    parent = list(range(n))
+    buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = {}
+    for i, s in enumerate(sets):
+        if not s:
+            continue
+        sig = minhash(s)
+        seen = set()
+        for b in range(BANDS):
+            key = (b, sig[b * ROWS:(b + 1) * ROWS])
+            bucket = buckets.setdefault(key, [])
+            for j in bucket:
+                if j in seen:
+                    continue
+                seen.add(j)
+                if jaccard(s, sets[j]) >= threshold:
+                    ri, rj = _find(parent, i), _find(parent, j)
+                    if ri != rj:
+                        parent[max(ri, rj)] = min(ri, rj)
+            bucket.append(i)
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(n):
+        groups.setdefault(_find(parent, i), []).append(i)
+    return sorted(groups.values(), key=lambda g: g[0])
+
+def collapse(
+    items: Sequence[T],
+    title: Callable[[T], str],
+    threshold: float = THRESHOLD,
+) -> List[Tuple[T, List[T]]]:
+    """Return (representative, all members incl. representative) per cluster."""
+    out = []
+    for g in clusters([title(x) for x in items], threshold):
+        members = [items[i] for i in g]
+        out.append((members[0], members))
+    return out
@@ -0,0 +1,342 @@
+"""
+Process-wide admission control for OpenAI calls.
+
+    with limiter.slot("gpt-4o-mini", tokens=estimate_tokens(messages, 300), priority=INTERACTIVE) as lease:
+        resp = client.chat.completions.create(...)
+        lease.settle(resp.usage.total_tokens)
+
+Each model has two token buckets, requests/minute and tokens/minute, and
+the process has a cap on calls in flight. A caller that can't go at once
+waits in a bounded priority queue: interactive work (/study/ask, quizzes)
+ahead of reports, and reports ahead of background precompute. When the
+wait would be longer than that priority is allowed to wait, or the queue
+is full, the call is shed right away with Overloaded(retry_after) instead
+of tying up a worker thread. The app turns that into 429 + Retry-After.
+
+The queue is one list in priority order, but it is not head-of-line
+blocking: a slot goes to the first waiter whose model's buckets allow it
+now, so a model that is paused or out of budget doesn't hold up the others.
+Within one model, waiters still go in queue order. A full queue makes room
+for a more urgent caller by shedding its least urgent waiter. An upstream
+429 pauses the model for its Retry-After.
+
+Limits, as "model=rpm:tpm" pairs (tpm 0 = unlimited, "*" = any other model):
+    OPENAI_LIMITS="gpt-4o-mini=500:200000,tts-1=50:0"
+"""
+import asyncio
+import bisect
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ..utils import metrics
+
+INTERACTIVE, REPORT, BACKGROUND = 0, 1, 2
+PRIORITY_NAMES = ("interactive", "report", "background")
+
+DEFAULT_LIMITS = {
+    "gpt-4o-mini": (500, 200_000),
+    "gpt-4o-mini-tts": (50, 0),
+    "tts-1": (50, 0),
+    "*": (500, 200_000),
+}
+BURST_SECONDS = 10.0       # bucket capacity: this many seconds of the per-minute rate
+MAX_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", "4"))
+MAX_QUEUE = int(os.getenv("OPENAI_QUEUE", "16"))   # with MAX_CONCURRENCY, bounds threads parked on OpenAI
+MAX_WAIT = {INTERACTIVE: 5.0, REPORT: 10.0, BACKGROUND: 30.0}   # seconds a caller may queue
+
+QUEUE_DEPTH = metrics.Gauge("openai_queue_depth", "Calls waiting for an OpenAI slot.", ("priority",))
+IN_FLIGHT = metrics.Gauge("openai_in_flight", "OpenAI calls in progress.")
+SHED = metrics.Counter("openai_shed_total", "OpenAI calls refused by the limiter.", ("priority", "reason"))
+QUEUE_WAIT = metrics.Histogram("openai_queue_wait_seconds", "Time spent waiting for an OpenAI slot.", ("priority",))
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: float, reason: str = "busy"):
+        super().__init__(f"OpenAI capacity exhausted ({reason}); retry in {math.ceil(retry_after)}s")
+        self.retry_after = max(1.0, retry_after)
+        self.reason = reason
+
+def parse_limits(spec: Optional[str]) -> Dict[str, Tuple[float, float]]:
+    out = dict(DEFAULT_LIMITS)
+    for part in (spec or "").split(","):
+        model, _, rates = part.strip().partition("=")
+        if not model or not rates:
+            continue
+        rpm, _, tpm = rates.partition(":")
+        try:
+            out[model] = (float(rpm), float(tpm or 0))
+        except ValueError:
+            continue
+    return out
+
+def estimate_tokens(messages: Iterable[dict], max_tokens: int = 0) -> int:
+    """~4 characters per token plus per-message overhead, plus the completion budget."""
+    n = 0
+    for m in messages:
+        n += 4 + len(str(m.get("content") or "")) // 4
+    return n + max_tokens
+
+class TokenBucket:
+    def __init__(self, per_minute: float, burst_seconds: float = BURST_SECONDS):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.stamp = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait_for(self, n: float, now: float) -> float:
+        """Seconds until `n` units are available (0 = now)."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        n = min(n, self.capacity)   # a single oversized call still gets through, once the bucket is full
+        return 0.0 if self.level >= n else (n - self.level) / self.rate
+
+    def take(self, n: float) -> None:
+        if self.rate > 0:
+            self.level -= min(n, self.capacity)
+
+    def give(self, n: float) -> None:
+        if self.rate > 0:
+            self.level = min(self.capacity, self.level + n)
+
+class _Model:
+    def __init__(self, rpm: float, tpm: float):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.paused_until = 0.0
+
+    def wait_for(self, tokens: float, now: float) -> float:
+        return max(self.paused_until - now, self.requests.wait_for(1, now), self.tokens.wait_for(tokens, now))
+
+class _Waiter:
+    __slots__ = ("key", "model", "tokens", "priority", "deadline", "shed", "_event", "_loop")
+
+    def __init__(self, key, model, tokens, priority, deadline, loop=None):
+        self.key, self.model, self.tokens, self.priority, self.deadline = key, model, tokens, priority, deadline
+        self.shed: Optional[Overloaded] = None
+        self._loop = loop
+        self._event = asyncio.Event() if loop else threading.Event()
+
+    def wake(self) -> None:
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._event.set)
+        else:
+            self._event.set()
+
+class Lease:
+    def __init__(self, limiter: "Limiter", model: str, tokens: int):
+        self._limiter, self.model, self.tokens = limiter, model, tokens
+
+    def settle(self, actual_tokens: Optional[int]) -> None:
+        """Charge the real usage instead of the estimate (refunds or bills the difference)."""
+        if actual_tokens is None:
+            return
+        self._limiter._adjust(self.model, actual_tokens - self.tokens)
+        self.tokens = actual_tokens
+
+class Limiter:
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, float]]] = None,
+                 concurrency: int = MAX_CONCURRENCY, max_queue: int = MAX_QUEUE,
+                 max_wait: Optional[Dict[int, float]] = None):
+        self.limits = limits or parse_limits(os.getenv("OPENAI_LIMITS"))
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait or MAX_WAIT
+        self._models: Dict[str, _Model] = {}
+        self._queue: List[tuple] = []     # sorted (priority, seq, waiter)
+        self._in_flight = 0
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    # ---- bookkeeping (lock held) ----
+    def _model(self, name: str) -> _Model:
+        m = self._models.get(name)
+        if m is None:
+            m = self._models[name] = _Model(*self.limits.get(name, self.limits["*"]))
+        return m
+
+    def _gauges(self) -> None:
+        if metrics.ENABLED:
+            for p, name in enumerate(PRIORITY_NAMES):
+                QUEUE_DEPTH.set(name, value=sum(1 for k in self._queue if k[0] == p))
+            IN_FLIGHT.set(value=self._in_flight)
+
+    def _shed(self, priority: int, retry_after: float, reason: str) -> Overloaded:
+        if metrics.ENABLED:
+            SHED.inc(PRIORITY_NAMES[priority], reason)
+        return Overloaded(retry_after, reason)
+
+    def _wake_all(self) -> None:
+        # the queue is short (MAX_QUEUE); each waiter re-checks whether it is now the one that can go
+        for *_, w in self._queue:
+            w.wake()
+
+    def _enqueue(self, model: str, tokens: int, priority: int, loop=None) -> _Waiter:
+        now = time.monotonic()
+        limit = self.max_wait.get(priority, MAX_WAIT[BACKGROUND])
+        with self._lock:
+            # the bucket alone says this can't start in time: don't queue it
+            wait = self._model(model).wait_for(tokens, now)
+            if wait > limit:
+                raise self._shed(priority, wait, "rate")
+            if len(self._queue) >= self.max_queue:
+                worst = self._queue[-1]
+                if worst[0] <= priority:
+                    raise self._shed(priority, self._drain_estimate(), "queue_full")
+                # make room: the least urgent waiter goes, the newcomer stays
+                self._queue.pop()
+                worst[2].shed = self._shed(worst[0], self._drain_estimate(), "preempted")
+                worst[2].wake()
+            key = (priority, next(self._seq))
+            w = _Waiter(key, model, tokens, priority, now + limit, loop)
+            bisect.insort(self._queue, (*key, w))
+            self._gauges()
+        return w
+
+    def _drain_estimate(self) -> float:
+        # rough time for what is queued now to clear at the slowest model's request rate
+        rates = [m.requests.rate for m in self._models.values() if m.requests.rate > 0]
+        rate = min(rates) if rates else 1.0
+        return max(1.0, len(self._queue) / rate)
+
+    def _try_grant(self, w: _Waiter) -> Optional[float]:
+        """0 = granted; >0 = seconds until the buckets allow it; None = wait to be woken."""
+        if w.shed:
+            raise w.shed
+        if self._in_flight >= self.concurrency:
+            return None
+        now = time.monotonic()
+        blocked = set()     # models whose first waiter can't go yet; later waiters of theirs wait behind it
+        for i, (*_, x) in enumerate(self._queue):
+            if x.model in blocked:
+                if x is w:
+                    return None
+                continue
+            wait = self._model(x.model).wait_for(x.tokens, now)
+            if x is not w:
+                if wait > 0:
+                    blocked.add(x.model)
+                    continue
+                x.wake()        # an earlier waiter can go right now: it has the slot, not us
+                return None
+            if wait > 0:
+                return wait
+            m = self._model(w.model)
+            m.requests.take(1)
+            m.tokens.take(w.tokens)
+            self._queue.pop(i)
+            self._in_flight += 1
+            self._gauges()
+            self._wake_all()    # spare concurrency may fit another waiter
+            return 0.0
+        return None
+
+    def _remove(self, w: _Waiter) -> None:
+        with self._lock:
+            try:
+                self._queue.remove((*w.key, w))
+            except ValueError:
+                return
+            self._gauges()
+            self._wake_all()
+
+    def _release(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self._gauges()
+            self._wake_all()
+
+    def _adjust(self, model: str, delta: float) -> None:
+        with self._lock:
+            b = self._model(model).tokens
+            b.take(delta) if delta > 0 else b.give(-delta)
+
+    def _timed_out(self, w: _Waiter) -> Overloaded:
+        self._remove(w)
+        with self._lock:
+            return self._shed(w.priority, self._model(w.model).wait_for(w.tokens, time.monotonic())
+                              or self._drain_estimate(), "timeout")
+
+    def _observe(self, w: _Waiter, t0: float) -> None:
+        if metrics.ENABLED:
+            QUEUE_WAIT.observe(PRIORITY_NAMES[w.priority], value=time.monotonic() - t0)
+
+    # ---- public API ----
+    def pause(self, model: str, seconds: float) -> None:
+        """Upstream said 429: hold this model's queue for `seconds`."""
+        with self._lock:
+            m = self._model(model)
+            m.paused_until = max(m.paused_until, time.monotonic() + seconds)
+
+    @contextmanager
+    def slot(self, model: str, tokens: int = 0, priority: int = INTERACTIVE):
+        t0 = time.monotonic()
+        w = self._enqueue(model, tokens, priority)
+        try:
+            while True:
+                with self._lock:
+                    wait = self._try_grant(w)
+                if wait == 0:
+                    break
+                left = w.deadline - time.monotonic()
+                if left <= 0:
+                    raise self._timed_out(w)
+                w._event.wait(min(wait or left, left))
+                w._event.clear()
+        except BaseException:
+            self._remove(w)
+            raise
+        self._observe(w, t0)
+        try:
+            yield Lease(self, model, tokens)
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def aslot(self, model: str, tokens: int = 0, priority: int = INTERACTIVE):
+        t0 = time.monotonic()
+        w = self._enqueue(model, tokens, priority, asyncio.get_running_loop())
+        try:
+            while True:
+                with self._lock:
+                    wait = self._try_grant(w)
+                if wait == 0:
+                    break
+                left = w.deadline - time.monotonic()
+                if left <= 0:
+                    raise self._timed_out(w)
+                try:
+                    await asyncio.wait_for(w._event.wait(), min(wait or left, left))
+                except asyncio.TimeoutError:
+                    pass
+                w._event.clear()
+        except BaseException:
+            self._remove(w)
+            raise
+        self._observe(w, t0)
+        try:
+            yield Lease(self, model, tokens)
+        finally:
+            self._release()
+
+limiter = Limiter()
+
+def http_429(exc: Overloaded):
+    """For routers that raise HTTPException themselves rather than rely on the app's handler."""
+    from fastapi import HTTPException
+    return HTTPException(429, str(exc), headers={"Retry-After": str(math.ceil(exc.retry_after))})
+
+def retry_after_of(exc: Exception, default: float = 5.0) -> float:
+    """Retry-After from an openai.RateLimitError's response, if it carried one."""
+    try:
+        return float(exc.response.headers.get("retry-after") or default)
+    except Exception:
+        return default
@@ -0,0 +1,239 @@
+"""
+Per-user preferences: one document per user,
+
+    {"topics": [...], "home": {...}, "calendar": {...}}
+
+stored in the user_prefs table, or in Redis (one key per user) when
+KV_URL is set. Reads go through a short-TTL in-process cache keyed by
+user and writes invalidate it. `get_many` / `iter_all` load prefs for
+many users in one query (or one MGET) per batch for background jobs.
+
+The old single-user documents (app/data/prefs.json, data/prefs.json, the
+data/prefs_*.json files and the prefs:* Redis keys) are imported once as
+DEFAULT_USER_ID's prefs the first time that user has no document.
+"""
+import copy
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ..config import settings
+from ..db import SessionLocal
+from ..models import UserPrefs
+from .users import DEFAULT_USER_ID
+
+Prefs = Dict[str, Any]
+
+CACHE_TTL = float(os.getenv("PREFS_CACHE_TTL", "30"))   # seconds; bounds staleness across workers
+CACHE_MAX = 10_000
+BATCH = 500    # users per query / MGET; well under SQLite's bound-parameter cap
+
+def empty() -> Prefs:
+    return {"topics": [], "home": {}, "calendar": {}}
+
+def _normalize(d: Optional[dict]) -> Prefs:
+    out = empty()
+    if isinstance(d, dict):
+        out.update({k: v for k, v in d.items() if v is not None})
+    return out
+
+# ---- legacy single-user documents ----
+_APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+_REPO_DIR = os.path.dirname(_APP_DIR)
+
+def _read_json(path: str):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+def _legacy_files() -> Optional[Prefs]:
+    found = False
+    d = empty()
+    app_doc = _read_json(os.path.join(settings.data_dir or os.path.join(_APP_DIR, "data"), "prefs.json"))
+    if isinstance(app_doc, dict):
+        d.update(_normalize(app_doc)); found = True
+    root = os.path.join(_REPO_DIR, "data")
+    root_doc = _read_json(os.path.join(root, "prefs.json"))
+    if isinstance(root_doc, dict) and root_doc.get("topics"):
+        d["topics"] = list(dict.fromkeys([*d["topics"], *root_doc["topics"]])); found = True
+    for name, key in (("prefs_topics.json", "topics"), ("prefs_home.json", "home"), ("prefs_calendar.json", "calendar")):
+        v = _read_json(os.path.join(root, name))
+        if v and not d.get(key):
+            d[key] = v; found = True
+    return d if found else None
+
+class PrefsStore:
+    """Backend-independent part: cache, copies, legacy import, batching."""
+
+    def __init__(self, ttl: float = CACHE_TTL):
+        self.ttl = ttl
+        self._cache: "OrderedDict[int, Tuple[float, Prefs]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # backend hooks
+    def _load_many(self, user_ids: List[int]) -> Dict[int, Prefs]:
+        raise NotImplementedError
+
+    def _save(self, user_id: int, prefs: Prefs) -> None:
+        raise NotImplementedError
+
+    def _user_ids(self) -> List[int]:
+        raise NotImplementedError
+
+    def _legacy(self) -> Optional[Prefs]:
+        return _legacy_files()
+
+    # cache
+    def _cached(self, user_id: int) -> Optional[Prefs]:
+        with self._lock:
+            hit = self._cache.get(user_id)
+            if hit and time.monotonic() - hit[0] < self.ttl:
+                self._cache.move_to_end(user_id)
+                return hit[1]
+        return None
+
+    def _remember(self, user_id: int, prefs: Prefs) -> None:
+        with self._lock:
+            self._cache[user_id] = (time.monotonic(), prefs)
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > CACHE_MAX:
+                self._cache.popitem(last=False)
+
+    def invalidate(self, user_id: Optional[int] = None) -> None:
+        with self._lock:
+            if user_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(user_id, None)
+
+    # public API
+    def get(self, user_id: int) -> Prefs:
+        return self.get_many([user_id])[user_id]
+
+    def get_many(self, user_ids: Iterable[int]) -> Dict[int, Prefs]:
+        """Prefs for every id (empty prefs for unknown users); one backend round trip per BATCH misses."""
+        ids = list(dict.fromkeys(user_ids))
+        out: Dict[int, Prefs] = {}
+        missing = []
+        for uid in ids:
+            hit = self._cached(uid)
+            if hit is None:
+                missing.append(uid)
+            else:
+                out[uid] = hit
+        for i in range(0, len(missing), BATCH):
+            chunk = missing[i:i + BATCH]
+            loaded = self._load_many(chunk)
+            for uid in chunk:
+                d = loaded.get(uid)
+                if d is None and uid == DEFAULT_USER_ID:
+                    d = self._legacy()
+                    if d is not None:
+                        self._save(uid, d)
+                d = _normalize(d)
+                self._remember(uid, d)
+                out[uid] = d
+        # callers edit what they get; never hand out the cached dicts
+        return {uid: copy.deepcopy(out[uid]) for uid in ids}
+
+    def put(self, user_id: int, prefs: Prefs) -> Prefs:
+        d = _normalize(prefs)
+        self._save(user_id, d)
+        self._remember(user_id, d)
+        return copy.deepcopy(d)
+
+    def iter_all(self, batch: int = BATCH) -> Iterator[Tuple[int, Prefs]]:
+        ids = self._user_ids()
+        for i in range(0, len(ids), batch):
+            yield from self.get_many(ids[i:i + batch]).items()
+
+class SqlPrefsStore(PrefsStore):
+    def _load_many(self, user_ids: List[int]) -> Dict[int, Prefs]:
+        with SessionLocal() as db:
+            rows = db.query(UserPrefs.user_id, UserPrefs.data).filter(UserPrefs.user_id.in_(user_ids)).all()
+        out = {}
+        for uid, data in rows:
+            try:
+                out[uid] = json.loads(data or "{}")
+            except ValueError:
+                out[uid] = {}
+        return out
+
+    def _save(self, user_id: int, prefs: Prefs) -> None:
+        with SessionLocal() as db:
+            db.merge(UserPrefs(user_id=user_id, data=json.dumps(prefs), updated_at=datetime.utcnow()))
+            db.commit()
+
+    def _user_ids(self) -> List[int]:
+        with SessionLocal() as db:
+            return [uid for (uid,) in db.query(UserPrefs.user_id).order_by(UserPrefs.user_id)]
+
+class RedisPrefsStore(PrefsStore):
+    KEY = "prefs:user:{}"
+    USERS = "prefs:users"
+
+    def __init__(self, client, ttl: float = CACHE_TTL):
+        super().__init__(ttl)
+        self.r = client
+
+    def _load_many(self, user_ids: List[int]) -> Dict[int, Prefs]:
+        raw = self.r.mget([self.KEY.format(u) for u in user_ids])
+        out = {}
+        for uid, v in zip(user_ids, raw):
+            if v:
+                try:
+                    out[uid] = json.loads(v)
+                except ValueError:
+                    out[uid] = {}
+        return out
+
+    def _save(self, user_id: int, prefs: Prefs) -> None:
+        pipe = self.r.pipeline()
+        pipe.set(self.KEY.format(user_id), json.dumps(prefs))
+        pipe.sadd(self.USERS, user_id)
+        pipe.execute()
+
+    def _user_ids(self) -> List[int]:
+        return sorted(int(u) for u in self.r.sscan_iter(self.USERS, count=1000))
+
+    def _legacy(self) -> Optional[Prefs]:
+        # the old global keys written by routers/prefs.py
+        vals = self.r.mget(["prefs:topics", "prefs:home", "prefs:calendar"])
+        if any(vals):
+            d = empty()
+            for key, v in zip(("topics", "home", "calendar"), vals):
+                if v:
+                    d[key] = json.loads(v)
+            return d
+        return _legacy_files()
+
+_store: Optional[PrefsStore] = None
+_store_lock = threading.Lock()
+
+def get_store() -> PrefsStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store: Optional[PrefsStore] = None
+                if settings.kv_url:
+                    try:
+                        import redis
+                        store = RedisPrefsStore(redis.from_url(settings.kv_url, decode_responses=True))
+                    except Exception:
+                        store = None
+                _store = store or SqlPrefsStore()
+    return _store
+
+def saved_topics() -> List[str]:
+    """Every topic any user follows, for the news ingest job."""
+    topics: Dict[str, None] = {}
+    for _, p in get_store().iter_all():
+        topics.update(dict.fromkeys(t for t in p.get("topics", []) if t))
+    return list(topics)
@@ -0,0 +1,184 @@
+"""
+Window-limited expansion of recurring ICS events.
+
+ics 0.7.2 parses RRULE/EXDATE/RDATE/RECURRENCE-ID but leaves them in
+`event.extra` and never expands them, so a weekly class shows up once (on
+its first date) or not at all. `expand` walks each rule lazily with
+dateutil's `xafter` and stops at the end of the requested window, so a
+multi-year rule costs nothing outside the days being asked about.
+
+Rules are expanded in the event's local wall time (naive) and the zone is
+attached afterwards, so a 09:00 class stays at 09:00 across DST changes.
+"""
+from collections import OrderedDict
+from datetime import datetime, time, timedelta, timezone, tzinfo
+from itertools import takewhile
+from typing import Dict, Iterable, List, Optional, Tuple
+import re
+import threading
+
+from dateutil.rrule import rrulestr
+
+from ..utils.metrics import cache_event
+
+Occurrence = Tuple[object, datetime, Optional[datetime]]   # (ics Event, begin, end)
+
+CACHE_SIZE = 2048
+_cache: "OrderedDict[tuple, List[Tuple[datetime, Optional[datetime]]]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _props(ev, name: str) -> list:
+    return [x for x in getattr(ev, "extra", ()) if x.name == name]
+
+def _zone(ev) -> tzinfo:
+    tz = ev.begin.datetime.tzinfo if ev.begin else None
+    return tz or timezone.utc
+
+def _parse_value(value: str, params: Dict[str, list], zone: tzinfo) -> datetime:
+    """One DATE or DATE-TIME value as naive wall time in `zone`."""
+    v = value.strip()
+    if len(v) == 8 or (params.get("VALUE") or [""])[0] == "DATE":
+        return datetime.combine(datetime.strptime(v[:8], "%Y%m%d").date(), time(0))
+    dt = datetime.strptime(v.rstrip("Z"), "%Y%m%dT%H%M%S")
+    if v.endswith("Z"):
+        return dt.replace(tzinfo=timezone.utc).astimezone(zone).replace(tzinfo=None)
+    tzid = (params.get("TZID") or [None])[0]
+    if tzid:
+        try:
+            from zoneinfo import ZoneInfo
+            return dt.replace(tzinfo=ZoneInfo(tzid)).astimezone(zone).replace(tzinfo=None)
+        except Exception:
+            pass
+    return dt
+
+def _values(ev, name: str, zone: tzinfo) -> List[datetime]:
+    out = []
+    for line in _props(ev, name):
+        for v in line.value.split(","):
+            try:
+                out.append(_parse_value(v, line.params, zone))
+            except ValueError:
+                continue
+    return out
+
+_UNTIL = re.compile(r"UNTIL=([0-9TZ]+)", re.I)
+
+def _local_rule(rule: str, zone: tzinfo, all_day: bool) -> str:
+    # dateutil insists UNTIL matches DTSTART's awareness; we expand naive, so make UNTIL naive local
+    def fix(m):
+        u = _parse_value(m.group(1), {}, zone)
+        if len(m.group(1)) == 8 and not all_day:
+            u = u + timedelta(days=1) - timedelta(seconds=1)
+        return f"UNTIL={u:%Y%m%dT%H%M%S}"
+    return _UNTIL.sub(fix, rule)
+
+_PERIOD_DAYS = {"DAILY": 1, "WEEKLY": 7}
+
+def _fast_forward(rule: str, first: datetime, lo: datetime) -> datetime:
+    """
+    Move DTSTART forward by whole periods so iteration starts near the
+    window instead of years back. Only for DAILY/WEEKLY rules without COUNT
+    (COUNT is relative to the original start); the BYDAY pattern is
+    unchanged by whole-week shifts.
+    """
+    parts = dict(p.split("=", 1) for p in rule.upper().split(";") if "=" in p)
+    days = _PERIOD_DAYS.get(parts.get("FREQ", ""))
+    if not days or "COUNT" in parts or "BYSETPOS" in parts or lo <= first:
+        return first
+    step = days * max(1, int(parts.get("INTERVAL", "1") or 1))
+    skip = ((lo - first).days // step - 1) * step
+    return first + timedelta(days=skip) if skip > 0 else first
+
+def is_recurring(ev) -> bool:
+    return bool(_props(ev, "RRULE") or _props(ev, "RDATE"))
+
+def recurrence_id(ev) -> Optional[datetime]:
+    """RECURRENCE-ID of an override instance, as an aware datetime in the event's zone."""
+    lines = _props(ev, "RECURRENCE-ID")
+    if not lines:
+        return None
+    zone = _zone(ev)
+    try:
+        return _parse_value(lines[0].value, lines[0].params, zone).replace(tzinfo=zone)
+    except ValueError:
+        return None
+
+def _fingerprint(ev) -> tuple:
+    return (str(ev.begin), str(getattr(ev, "end", None)),
+            tuple(str(x) for x in getattr(ev, "extra", ()) if x.name in ("RRULE", "RDATE", "EXDATE")))
+
+def _expand_master(ev, start: datetime, end: datetime) -> List[Tuple[datetime, Optional[datetime]]]:
+    zone = _zone(ev)
+    all_day = bool(getattr(ev, "all_day", False))
+    first = ev.begin.datetime.astimezone(zone).replace(tzinfo=None)
+    if all_day:
+        first = datetime.combine(ev.begin.date(), time(0))
+    dur = (ev.end.datetime - ev.begin.datetime) if getattr(ev, "end", None) else timedelta(0)
+
+    ws = start.astimezone(zone).replace(tzinfo=None)
+    we = end.astimezone(zone).replace(tzinfo=None)
+    lo = ws - dur if dur > timedelta(0) else ws   # occurrences that started earlier but still overlap
+
+    exdates = set(_values(ev, "EXDATE", zone))
+    starts: List[datetime] = []
+    for line in _props(ev, "RRULE"):
+        try:
+            rule = rrulestr(_local_rule(line.value, zone, all_day), dtstart=_fast_forward(line.value, first, lo))
+        except (ValueError, TypeError):
+            continue
+        # xafter is a generator: nothing past the window end is ever produced
+        starts.extend(takewhile(lambda d: d < we, rule.xafter(lo, inc=True)))
+    starts.extend(d for d in _values(ev, "RDATE", zone) if lo <= d < we)
+    if not _props(ev, "RRULE") and lo <= first < we:
+        starts.append(first)  # RDATE-only series still include DTSTART
+
+    out = []
+    for s in sorted(set(starts)):
+        if s in exdates:
+            continue
+        b = s.replace(tzinfo=zone)
+        e = b + dur
+        if (e > start if dur else b >= start) and b < end:
+            out.append((b, e if dur else None))
+    return out
+
+def expand(events: Iterable, start: datetime, end: datetime) -> List[Occurrence]:
+    """
+    Occurrences of `events` overlapping [start, end): one-off events as-is,
+    recurring masters expanded (EXDATE removed, RDATE added), and instances
+    replaced by their RECURRENCE-ID overrides. Results per (UID, window)
+    are cached, keyed also on the rule text so edited series re-expand.
+    """
+    masters, overrides, singles = [], {}, []
+    for ev in events:
+        rid = recurrence_id(ev)
+        if rid is not None:
+            overrides.setdefault(ev.uid, []).append((rid, ev))
+        elif is_recurring(ev):
+            masters.append(ev)
+        else:
+            singles.append(ev)
+
+    out: List[Occurrence] = []
+    for ev in masters:
+        key = (ev.uid, _fingerprint(ev), start, end)
+        with _cache_lock:
+            occ = _cache.get(key)
+            if occ is not None:
+                _cache.move_to_end(key)
+        cache_event("rrule_expand", occ is not None)
+        if occ is None:
+            occ = _expand_master(ev, start, end)
+            with _cache_lock:
+                _cache[key] = occ
+                while len(_cache) > CACHE_SIZE:
+                    _cache.popitem(last=False)
+        moved = {rid for rid, _ in overrides.get(ev.uid, ())}
+        out.extend((ev, b, e) for b, e in occ if b not in moved)
+
+    for ev in singles + [ov for group in overrides.values() for _, ov in group]:
+        b = ev.begin.datetime
+        e = ev.end.datetime if getattr(ev, "end", None) else None
+        if b < end and (e > start if e and e > b else b >= start):
+            out.append((ev, b, e))
+    return out
@@ -0,0 +1,135 @@
+"""
+Full-text search over tasks, goals, reminders and study-session notes.
+
+One FTS5 table, `search_fts`, holds a row per searchable record:
+
+    rowid = source id * 4 + kind code    (so a trigger can find its row by rowid)
+    body  = the searchable text
+    owner = "u<user_id>"                 (indexed, so the user filter is part of the MATCH)
+    kind  = task | goal | reminder | study_session
+
+Triggers on the source tables keep it in sync. They fire for ORM writes
+and for bulk query().delete()/update() alike, so nothing in the app has to
+remember to reindex. The index is created and backfilled the first time
+the app starts against a database that doesn't have it.
+
+Queries are plain terms ANDed together, the last one as a prefix, ranked
+by BM25. Pages are keyed by (score, rowid) rather than OFFSET, so page 50
+costs the same as page 1.
+"""
+import base64
+import html
+import json
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+# kind -> (code, table, text column)
+KINDS: Dict[str, Tuple[int, str, str]] = {
+    "task": (0, "tasks", "title"),
+    "goal": (1, "goals", "title"),
+    "reminder": (2, "reminders", "text"),
+    "study_session": (3, "study_sessions", "notes"),
+}
+_BY_CODE = {code: kind for kind, (code, _, _) in KINDS.items()}
+_STRIDE = 4
+
+SNIPPET_TOKENS = 12
+_HL_OPEN, _HL_CLOSE = "\x02", "\x03"   # placeholders, swapped for <mark> after escaping
+
+def _triggers(kind: str) -> List[str]:
+    code, table, col = KINDS[kind]
+    row = f"new.id * {_STRIDE} + {code}"
+    insert = (f"INSERT INTO search_fts(rowid, body, owner, kind) "
+              f"SELECT {row}, new.{col}, 'u' || new.user_id, '{kind}' WHERE new.{col} IS NOT NULL AND new.{col} != '';")
+    delete = f"DELETE FROM search_fts WHERE rowid = old.id * {_STRIDE} + {code};"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {table}_search_ai AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_search_ad AFTER DELETE ON {table} BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_search_au AFTER UPDATE OF {col}, user_id ON {table} "
+        f"BEGIN {delete} {insert} END",
+    ]
+
+def _backfill(kind: str) -> str:
+    code, table, col = KINDS[kind]
+    return (f"INSERT INTO search_fts(rowid, body, owner, kind) "
+            f"SELECT id * {_STRIDE} + {code}, {col}, 'u' || user_id, '{kind}' FROM {table} "
+            f"WHERE {col} IS NOT NULL AND {col} != ''")
+
+def ensure_index(engine: Engine) -> None:
+    """Create search_fts and its triggers if missing; backfill from existing rows on first creation."""
+    with engine.begin() as conn:
+        exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type='table' AND name='search_fts'")).first()
+        if not exists:
+            conn.execute(text("CREATE VIRTUAL TABLE search_fts USING fts5("
+                              "body, owner, kind, prefix='2 3', tokenize='unicode61 remove_diacritics 2')"))
+            for kind in KINDS:
+                conn.execute(text(_backfill(kind)))
+        for kind in KINDS:
+            for ddl in _triggers(kind):
+                conn.execute(text(ddl))
+
+def rebuild(engine: Engine) -> None:
+    """Drop and refill the index from the source tables."""
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM search_fts"))
+        for kind in KINDS:
+            conn.execute(text(_backfill(kind)))
+        conn.execute(text("INSERT INTO search_fts(search_fts) VALUES ('optimize')"))
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+def match_expr(q: str, user_id: int, kinds: Optional[Sequence[str]] = None) -> Optional[str]:
+    # user input is only ever plain terms (AND), the last one a prefix; no FTS syntax leaks through
+    terms = _TERM.findall(q or "")
+    if not terms:
+        return None
+    words = " ".join([f'"{t}"' for t in terms[:-1]] + [f'"{terms[-1]}"*'])
+    expr = f'owner : "u{int(user_id)}" AND body : ({words})'
+    if kinds:
+        expr += " AND kind : (" + " OR ".join(f'"{k}"' for k in kinds) + ")"
+    return expr
+
+def encode_cursor(score: float, rowid: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([score, rowid]).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    score, rowid = json.loads(raw)
+    return float(score), int(rowid)
+
+def _highlight(snippet: str) -> str:
+    return html.escape(snippet).replace(_HL_OPEN, "<mark>").replace(_HL_CLOSE, "</mark>")
+
+def search(conn, user_id: int, q: str, kinds: Optional[Sequence[str]] = None,
+           limit: int = 20, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """
+    One page of hits, best first, and the cursor for the next page (None at
+    the end). Snippets are HTML-escaped with matches wrapped in <mark>.
+    """
+    expr = match_expr(q, user_id, kinds)
+    if not expr:
+        return [], None
+    sql = [
+        "SELECT rowid, kind, body, bm25(search_fts, 1.0, 0.0, 0.0) AS score,",
+        f"snippet(search_fts, 0, '{_HL_OPEN}', '{_HL_CLOSE}', '…', {SNIPPET_TOKENS}) AS snip",
+        "FROM search_fts WHERE search_fts MATCH :expr",
+    ]
+    args = {"expr": expr, "limit": limit + 1}
+    if cursor:
+        args["score"], args["rowid"] = decode_cursor(cursor)
+        sql.append("AND (bm25(search_fts, 1.0, 0.0, 0.0) > :score"
+                   " OR (bm25(search_fts, 1.0, 0.0, 0.0) = :score AND rowid > :rowid))")
+    sql.append("ORDER BY score, rowid LIMIT :limit")
+    rows = conn.execute(text(" ".join(sql)), args).fetchall()
+    hits = [{
+        "type": r.kind,
+        "id": r.rowid // _STRIDE,
+        "text": r.body,
+        "snippet": _highlight(r.snip),
+        "score": -r.score,     # bm25() is lower-is-better; report higher-is-better
+    } for r in rows[:limit]]
+    nxt = encode_cursor(rows[limit - 1].score, rows[limit - 1].rowid) if len(rows) > limit else None
+    return hits, nxt
@@ -0,0 +1,93 @@
+"""
+Immutable morning-report snapshots.
+
+Every report that /report/morning (or the stream) builds is saved under an
+id derived from (user, text), and the id goes back with the text. The UI
+then asks /report/morning/speak?report_id=... for audio of exactly that
+text, instead of running prefs, ICS, weather and RSS a second time (and
+maybe getting a different report).
+
+The id is a hash of the content, not a random token: rebuilding an
+unchanged report gives the same id, so the response body (and its ETag)
+is stable and saving it again is a no-op. Snapshots expire after
+SNAPSHOT_TTL; a small recent set is also kept in memory so a speak right
+after a build doesn't hit the database.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from ..db import SessionLocal
+from ..models import ReportSnapshot
+
+SNAPSHOT_TTL = timedelta(hours=float(os.getenv("REPORT_SNAPSHOT_TTL_HOURS", "48")))
+RECENT_MAX = 1_000
+PRUNE_EVERY = 500        # saves between expiry sweeps
+
+_recent: "OrderedDict[str, Tuple[int, str, datetime]]" = OrderedDict()   # id -> (user, text, saved at)
+_lock = threading.Lock()
+_saves = 0
+
+def snapshot_id(user_id: int, text: str) -> str:
+    return hashlib.blake2b(f"{user_id}\0{text}".encode(), digest_size=12).hexdigest()
+
+def _remember(rid: str, user_id: int, text: str, at: datetime) -> None:
+    with _lock:
+        _recent[rid] = (user_id, text, at)
+        _recent.move_to_end(rid)
+        while len(_recent) > RECENT_MAX:
+            _recent.popitem(last=False)
+
+def save(user_id: int, text: str) -> str:
+    global _saves
+    rid = snapshot_id(user_id, text)
+    now = datetime.utcnow()
+    with _lock:
+        hit = _recent.get(rid)
+    if hit is not None and now - hit[2] < SNAPSHOT_TTL / 2:
+        return rid
+    with SessionLocal() as db:
+        snap = db.get(ReportSnapshot, rid)
+        if snap is None:
+            db.add(ReportSnapshot(id=rid, user_id=user_id, text=text, created_at=now))
+        else:
+            snap.created_at = now   # the same report built again: restart its clock
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()   # same report saved concurrently
+    _remember(rid, user_id, text, now)
+    with _lock:
+        _saves += 1
+        sweep = _saves % PRUNE_EVERY == 0
+    if sweep:
+        prune()
+    return rid
+
+def load(user_id: int, rid: str) -> Optional[str]:
+    """The snapshot's text, or None if unknown, expired or someone else's."""
+    cutoff = datetime.utcnow() - SNAPSHOT_TTL
+    with _lock:
+        hit = _recent.get(rid)
+    if hit is not None and hit[2] >= cutoff:
+        return hit[1] if hit[0] == user_id else None
+    with SessionLocal() as db:
+        snap = db.get(ReportSnapshot, rid)
+        if snap is None or snap.user_id != user_id or snap.created_at < cutoff:
+            return None
+        text, at = snap.text, snap.created_at
+    _remember(rid, user_id, text, at)
+    return text
+
+def prune() -> int:
+    with SessionLocal() as db:
+        n = (db.query(ReportSnapshot)
+               .filter(ReportSnapshot.created_at < datetime.utcnow() - SNAPSHOT_TTL)
+               .delete(synchronize_session=False))
+        db.commit()
+    return n
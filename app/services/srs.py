@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+# SM-2 constants (SuperMemo 2, as used by Anki and friends)
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+PASS_QUALITY = 3
+
+def quality_from_accuracy(accuracy: float) -> int:
+    """Map a 0..1 accuracy score onto the SM-2 0..5 grade scale."""
+    a = min(1.0, max(0.0, float(accuracy)))
+    return int(round(a * 5))
+
+def schedule(item, quality: int, now: Optional[datetime] = None) -> None:
+    """
+    Apply one SM-2 review to `item` in place (ease, interval_days, reps,
+    lapses, next_due, last_reviewed_at). `quality` is 0..5; below 3 is a lapse.
+    """
+    now = now or datetime.utcnow()
+    q = max(0, min(5, int(quality)))
+    ease = item.ease or DEFAULT_EASE
+    reps = item.reps or 0
+    interval = item.interval_days or 0.0
+
+    if q < PASS_QUALITY:
+        reps = 0
+        interval = 1.0
+        item.lapses = (item.lapses or 0) + 1
+    else:
+        reps += 1
+        if reps == 1:
+            interval = 1.0
+        elif reps == 2:
+            interval = 6.0
+        else:
+            interval = round(interval * ease, 2)
+
+    ease += 0.1 - (5 - q) * (0.08 + (5 - q) * 0.02)
+    item.ease = max(MIN_EASE, round(ease, 3))
+    item.reps = reps
+    item.interval_days = interval
+    item.last_reviewed_at = now
+    item.next_due = now + timedelta(days=interval)
@@ -1,15 +1,32 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
+from sqlalchemy.orm import Session
 from ..config import settings
+from ..models import NoteChunk, NoteDoc
+from .limiter import INTERACTIVE, estimate_tokens, limiter
 from datetime import datetime
-try:
-    from openai import OpenAI
-    _client = OpenAI(api_key=settings.openai_api_key) if settings.openai_api_key else None
-except Exception:
-    _client = None
+import threading
+import uuid
+
+# the OpenAI SDK takes ~0.3s to import; build the client on first use, not at import
+_client = None
+_client_lock = threading.Lock()
+
+def _get_client():
+    global _client
+    if _client is None and settings.openai_api_key:
+        with _client_lock:
+            if _client is None:
+                try:
+                    from openai import OpenAI
+                    _client = OpenAI(api_key=settings.openai_api_key)
+                except Exception:
+                    return None
+    return _client
 
 def generate_quiz_from_notes(notes: str, difficulty: str = "mixed") -> List[Dict]:
+    client = _get_client()
     # If no OpenAI key, return a safe, static quiz
-    if not _client:
+    if not client:
         return [
             {"question":"Name the process that converts glucose to ATP in the cytoplasm.",
              "answer":"Glycolysis", "explanation":"First step of cellular respiration.", "page_ref":None},
@@ -24,15 +41,83 @@ def generate_quiz_from_notes(notes: str, difficulty: str = "mixed") -> List[Dict
     Notes:
     {notes}
     """
-    resp = _client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role":"system","content":"You are a helpful study assistant. Keep questions factual."},
-                  {"role":"user","content":prompt}],
-        temperature=0.2,
-    )
+    messages = [{"role":"system","content":"You are a helpful study assistant. Keep questions factual."},
+                {"role":"user","content":prompt}]
+    with limiter.slot("gpt-4o-mini", estimate_tokens(messages, 1000), INTERACTIVE) as lease:
+        resp = client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=messages,
+            temperature=0.2,
+        )
+        lease.settle(getattr(resp.usage, "total_tokens", None))
     import json
     try:
         data = json.loads(resp.choices[0].message.content)
         return data
     except Exception:
         return [{"question":"What is photosynthesis?","answer":"Process converting light energy to chemical energy in plants."}]
+
+# ---- note storage + retrieval ----
+RETRIEVE_K = 4
+MIN_SCORE = 0.08   # hashed-vector cosine below this is noise, not topical overlap
+
+def ingest_note(db: Session, user_id: int, title: str, text: str,
+                chunks: Optional[List[str]] = None) -> NoteDoc:
+    """
+    Store a note, chunk it, and add the chunk embeddings to the vector index.
+    `chunks` skips the chunking (an imported note keeps the chunks it was exported with).
+    """
+    from .vectors import chunk_text, embed, get_index   # numpy: loaded on first notes call
+    doc = NoteDoc(id=uuid.uuid4().hex, user_id=user_id, title=title)
+    chunks = [NoteChunk(doc_id=doc.id, user_id=user_id, ord=i, text=t)
+              for i, t in enumerate(chunk_text(text) if chunks is None else chunks)]
+    db.add(doc); db.add_all(chunks); db.flush()
+    ids = [c.id for c in chunks]
+    vecs = embed([f"{title}\n{c.text}" for c in chunks])
+    db.commit()
+    # vectors only for committed ids: SQLite reuses the rowids of a rolled-back insert
+    try:
+        get_index().add(ids, user_id, vecs)
+    except Exception:
+        db.query(NoteChunk).filter(NoteChunk.id.in_(ids)).delete(synchronize_session=False)
+        db.query(NoteDoc).filter(NoteDoc.id==doc.id).delete(synchronize_session=False)
+        db.commit()
+        raise
+    return doc
+
+def delete_note(db: Session, user_id: int, doc_id: str) -> bool:
+    doc = db.query(NoteDoc).filter(NoteDoc.id==doc_id, NoteDoc.user_id==user_id).first()
+    if not doc:
+        return False
+    ids = [cid for (cid,) in db.query(NoteChunk.id).filter(NoteChunk.doc_id==doc_id)]
+    db.query(NoteChunk).filter(NoteChunk.doc_id==doc_id).delete(synchronize_session=False)
+    db.delete(doc); db.commit()
+    from .vectors import get_index
+    get_index().delete(ids)   # after the commit: a rolled-back delete keeps its vectors
+    return True
+
+def relevant_chunks(db: Session, user_id: int, query: str, k: int = RETRIEVE_K,
+                    doc_id: Optional[str] = None) -> List[NoteChunk]:
+    """Top-k note chunks for `query` (optionally within one document), best first."""
+    from .vectors import embed, get_index
+    allow = None
+    if doc_id:
+        allow = [cid for (cid,) in db.query(NoteChunk.id).filter(NoteChunk.doc_id==doc_id, NoteChunk.user_id==user_id)]
+        if not allow:
+            return []
+    hits = get_index().search(embed([query]), owner=user_id, k=k, allow=allow)[0]
+    hits = [(cid, score) for cid, score in hits if score >= MIN_SCORE]
+    if not hits:
+        return []
+    rows = {c.id: c for c in db.query(NoteChunk).filter(NoteChunk.id.in_([cid for cid, _ in hits]))}
+    return [rows[cid] for cid, _ in hits if cid in rows]
+
+def quiz_from_doc(db: Session, user_id: int, doc_id: str, focus: Optional[str] = None,
+                  difficulty: str = "mixed") -> Optional[List[Dict]]:
+    """Quiz over the chunks of one note most relevant to `focus` rather than the whole note."""
+    doc = db.query(NoteDoc).filter(NoteDoc.id==doc_id, NoteDoc.user_id==user_id).first()
+    if not doc:
+        return None
+    chunks = relevant_chunks(db, user_id, focus or doc.title, k=RETRIEVE_K, doc_id=doc_id)
+    notes = "\n\n".join(f"[chunk {c.ord + 1}] {c.text}" for c in sorted(chunks, key=lambda c: c.ord))
+    return generate_quiz_from_notes(notes, difficulty)
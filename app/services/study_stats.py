@@ -0,0 +1,255 @@
+"""
+Study analytics: streaks, rolling accuracy/minutes, per-topic mastery, heatmap.
+
+Rows are never looped over in Python. Each user's sessions and reviews are
+folded into per-day columns (NumPy arrays indexed by local day ordinal)
+and per-topic columns, and every statistic is an array operation over
+those. The columns are cached per (user, tz) together with the highest
+session/review id already folded in, so a request only fetches rows newer
+than the cache: one indexed range query per table, skipped when max(id)
+hasn't moved. If the cached count plus the new rows doesn't match the
+table's count, rows were deleted and the user's cache is rebuilt.
+
+Days are local to the user's home tz. The UTC offset is looked up per
+distinct day in the data, and per row only on DST-switch days, so
+sessions near a switch still land on the right day.
+"""
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from sqlalchemy import text
+
+PASS_QUALITY = 3          # SM-2: a review graded 3+ was recalled
+CACHE_MAX = 1_000         # users with cached aggregates
+_EPOCH_ORD = date(1970, 1, 1).toordinal()
+
+_SESSIONS_SQL = text(
+    "SELECT id, CAST(strftime('%s', started_at) AS INTEGER), duration_min, accuracy "
+    "FROM study_sessions WHERE user_id = :u AND id > :after ORDER BY id")
+_REVIEWS_SQL = text(
+    "SELECT r.id, CAST(strftime('%s', r.reviewed_at) AS INTEGER), r.quality, i.topic "
+    "FROM study_reviews r JOIN study_items i ON i.id = r.item_id "
+    "WHERE r.user_id = :u AND r.id > :after ORDER BY r.id")
+_COUNTS_SQL = text(
+    "SELECT (SELECT count(*) FROM study_sessions WHERE user_id = :u), "
+    "(SELECT coalesce(max(id), 0) FROM study_sessions WHERE user_id = :u), "
+    "(SELECT count(*) FROM study_reviews WHERE user_id = :u), "
+    "(SELECT coalesce(max(id), 0) FROM study_reviews WHERE user_id = :u)")
+
+def _offsets(seconds: np.ndarray, tz: ZoneInfo) -> np.ndarray:
+    return np.array([datetime.fromtimestamp(int(t), tz).utcoffset().total_seconds() for t in seconds], dtype=np.int64)
+
+def _local_days(epoch: np.ndarray, tz: ZoneInfo) -> np.ndarray:
+    """UTC epoch seconds -> local date ordinals."""
+    if not len(epoch):
+        return np.zeros(0, dtype=np.int64)
+    # one tz lookup per distinct UTC day (at both ends of it); only rows on a
+    # day whose offset changes (DST switch) are looked up individually
+    udays, inv = np.unique(epoch // 86400, return_inverse=True)
+    inv = inv.ravel()
+    first, last = _offsets(udays * 86400, tz), _offsets(udays * 86400 + 86399, tz)
+    off = first[inv]
+    switch = np.flatnonzero((first != last)[inv])
+    if len(switch):
+        off[switch] = _offsets(epoch[switch], tz)
+    return (epoch + off) // 86400 + _EPOCH_ORD
+
+def _fold(keys: np.ndarray, new_keys: np.ndarray, cols: Dict[str, np.ndarray],
+          new_cols: Dict[str, np.ndarray]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """Group-by-sum of (old aggregate rows + new raw rows) on key."""
+    allk = np.concatenate([keys, new_keys])
+    uk, inv = np.unique(allk, return_inverse=True)
+    inv = inv.ravel()
+    out = {}
+    for name, old in cols.items():
+        out[name] = np.bincount(inv, weights=np.concatenate([old, new_cols[name]]), minlength=len(uk))
+    return uk, out
+
+class _Aggregates:
+    """Per-day and per-topic sums for one user, and how far they are folded."""
+
+    DAY_COLS = ("minutes", "sessions", "acc_sum", "acc_n", "reviews")
+    TOPIC_COLS = ("reviews", "passed", "quality_sum", "last_day")
+
+    def __init__(self):
+        self.sessions_through = 0
+        self.reviews_through = 0
+        self.n_sessions = 0
+        self.n_reviews = 0
+        self.days = np.zeros(0, dtype=np.int64)
+        self.day = {c: np.zeros(0) for c in self.DAY_COLS}
+        self.topics = np.zeros(0, dtype=object)
+        self.topic = {c: np.zeros(0) for c in self.TOPIC_COLS}
+        self.lock = threading.Lock()
+
+    def add_sessions(self, rows: List[tuple], tz: ZoneInfo) -> None:
+        if not rows:
+            return
+        cols = list(zip(*rows))                     # transpose in C; numpy never sees a Row object
+        a = np.array(cols[:3], dtype=np.int64).T
+        keep = a[:, 0] > self.sessions_through      # a concurrent request may have folded some already
+        if not keep.any():
+            return
+        acc = np.array(cols[3], dtype=float)[keep]  # NULL accuracy -> nan
+        a = a[keep]
+        has_acc = ~np.isnan(acc)
+        self.days, self.day = _fold(self.days, _local_days(a[:, 1], tz), self.day, {
+            "minutes": a[:, 2].astype(float),
+            "sessions": np.ones(len(a)),
+            "acc_sum": np.where(has_acc, acc, 0.0),
+            "acc_n": has_acc.astype(float),
+            "reviews": np.zeros(len(a)),
+        })
+        self.sessions_through = int(a[-1, 0])
+        self.n_sessions += len(a)
+
+    def add_reviews(self, rows: List[tuple], tz: ZoneInfo) -> None:
+        if not rows:
+            return
+        cols = list(zip(*rows))
+        a = np.array(cols[:3], dtype=np.int64).T
+        keep = a[:, 0] > self.reviews_through
+        if not keep.any():
+            return
+        topics = np.array(cols[3], dtype=object)[keep]
+        a = a[keep]
+        days = _local_days(a[:, 1], tz)
+        n = len(a)
+        self.days, self.day = _fold(self.days, days, self.day, {
+            "minutes": np.zeros(n), "sessions": np.zeros(n), "acc_sum": np.zeros(n), "acc_n": np.zeros(n),
+            "reviews": np.ones(n),
+        })
+        old_topics, old_last = self.topics, self.topic["last_day"]
+        self.topics, self.topic = _fold(self.topics, topics, {c: self.topic[c] for c in self.TOPIC_COLS[:3]}, {
+            "reviews": np.ones(n),
+            "passed": (a[:, 2] >= PASS_QUALITY).astype(float),
+            "quality_sum": a[:, 2].astype(float),
+        })
+        # last_day is a max, not a sum; both key sets are subsets of the sorted union
+        last = np.zeros(len(self.topics))
+        np.maximum.at(last, np.searchsorted(self.topics, old_topics), old_last)
+        np.maximum.at(last, np.searchsorted(self.topics, topics), days.astype(float))
+        self.topic["last_day"] = last
+        self.reviews_through = int(a[-1, 0])
+        self.n_reviews += n
+
+_cache: "OrderedDict[Tuple[int, str], _Aggregates]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _catch_up(conn, agg: _Aggregates, user_id: int, tz: ZoneInfo) -> bool:
+    """Fold in rows newer than the cache. False if rows were deleted, i.e. the cache can't be patched."""
+    n_sessions, max_session, n_reviews, max_review = conn.execute(_COUNTS_SQL, {"u": user_id}).one()
+    sessions = conn.execute(_SESSIONS_SQL, {"u": user_id, "after": agg.sessions_through}).all() \
+        if max_session > agg.sessions_through else []
+    reviews = conn.execute(_REVIEWS_SQL, {"u": user_id, "after": agg.reviews_through}).all() \
+        if max_review > agg.reviews_through else []
+    if agg.n_sessions + len(sessions) != n_sessions or agg.n_reviews + len(reviews) != n_reviews:
+        return False
+    agg.add_sessions(sessions, tz)
+    agg.add_reviews(reviews, tz)
+    return True
+
+def _aggregates(conn, user_id: int, tz_name: str) -> _Aggregates:
+    key = (user_id, tz_name)
+    with _cache_lock:
+        agg = _cache.get(key)
+        if agg is not None:
+            _cache.move_to_end(key)
+    tz = ZoneInfo(tz_name)
+    if agg is not None:
+        with agg.lock:
+            if not _catch_up(conn, agg, user_id, tz):
+                agg = None
+    if agg is None:
+        agg = _Aggregates()     # first sight, or rows were deleted: rebuild
+        with agg.lock:
+            _catch_up(conn, agg, user_id, tz)
+    with _cache_lock:
+        _cache[key] = agg
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_MAX:
+            _cache.popitem(last=False)
+    return agg
+
+def _streaks(active: np.ndarray, today: int) -> Tuple[int, int]:
+    """(current, longest) runs of consecutive active days; today not studied yet doesn't break the current one."""
+    if not len(active):
+        return 0, 0
+    breaks = np.flatnonzero(np.diff(active) != 1)
+    starts = np.concatenate([[0], breaks + 1])
+    ends = np.concatenate([breaks, [len(active) - 1]])
+    runs = ends - starts + 1
+    current = int(runs[-1]) if active[-1] >= today - 1 else 0
+    return current, int(runs.max())
+
+def _window(days: np.ndarray, day: Dict[str, np.ndarray], today: int, n: int) -> Dict[str, Any]:
+    m = (days > today - n) & (days <= today)     # rows dated after today aren't in any window
+    acc_n = day["acc_n"][m].sum()
+    return {
+        "days": n,
+        "active_days": int(np.count_nonzero(day["sessions"][m] + day["reviews"][m])),
+        "sessions": int(day["sessions"][m].sum()),
+        "minutes": int(day["minutes"][m].sum()),
+        "reviews": int(day["reviews"][m].sum()),
+        "accuracy": round(float(day["acc_sum"][m].sum() / acc_n), 4) if acc_n else None,
+    }
+
+def _heatmap(days: np.ndarray, minutes: np.ndarray, active: np.ndarray, today: int, n: int) -> Dict[str, Any]:
+    start = today - n + 1
+    m = (days >= start) & (days <= today)
+    grid = np.zeros(n)
+    grid[days[m] - start] = minutes[m]
+    # levels 1..4 by quartile of the non-zero days, 0 for none; studied with no minutes logged is level 1
+    level = np.zeros(n, dtype=np.int64)
+    on = np.zeros(n, dtype=bool)
+    on[days[m & active] - start] = True
+    nz = grid[grid > 0]
+    if len(nz):
+        cuts = np.quantile(nz, [0.25, 0.5, 0.75])
+        level[grid > 0] = 1 + np.searchsorted(cuts, grid[grid > 0], side="right")
+    level[on & (level == 0)] = 1
+    return {"start": date.fromordinal(int(start)).isoformat(), "minutes": grid.astype(int).tolist(),
+            "levels": level.tolist()}
+
+def study_stats(conn, user_id: int, tz_name: Optional[str] = None, heatmap_days: int = 365) -> Dict[str, Any]:
+    tz_name = tz_name or "UTC"
+    agg = _aggregates(conn, user_id, tz_name)
+    with agg.lock:
+        days, day = agg.days, dict(agg.day)
+        topics, topic = agg.topics, dict(agg.topic)
+    today = datetime.now(timezone.utc).astimezone(ZoneInfo(tz_name)).date().toordinal()
+
+    active_mask = (day["sessions"] + day["reviews"]) > 0
+    current, longest = _streaks(days[active_mask & (days <= today)], today)
+
+    mastery: List[Dict[str, Any]] = []
+    if len(topics):
+        reviews = topic["reviews"]
+        # Laplace-smoothed pass rate: two passes out of two isn't "100% mastered"
+        score = (topic["passed"] + 1) / (reviews + 2)
+        order = np.argsort(-score, kind="stable")
+        for i in order.tolist():
+            mastery.append({
+                "topic": topics[i],
+                "reviews": int(reviews[i]),
+                "pass_rate": round(float(topic["passed"][i] / reviews[i]), 4),
+                "mean_quality": round(float(topic["quality_sum"][i] / reviews[i]), 2),
+                "mastery": round(float(score[i]), 4),
+                "last_reviewed": date.fromordinal(int(topic["last_day"][i])).isoformat(),
+            })
+
+    return {
+        "tz": tz_name,
+        "today": date.fromordinal(today).isoformat(),
+        "streak": {"current": current, "longest": longest},
+        "last_7": _window(days, day, today, 7),
+        "last_30": _window(days, day, today, 30),
+        "totals": {"sessions": int(day["sessions"].sum()), "minutes": int(day["minutes"].sum()),
+                   "reviews": int(day["reviews"].sum()), "active_days": int(active_mask.sum())},
+        "topics": mastery,
+        "heatmap": _heatmap(days, day["minutes"], active_mask, today, heatmap_days),
+    }
@@ -0,0 +1,160 @@
+"""
+Text-to-speech in sentence-sized segments.
+
+One speech.create call for the whole brief means silence until the last
+word is synthesized and downloaded. Instead the script is split at
+sentence boundaries, segments are synthesized PARALLEL at a time, and the
+audio is yielded in script order as soon as each next segment is ready.
+MP3 frames concatenate cleanly, so the client just sees one audio stream.
+
+Segments are cached by a hash of (model, voice, format, text): the greeting
+and the sign-off are the same every day and are never synthesized twice.
+The first and last sentences are always segments of their own so their
+text (and cache key) stays stable; the rest are packed up to MAX_CHARS to
+keep the request count, and the TTS requests/minute budget, in check.
+"""
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterator, List, Optional
+
+from .limiter import REPORT, limiter
+from ..utils.metrics import cache_event, stage, upstream_error
+
+PARALLEL = int(os.getenv("TTS_PARALLEL", "3"))      # segments in flight per request
+MAX_CHARS = 300
+AUDIO_FORMAT = "mp3"
+CACHE_BYTES = int(os.getenv("TTS_CACHE_MB", "64")) * 1024 * 1024
+
+_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="tts")
+
+# a sentence ends at . ! ? (optionally inside a closing quote/bracket) before whitespace, or at a line break;
+# "3.5" has no whitespace after the dot, and a dot after an abbreviation ("U.S.", "e.g.", "Dr.") doesn't split
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|(?<=[.!?][\"'”’)\]])\s+")
+# two or more dotted letters (U.S, e.g, p.m); a lone letter is too often a real word ("vitamin C.")
+_INITIALS = re.compile(r"(?:[A-Za-z]\.)+[A-Za-z]")
+_ABBREVIATIONS = {"dr", "mr", "mrs", "ms", "st", "jr", "sr", "prof", "vs", "mt"}
+
+def _abbreviation(head: str) -> bool:
+    """Does `head` end with an abbreviation's dot rather than a full stop?"""
+    if not head.endswith("."):
+        return False
+    word = head.rsplit(None, 1)[-1].lstrip("(\"'“‘")[:-1]
+    return word.lower() in _ABBREVIATIONS or bool(_INITIALS.fullmatch(word))
+
+def sentences(text: str) -> List[str]:
+    out = []
+    for line in (text or "").splitlines():
+        start = 0
+        for m in _SENTENCE_END.finditer(line):
+            if _abbreviation(line[start:m.start()]):
+                continue
+            out.append(line[start:m.start()])
+            start = m.end()
+        out.append(line[start:])
+    return [s.strip() for s in out if s.strip()]
+
+def split_segments(text: str, max_chars: int = MAX_CHARS) -> List[str]:
+    parts = sentences(text)
+    if len(parts) <= 2:
+        return parts
+    first, middle, last = parts[0], parts[1:-1], parts[-1]
+    packed: List[str] = []
+    cur = ""
+    for s in middle:
+        if cur and len(cur) + 1 + len(s) > max_chars:
+            packed.append(cur)
+            cur = s
+        else:
+            cur = f"{cur}\n{s}" if cur else s   # newline: TTS pauses there, like between report lines
+    if cur:
+        packed.append(cur)
+    return [first, *packed, last]
+
+class SegmentCache:
+    """LRU of synthesized audio, bounded by total bytes."""
+
+    def __init__(self, max_bytes: int = CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, voice: str, fmt: str, text: str) -> str:
+        return hashlib.blake2b(f"{model}\0{voice}\0{fmt}\0{text}".encode(), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            audio = self._items.get(key)
+            if audio is not None:
+                self._items.move_to_end(key)
+            return audio
+
+    def put(self, key: str, audio: bytes) -> None:
+        if len(audio) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._items[key] = audio
+            self._size += len(audio)
+            while self._size > self.max_bytes:
+                _, dropped = self._items.popitem(last=False)
+                self._size -= len(dropped)
+
+segment_cache = SegmentCache()
+
+def synthesize(client, text: str, model: str, voice: str, fmt: str = AUDIO_FORMAT,
+               priority: int = REPORT) -> bytes:
+    """One segment, from the cache or from OpenAI (through the limiter)."""
+    key = SegmentCache.key(model, voice, fmt, text)
+    audio = segment_cache.get(key)
+    cache_event("tts_segment", audio is not None)
+    if audio is not None:
+        return audio
+    with limiter.slot(model, len(text) // 4, priority), stage("tts"):
+        audio = client.audio.speech.create(model=model, voice=voice, input=text, response_format=fmt).read()
+    segment_cache.put(key, audio)
+    return audio
+
+def stream_speech(client, segments: List[str], model: str, voice: str, fmt: str = AUDIO_FORMAT,
+                  parallel: int = PARALLEL, first: Optional[bytes] = None,
+                  on_error: Optional[Callable[[Exception], None]] = None) -> Iterator[bytes]:
+    """
+    Audio for `segments`, in order, with up to `parallel` syntheses running
+    ahead of the one being sent. `first` is segment 0 if the caller already
+    synthesized it (to turn an upstream error into a proper status code).
+    A failure after streaming has started ends the audio early.
+    """
+    futs: List[Optional[Future]] = [None] * len(segments)
+    start = 1 if first is not None else 0
+
+    def submit(i: int) -> None:
+        if i < len(segments) and futs[i] is None:
+            futs[i] = _pool.submit(synthesize, client, segments[i], model, voice, fmt)
+
+    for i in range(start, start + parallel):
+        submit(i)
+    try:
+        if first is not None:
+            yield first
+        for i in range(start, len(segments)):
+            try:
+                audio = futs[i].result()
+            except Exception as e:
+                upstream_error("openai")
+                if on_error:
+                    on_error(e)
+                return
+            submit(i + parallel)
+            yield audio
+    finally:
+        # client went away (or a segment failed): don't pay for audio nobody will hear
+        for f in futs:
+            if f is not None:
+                f.cancel()
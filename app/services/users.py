@@ -0,0 +1,99 @@
+"""
+Request user resolution.
+
+There is no login yet. Every request is DEFAULT_USER_ID unless
+TRUST_USER_HEADER is set, in which case a caller may name an existing user
+with the X-User-Id header (a trusted proxy or test harness, not the open
+internet). Resolving a user never creates one: ids come from POST /users
+(create_user). Ids that exist are remembered per process, so resolving the
+user costs no database query after the first time.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import Header, HTTPException
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..db import SessionLocal
+from ..models import User
+
+USER_HEADER = "X-User-Id"
+DEFAULT_USER_ID = int(os.getenv("DEFAULT_USER_ID", "1"))
+KNOWN_MAX = 100_000
+
+_known: "OrderedDict[int, None]" = OrderedDict()
+_known_lock = threading.Lock()
+
+def _remember(user_id: int) -> None:
+    with _known_lock:
+        _known[user_id] = None
+        while len(_known) > KNOWN_MAX:
+            _known.popitem(last=False)
+
+def _is_known(user_id: int) -> bool:
+    with _known_lock:
+        if user_id in _known:
+            _known.move_to_end(user_id)
+            return True
+    return False
+
+def ensure_user(user_id: int, db: Optional[Session] = None) -> None:
+    """Create the users row if it is missing. Only for DEFAULT_USER_ID and explicit creation."""
+    if _is_known(user_id):
+        return
+    own = db is None
+    db = db or SessionLocal()
+    try:
+        if not db.query(User.id).filter(User.id==user_id).first():
+            db.add(User(id=user_id, name="Demo" if user_id == DEFAULT_USER_ID else None))
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()   # a concurrent request created it first
+    finally:
+        if own:
+            db.close()
+    _remember(user_id)
+
+def create_user(name: Optional[str] = None) -> int:
+    """A new user with the next free id."""
+    ensure_user(DEFAULT_USER_ID)     # the default id must never be handed out to someone else
+    with SessionLocal() as db:
+        u = User(name=name)
+        db.add(u)
+        db.commit()
+        uid = u.id
+    _remember(uid)
+    return uid
+
+def user_exists(user_id: int) -> bool:
+    if _is_known(user_id):
+        return True
+    with SessionLocal() as db:
+        found = db.query(User.id).filter(User.id==user_id).first() is not None
+    if found:
+        _remember(user_id)    # only hits are cached: probing ids can't fill the cache
+    return found
+
+def forget_user(user_id: int) -> None:
+    with _known_lock:
+        _known.pop(user_id, None)
+
+def current_user_id(x_user_id: Optional[str] = Header(None, alias=USER_HEADER)) -> int:
+    """FastAPI dependency: the requesting user's id. Never creates a user other than the default."""
+    if not settings.trust_user_header or x_user_id is None or not x_user_id.strip():
+        ensure_user(DEFAULT_USER_ID)
+        return DEFAULT_USER_ID
+    try:
+        uid = int(x_user_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{USER_HEADER} must be an integer")
+    if uid <= 0:
+        raise HTTPException(status_code=400, detail=f"{USER_HEADER} must be positive")
+    if not user_exists(uid):
+        raise HTTPException(status_code=401, detail="unknown user")
+    return uid
@@ -0,0 +1,272 @@
+"""
+Offline embeddings + a memory-mapped vector index for study notes.
+
+Embeddings come from a signed feature-hashing vectorizer (word unigrams and
+bigrams, sublinear tf, L2-normalised), so there is no model download and no
+network. Vectors live in a float32 np.memmap of shape (capacity, DIM); row
+ownership and chunk ids live in two small sidecar memmaps. Deleted rows are
+tombstoned (id -1) and reused by later adds, and the file grows by doubling.
+
+Several uvicorn workers share one index directory. Every add/delete/search
+holds an flock on `index.lock` (exclusive for writes, shared for reads) and
+first catches up with the other processes: a writer bumps the generation
+number in `meta.i64`, and a process that sees a newer one remaps the files
+if they grew and rebuilds its row map from `ids`.
+"""
+import hashlib
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:      # Windows: no flock, so one process per index directory
+    fcntl = None
+
+DIM = 512
+INIT_CAPACITY = 1024
+BLOCK_ROWS = 65536           # rows scored per matmul; bounds temp memory on big indexes
+CHUNK_WORDS = 120
+CHUNK_OVERLAP = 30
+
+INDEX_DIR = os.getenv(
+    "NOTES_INDEX_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "notes_index")),
+)
+
+_WORD = re.compile(r"[A-Za-z0-9]+")
+_STOP = frozenset(
+    "a an and are as at be by does did do for from has have how in is it its of on or that the this "
+    "to was were what when where which who why will with".split()
+)
+
+# ---- chunking + embedding ----
+def chunk_text(text: str, size: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """Paragraph-aware word windows of ~`size` words with `overlap` words of carry-over."""
+    paras = [p.split() for p in re.split(r"\n\s*\n", text or "") if p.strip()]
+    chunks: List[str] = []
+    cur: List[str] = []
+    for words in paras:
+        if cur and len(cur) + len(words) > size:
+            chunks.append(" ".join(cur))
+            cur = cur[-overlap:] if overlap else []
+        cur.extend(words)
+        while len(cur) > size:
+            chunks.append(" ".join(cur[:size]))
+            cur = cur[size - overlap:]
+    if cur and (not chunks or len(cur) > overlap):
+        chunks.append(" ".join(cur))
+    return chunks
+
+def _bucket(feature: str) -> Tuple[int, float]:
+    h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+    return h % DIM, (1.0 if (h >> 63) & 1 else -1.0)
+
+def embed(texts: Sequence[str]) -> np.ndarray:
+    """(len(texts), DIM) float32, rows L2-normalised (all-zero for empty text)."""
+    out = np.zeros((len(texts), DIM), dtype=np.float32)
+    for i, t in enumerate(texts):
+        words = [w for w in (w.lower() for w in _WORD.findall(t or "")) if w not in _STOP]
+        counts: dict = {}
+        for f in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            counts[f] = counts.get(f, 0) + 1
+        row = out[i]
+        for f, c in counts.items():
+            j, sign = _bucket(f)
+            row[j] += sign * (1.0 + np.log(c))
+        norm = np.linalg.norm(row)
+        if norm:
+            row /= norm
+    return out
+
+# ---- index ----
+class VectorIndex:
+    """
+    Rows are (chunk_id, owner, vector). Search is exact cosine (dot product
+    of unit vectors) over the live rows of one owner, block by block, with a
+    running top-k per query.
+    """
+
+    def __init__(self, path: str = INDEX_DIR, dim: int = DIM):
+        self.path = path
+        self.dim = dim
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._lockf = open(self._file("index.lock"), "a+b")
+        with self._flock(exclusive=True):
+            with open(self._file("meta.i64"), "ab") as fh:
+                if fh.tell() < 8:
+                    fh.truncate(8)
+            self._meta = np.memmap(self._file("meta.i64"), dtype=np.int64, mode="r+", shape=(1,))
+            self._open(self._capacity_on_disk() or INIT_CAPACITY)
+            self._load()
+
+    @contextmanager
+    def _flock(self, exclusive: bool):
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._lockf, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lockf, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _locked(self, exclusive: bool = False):
+        """This process's threads, then the other processes; in sync with the files on entry."""
+        with self._lock, self._flock(exclusive):
+            if int(self._meta[0]) != self._gen:
+                cap = self._capacity_on_disk()
+                if cap > self.capacity:
+                    self._remap(cap)
+                self._load()
+            try:
+                yield
+            except BaseException:
+                self._gen = -1        # a failed write may have left the row map half-updated: reload
+                raise
+            if exclusive:
+                self._gen += 1
+                self._meta[0] = self._gen
+                self.flush()
+
+    def _load(self) -> None:
+        live = np.nonzero(self._ids[:] >= 0)[0]
+        self._n = int(live[-1]) + 1 if len(live) else 0
+        self._free = [int(i) for i in np.nonzero(self._ids[:self._n] < 0)[0]]
+        self._row_of = {int(self._ids[r]): int(r) for r in live}
+        self._gen = int(self._meta[0])
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _capacity_on_disk(self) -> int:
+        f = self._file("ids.i64")
+        return os.path.getsize(f) // 8 if os.path.exists(f) else 0
+
+    def _open(self, capacity: int) -> None:
+        new = not os.path.exists(self._file("ids.i64"))
+        for name, width in (("vectors.f32", 4 * self.dim), ("ids.i64", 8), ("owner.i32", 4)):
+            f = self._file(name)
+            with open(f, "ab") as fh:
+                if fh.tell() < capacity * width:
+                    fh.truncate(capacity * width)
+        self._vec = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self._ids = np.memmap(self._file("ids.i64"), dtype=np.int64, mode="r+", shape=(capacity,))
+        self._owner = np.memmap(self._file("owner.i32"), dtype=np.int32, mode="r+", shape=(capacity,))
+        if new:
+            self._ids[:] = -1
+        self.capacity = capacity
+
+    def _remap(self, capacity: int) -> None:
+        self.flush()
+        del self._vec, self._ids, self._owner
+        self._open(capacity)
+
+    def _grow(self, need: int) -> None:
+        cap = self.capacity
+        while cap < need:
+            cap *= 2
+        old = self.capacity
+        self._remap(cap)
+        self._ids[old:] = -1
+
+    def __len__(self) -> int:
+        with self._locked():
+            return len(self._row_of)
+
+    def add(self, chunk_ids: Sequence[int], owner: int, vectors: np.ndarray) -> None:
+        if len(chunk_ids) != len(vectors):
+            raise ValueError("chunk_ids and vectors differ in length")
+        with self._locked(exclusive=True):
+            rows = []
+            for cid in chunk_ids:
+                if cid in self._row_of:
+                    rows.append(self._row_of[cid])
+                elif self._free:
+                    rows.append(self._free.pop())
+                else:
+                    rows.append(self._n); self._n += 1
+            if self._n > self.capacity:
+                self._grow(self._n)
+            idx = np.asarray(rows, dtype=np.int64)
+            self._vec[idx] = np.asarray(vectors, dtype=np.float32)
+            self._owner[idx] = owner
+            self._ids[idx] = np.asarray(chunk_ids, dtype=np.int64)
+            for cid, r in zip(chunk_ids, rows):
+                self._row_of[int(cid)] = r
+
+    def delete(self, chunk_ids: Iterable[int]) -> int:
+        with self._locked(exclusive=True):
+            rows = [self._row_of.pop(int(c)) for c in chunk_ids if int(c) in self._row_of]
+            if rows:
+                idx = np.asarray(rows, dtype=np.int64)
+                self._ids[idx] = -1
+                self._vec[idx] = 0.0
+                self._free.extend(rows)
+            return len(rows)
+
+    def search(
+        self,
+        queries: np.ndarray,
+        owner: int,
+        k: int = 5,
+        allow: Optional[Iterable[int]] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        Top-k (chunk_id, cosine) per query row, best first. `allow`, if given,
+        restricts hits to those chunk ids (e.g. one document).
+        """
+        q = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        nq = q.shape[0]
+        best_s = np.full((nq, 0), -np.inf, dtype=np.float32)
+        best_r = np.zeros((nq, 0), dtype=np.int64)
+        with self._locked():
+            n = self._n
+            allow_rows = None
+            if allow is not None:
+                allow_rows = np.fromiter((self._row_of[c] for c in allow if c in self._row_of), dtype=np.int64)
+            for lo in range(0, n, BLOCK_ROWS):
+                hi = min(n, lo + BLOCK_ROWS)
+                mask = (self._owner[lo:hi] == owner) & (self._ids[lo:hi] >= 0)
+                if allow_rows is not None:
+                    sub = allow_rows[(allow_rows >= lo) & (allow_rows < hi)] - lo
+                    keep = np.zeros(hi - lo, dtype=bool); keep[sub] = True
+                    mask &= keep
+                rows = np.nonzero(mask)[0]
+                if not len(rows):
+                    continue
+                scores = q @ self._vec[lo + rows].T                      # (nq, m)
+                s = np.concatenate([best_s, scores], axis=1)
+                r = np.concatenate([best_r, np.broadcast_to(lo + rows, scores.shape)], axis=1)
+                if s.shape[1] > k:
+                    top = np.argpartition(-s, k - 1, axis=1)[:, :k]
+                    s = np.take_along_axis(s, top, axis=1)
+                    r = np.take_along_axis(r, top, axis=1)
+                best_s, best_r = s, r
+            ids = self._ids[best_r] if best_r.size else best_r
+        out = []
+        for i in range(nq):
+            order = np.argsort(-best_s[i])
+            out.append([(int(ids[i, j]), float(best_s[i, j])) for j in order])
+        return out
+
+    def flush(self) -> None:
+        for m in (self._vec, self._ids, self._owner, self._meta):
+            m.flush()
+
+_index: Optional[VectorIndex] = None
+_index_lock = threading.Lock()
+
+def get_index() -> VectorIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = VectorIndex()
+    return _index
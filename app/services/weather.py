@@ -1,33 +1,76 @@
-import httpx
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, NamedTuple, Sequence, Tuple
+import threading
+import time
 
-GEOCODE_URL = "https://geocoding-api.open-meteo.com/v1/search"
-WEATHER_URL = "https://api.open-meteo.com/v1/forecast"
+from ..config import settings
+from ..utils import breaker
+from ..utils.breaker import describe_age
+from ..utils.metrics import stage, upstream_error
+
+GEOCODE_URL = settings.geocode_url
+WEATHER_URL = settings.weather_url
+
+GRID_DEG = 0.05          # ~5 km cells: users in one neighbourhood share a forecast
+MAX_LOCATIONS = 100      # coordinates per Open-Meteo request (keeps the URL well under limits)
+CURRENT = "temperature_2m,precipitation,weather_code"
+DAILY = "temperature_2m_max,temperature_2m_min,precipitation_probability_max"
+
+class WeatherRequest(NamedTuple):
+    lat: float
+    lon: float
+    units: str = "imperial"   # imperial | metric
+    tz: str = "UTC"
+
+_geo_cache: Dict[str, Dict[str, float]] = {}
+_geo_lock = threading.Lock()
 
 def _geocode(city_or_zip: str) -> Optional[Dict[str, float]]:
+    key = " ".join(city_or_zip.lower().split())
+    with _geo_lock:
+        if key in _geo_cache:
+            return _geo_cache[key]
+    import httpx
     params = {"name": city_or_zip, "count": 1, "language": "en", "format": "json"}
-    try:
-        r = httpx.get(GEOCODE_URL, params=params, timeout=10)
-        r.raise_for_status()
-        data = r.json()
+
+    def lookup() -> Optional[Dict[str, float]]:
+        try:
+            with stage("geocode"):
+                r = httpx.get(GEOCODE_URL, params=params, timeout=10)
+                r.raise_for_status()
+            data = r.json()
+        except Exception:
+            upstream_error("open-meteo-geocode")
+            raise
         if not data.get("results"):
             return None
         res = data["results"][0]
         return {"lat": float(res["latitude"]), "lon": float(res["longitude"])}
-    except Exception:
+
+    loc, _ = breaker.call(GEOCODE_URL, ("geocode", key), lookup)
+    if loc is None:
         return None
+    # a town doesn't move; only successes are remembered
+    with _geo_lock:
+        _geo_cache[key] = loc
+    return loc
 
-def get_weather_summary(home: Dict[str, Any]) -> Optional[str]:
-    """
-    Returns a lightweight weather string like:
-    '66°F now, H 72° / L 60°, 10% precip'
-    """
-    if not home:
+def _summarize(j: Dict[str, Any], units: str) -> Optional[str]:
+    current = j.get("current", {})
+    daily = j.get("daily", {})
+    temp_now = current.get("temperature_2m")
+    tmax = (daily.get("temperature_2m_max") or [None])[0]
+    tmin = (daily.get("temperature_2m_min") or [None])[0]
+    pprob = (daily.get("precipitation_probability_max") or [0])[0]
+    if temp_now is None or tmax is None or tmin is None:
         return None
+    deg = "°F" if units == "imperial" else "°C"
+    return f"{round(temp_now)}{deg} now, H {round(tmax)}{deg} / L {round(tmin)}{deg}, {int(pprob or 0)}% precip"
 
+def _home_request(home: Dict[str, Any]) -> Optional[WeatherRequest]:
+    if not home:
+        return None
     units = (home.get("units") or "imperial").lower()
     tz = home.get("tz") or "UTC"
-
     lat = home.get("lat")
     lon = home.get("lon")
     if not (lat and lon):
@@ -38,30 +81,126 @@ def get_weather_summary(home: Dict[str, Any]) -> Optional[str]:
         if not loc:
             return None
         lat, lon = loc["lat"], loc["lon"]
+    return WeatherRequest(float(lat), float(lon), units, tz)
+
+def _cell_key(req: WeatherRequest, grid: float = GRID_DEG) -> tuple:
+    return ("weather", *snap(req.lat, req.lon, grid), req.units, req.tz)
+
+def _aged(summary: Optional[str], age: Optional[float]) -> Optional[str]:
+    # served from the last good forecast while Open-Meteo is down: say how old it is
+    if summary is None or age is None:
+        return summary
+    return f"{summary} ({describe_age(age)})"
+
+def get_weather_summary(home: Dict[str, Any]) -> Optional[str]:
+    """
+    Returns a lightweight weather string like:
+    '66°F now, H 72° / L 60°, 10% precip'
+    """
+    req = _home_request(home)
+    if req is None:
+        return None
 
     params = {
-        "latitude": lat,
-        "longitude": lon,
-        "current": "temperature_2m,precipitation,weather_code",
-        "daily": "temperature_2m_max,temperature_2m_min,precipitation_probability_max",
-        "timezone": tz,
+        "latitude": req.lat,
+        "longitude": req.lon,
+        "current": CURRENT,
+        "daily": DAILY,
+        "timezone": req.tz,
     }
-    if units == "imperial":
+    if req.units == "imperial":
         params["temperature_unit"] = "fahrenheit"
 
+    import httpx   # lazy: httpx/httpcore cost ~100ms+ at import
+
+    def fetch() -> str:
+        try:
+            with stage("open_meteo"):
+                r = httpx.get(WEATHER_URL, params=params, timeout=10)
+                r.raise_for_status()
+        except httpx.HTTPError:
+            upstream_error("open-meteo")
+            raise
+        summary = _summarize(r.json(), req.units)
+        if summary is None:
+            raise ValueError("incomplete forecast")
+        return summary
+
+    return _aged(*breaker.call(WEATHER_URL, _cell_key(req), fetch))
+
+# ---- batched: many users, few distinct places ----
+def snap(lat: float, lon: float, grid: float = GRID_DEG) -> Tuple[float, float]:
+    """Centre of the grid cell containing (lat, lon)."""
+    return (round(round(lat / grid) * grid, 4), round(round(lon / grid) * grid, 4))
+
+def _fetch_cells(cells: List[Tuple[float, float, str]], units: str) -> Optional[List[Optional[Dict[str, Any]]]]:
+    """One Open-Meteo call for up to MAX_LOCATIONS (lat, lon, tz) cells; results in input order, None if it failed."""
+    import httpx
+    params = {
+        "latitude": ",".join(f"{c[0]:g}" for c in cells),
+        "longitude": ",".join(f"{c[1]:g}" for c in cells),
+        "timezone": ",".join(c[2] for c in cells),
+        "current": CURRENT,
+        "daily": DAILY,
+    }
+    if units == "imperial":
+        params["temperature_unit"] = "fahrenheit"
+    b = breaker.breaker_for(WEATHER_URL)
+    if not b.allow():
+        return None
+    t0 = time.perf_counter()
     try:
-        r = httpx.get(WEATHER_URL, params=params, timeout=10)
-        r.raise_for_status()
+        with stage("open_meteo"):
+            r = httpx.get(WEATHER_URL, params=params, timeout=15)
+            r.raise_for_status()
         j = r.json()
-        current = j.get("current", {})
-        daily = j.get("daily", {})
-        temp_now = current.get("temperature_2m")
-        tmax = (daily.get("temperature_2m_max") or [None])[0]
-        tmin = (daily.get("temperature_2m_min") or [None])[0]
-        pprob = (daily.get("precipitation_probability_max") or [0])[0]
-        if temp_now is None or tmax is None or tmin is None:
-            return None
-        deg = "°F" if units == "imperial" else "°C"
-        return f"{round(temp_now)}{deg} now, H {round(tmax)}{deg} / L {round(tmin)}{deg}, {int(pprob)}% precip"
     except Exception:
+        b.record(False, time.perf_counter() - t0)
+        upstream_error("open-meteo")
         return None
+    b.record(True, time.perf_counter() - t0)
+    # a single location comes back as an object, several as a list
+    rows = j if isinstance(j, list) else [j]
+    return rows if len(rows) == len(cells) else None
+
+def fetch_weather_batch(reqs: Sequence[WeatherRequest], grid: float = GRID_DEG,
+                        chunk: int = MAX_LOCATIONS) -> List[Optional[str]]:
+    """
+    Summaries for many (lat, lon, units, tz) requests, in input order.
+    Coordinates are snapped to `grid` and de-duplicated, then fetched
+    `chunk` locations per upstream call (per unit system, since Open-Meteo
+    takes one temperature unit per request). Cost scales with distinct
+    cells, not with requests. Cells whose fetch failed get their last good
+    summary, marked with its age.
+    """
+    cell_of: List[Tuple[float, float, str, str]] = []
+    by_units: Dict[str, Dict[Tuple[float, float, str], None]] = {}
+    for q in reqs:
+        units = (q.units or "imperial").lower()
+        lat, lon = snap(q.lat, q.lon, grid)
+        cell = (lat, lon, q.tz or "UTC")
+        cell_of.append((*cell, units))
+        by_units.setdefault(units, {})[cell] = None
+
+    summary: Dict[Tuple[float, float, str, str], Optional[str]] = {}
+    for units, cells in by_units.items():
+        cells = list(cells)
+        for i in range(0, len(cells), chunk):
+            part = cells[i:i + chunk]
+            rows = _fetch_cells(part, units) or [None] * len(part)
+            for cell, j in zip(part, rows):
+                key = ("weather", *cell[:2], units, cell[2])
+                s = _summarize(j, units) if j else None
+                if s is not None:
+                    breaker.remember(key, s)
+                else:
+                    s = _aged(*breaker.last_good(key))
+                summary[(*cell, units)] = s
+    return [summary.get(c) for c in cell_of]
+
+def weather_for_homes(homes: Sequence[Dict[str, Any]], grid: float = GRID_DEG) -> List[Optional[str]]:
+    """fetch_weather_batch over prefs `home` dicts (city/zip homes geocoded, cached per place)."""
+    reqs = [_home_request(h) for h in homes]
+    live = [r for r in reqs if r is not None]
+    it = iter(fetch_weather_batch(live, grid))
+    return [next(it) if r is not None else None for r in reqs]
@@ -0,0 +1,179 @@
+"""
+Circuit breakers per upstream host, with last-known-good fallback.
+
+    value, age = call(url, ("weather", lat, lon), lambda: fetch(url))
+
+`fetch` raises on failure. While the host is healthy the call goes through
+and a successful result is remembered under `key`. Once the host's rolling
+window (last WINDOW seconds) holds MIN_CALLS calls and too many of them
+failed or were slower than SLOW_SECONDS, the breaker opens. Calls then
+skip the network entirely and get the last good value for their key,
+with its age in seconds (None/None if there is none). After a cooldown a
+single probe is let through (half-open). If it succeeds the breaker
+closes; if it fails the breaker reopens with a doubled cooldown.
+
+A fresh result comes back with age None, so callers only mark data that
+really is old.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Tuple, TypeVar
+from urllib.parse import urlparse
+
+from . import metrics
+
+T = TypeVar("T")
+
+WINDOW = 60.0          # seconds of history per host
+MIN_CALLS = 5          # don't judge a host on fewer calls than this
+ERROR_RATE = 0.5       # open at this share of failed calls...
+SLOW_SECONDS = float(os.getenv("BREAKER_SLOW_SECONDS", "4"))
+SLOW_RATE = 0.8        # ...or of calls slower than SLOW_SECONDS
+COOLDOWN = 15.0        # first open period; doubles per failed probe
+MAX_COOLDOWN = 300.0
+LAST_GOOD_MAX = 5_000
+LAST_GOOD_TTL = 24 * 3600.0   # older than this isn't worth showing
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+STATE = metrics.Gauge("circuit_state", "Breaker state per upstream host (0 closed, 1 half-open, 2 open).", ("host",))
+FALLBACKS = metrics.Counter("circuit_fallbacks_total", "Calls answered without the upstream.", ("host", "result"))
+
+class CircuitBreaker:
+    def __init__(self, host: str):
+        self.host = host
+        self.state = CLOSED
+        self._calls: Deque[Tuple[float, bool, bool]] = deque()   # (time, failed, slow)
+        self._opened_at = 0.0
+        self._cooldown = COOLDOWN
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _set(self, state: str) -> None:
+        self.state = state
+        if metrics.ENABLED:
+            STATE.set(self.host, value=_STATE_VALUE[state])
+
+    def allow(self) -> bool:
+        """May a call go to the upstream now? In half-open, only the one probe may."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self._cooldown:
+                self._set(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record(self, ok: bool, seconds: float) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN and self._probing:
+                self._probing = False
+                if ok:
+                    self._calls.clear()
+                    self._cooldown = COOLDOWN
+                    self._set(CLOSED)
+                else:
+                    self._cooldown = min(self._cooldown * 2, MAX_COOLDOWN)
+                    self._opened_at = now
+                    self._set(OPEN)
+                return
+            self._calls.append((now, not ok, seconds >= SLOW_SECONDS))
+            while self._calls and now - self._calls[0][0] > WINDOW:
+                self._calls.popleft()
+            n = len(self._calls)
+            if self.state == CLOSED and n >= MIN_CALLS:
+                failed = sum(1 for c in self._calls if c[1])
+                slow = sum(1 for c in self._calls if c[2])
+                if failed / n >= ERROR_RATE or slow / n >= SLOW_RATE:
+                    self._opened_at = now
+                    self._set(OPEN)
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def host_of(url_or_host: str) -> str:
+    return urlparse(url_or_host).netloc or url_or_host
+
+def breaker_for(url_or_host: str) -> CircuitBreaker:
+    host = host_of(url_or_host)
+    with _breakers_lock:
+        b = _breakers.get(host)
+        if b is None:
+            b = _breakers[host] = CircuitBreaker(host)
+        return b
+
+def states() -> Dict[str, str]:
+    with _breakers_lock:
+        return {h: b.state for h, b in _breakers.items()}
+
+# ---- last known good ----
+_last_good: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+_last_good_lock = threading.Lock()
+
+def remember(key: Hashable, value: Any) -> None:
+    with _last_good_lock:
+        _last_good[key] = (time.time(), value)
+        _last_good.move_to_end(key)
+        while len(_last_good) > LAST_GOOD_MAX:
+            _last_good.popitem(last=False)
+
+def last_good(key: Hashable) -> Tuple[Optional[Any], Optional[float]]:
+    with _last_good_lock:
+        hit = _last_good.get(key)
+    if hit is None or time.time() - hit[0] > LAST_GOOD_TTL:
+        return None, None
+    return hit[1], time.time() - hit[0]
+
+def _fallback(b: CircuitBreaker, key: Hashable) -> Tuple[Optional[Any], Optional[float]]:
+    value, age = last_good(key)
+    if metrics.ENABLED:
+        FALLBACKS.inc(b.host, "stale" if value is not None else "empty")
+    return value, age
+
+def call(url_or_host: str, key: Hashable, fetch: Callable[[], T]) -> Tuple[Optional[T], Optional[float]]:
+    """(fresh value, None), or (last good value, its age) when the host is down or the call failed."""
+    b = breaker_for(url_or_host)
+    if not b.allow():
+        return _fallback(b, key)
+    t0 = time.perf_counter()
+    try:
+        value = fetch()
+    except Exception:
+        b.record(False, time.perf_counter() - t0)
+        return _fallback(b, key)
+    b.record(True, time.perf_counter() - t0)
+    remember(key, value)
+    return value, None
+
+async def acall(url_or_host: str, key: Hashable, fetch: Callable[[], Awaitable[T]]) -> Tuple[Optional[T], Optional[float]]:
+    """Async twin of call()."""
+    b = breaker_for(url_or_host)
+    if not b.allow():
+        return _fallback(b, key)
+    t0 = time.perf_counter()
+    try:
+        value = await fetch()
+    except Exception:
+        b.record(False, time.perf_counter() - t0)
+        return _fallback(b, key)
+    except BaseException:
+        b.record(False, time.perf_counter() - t0)   # cancelled: don't leave a half-open probe hanging
+        raise
+    b.record(True, time.perf_counter() - t0)
+    remember(key, value)
+    return value, None
+
+def describe_age(seconds: float) -> str:
+    """'as of 12 min ago' style label for stale data."""
+    m = int(seconds // 60)
+    if m < 1:
+        return "as of just now"
+    if m < 60:
+        return f"as of {m} min ago"
+    return f"as of {m // 60} h ago"
@@ -0,0 +1,156 @@
+"""
+Conditional GETs and compression for JSON responses.
+
+The UI re-fetches prefs, the morning report and /news/for-me on every
+load. ConditionalMiddleware buffers JSON bodies (they are small and
+already fully built by the time FastAPI sends them) and then:
+
+* on the paths in CACHE_CONTROL, adds a strong ETag (hash of the body) and
+  Cache-Control, and answers a matching If-None-Match with 304 and no body;
+* compresses any JSON body of MIN_SIZE bytes or more with brotli (if the
+  `brotli` package is installed) or gzip, per Accept-Encoding.
+
+Anything that isn't JSON (audio, HTML, static files) streams through as-is.
+"""
+import gzip
+import hashlib
+from typing import List, Optional
+
+from ..services.users import USER_HEADER
+
+try:
+    import brotli  # optional
+except ImportError:
+    brotli = None
+
+MIN_SIZE = 1024
+
+# exact paths, or prefixes ending in "/"; first match wins
+CACHE_CONTROL = (
+    ("/report/morning", "private, no-cache"),
+    ("/morning", "private, no-cache"),
+    ("/news/for-me", "private, max-age=60"),   # index only moves on each ingest pass
+    ("/prefs/", "private, no-cache"),
+)
+
+def cache_control_for(path: str) -> Optional[str]:
+    for p, cc in CACHE_CONTROL:
+        if path == p or (p.endswith("/") and path.startswith(p)):
+            return cc
+    return None
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+def _opaque(tag: str) -> str:
+    # compare on the identity tag: W/ prefix and our "-gzip"/"-br" representation suffix ignored
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    tag = tag.strip('"')
+    for suffix in ("-gzip", "-br"):
+        if tag.endswith(suffix):
+            return tag[: -len(suffix)]
+    return tag
+
+def not_modified(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    want = _opaque(etag)
+    return any(_opaque(t) == want for t in if_none_match.split(","))
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """'br' or 'gzip' per the client's Accept-Encoding q-values (br only if brotli is installed)."""
+    q = {}
+    for part in (accept_encoding or "").lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        q[name] = weight
+    offers = [e for e in (("br",) if brotli else ()) + ("gzip",) if q.get(e, q.get("*", 0.0)) > 0]
+    return max(offers, key=lambda e: q.get(e, q.get("*", 0.0)), default=None)
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+def _header(headers: List[tuple], name: bytes) -> Optional[str]:
+    for k, v in headers:
+        if k.lower() == name:
+            return v.decode("latin-1")
+    return None
+
+class ConditionalMiddleware:
+    def __init__(self, app, min_size: int = MIN_SIZE):
+        self.app = app
+        self.min_size = min_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        req = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        cc = cache_control_for(scope["path"]) if scope["method"] in ("GET", "HEAD") else None
+        start: dict = {}
+        chunks: List[bytes] = []
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal passthrough
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                ctype = _header(headers, b"content-type") or ""
+                # NDJSON is a stream: buffering it would defeat the point
+                if "json" not in ctype or "ndjson" in ctype or _header(headers, b"content-encoding"):
+                    passthrough = True
+                    return await send(message)
+                start.update(message, headers=headers)
+                return
+            if passthrough or message["type"] != "http.response.body":
+                return await send(message)
+            chunks.append(message.get("body", b""))
+            if message.get("more_body"):
+                return
+            await self._finish(start, b"".join(chunks), req, cc, send)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _finish(self, start: dict, body: bytes, req: dict, cc: Optional[str], send) -> None:
+        headers = [(k, v) for k, v in start["headers"] if k.lower() not in (b"content-length", b"etag")]
+        status = start["status"]
+        enc = None
+        vary = []
+        if len(body) >= self.min_size:
+            enc = choose_encoding(req.get("accept-encoding", ""))
+            vary.append("Accept-Encoding")
+        if cc:
+            vary.append(USER_HEADER)   # same URL, different user, different body
+        if vary:
+            headers.append((b"vary", ", ".join(vary).encode()))
+        etag = None
+        if cc and status == 200:
+            etag = etag_for(body)
+            if enc:
+                # a strong ETag names one representation; tag the compressed one
+                etag = etag[:-1] + f'-{enc}"'
+            headers += [(b"cache-control", cc.encode()), (b"etag", etag.encode())]
+            if not_modified(req.get("if-none-match"), etag):
+                headers = [(k, v) for k, v in headers if k.lower() != b"content-type"]
+                await send({"type": "http.response.start", "status": 304, "headers": headers})
+                await send({"type": "http.response.body", "body": b""})
+                return
+        if enc:
+            body = compress(body, enc)
+            headers.append((b"content-encoding", enc.encode()))
+        headers.append((b"content-length", str(len(body)).encode()))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,224 @@
+"""
+Event-loop stall detector and per-route blocking profiler (opt-in: LOOP_MONITOR=1).
+
+An `async def` route that calls something blocking (feedparser.parse, the
+sync OpenAI client) holds the event loop, and every other request on the
+worker waits behind it. Three pieces make that visible:
+
+  - a sampler task sleeps SAMPLE seconds at a time; how late it wakes up is
+    the loop lag (event_loop_lag_seconds with METRICS_ENABLED=1);
+  - a watchdog thread notices when the sampler hasn't run for longer than
+    STALL seconds and captures the loop thread's stack right then, i.e.
+    the code that is holding the loop, and logs it with the route;
+  - a task factory times every task step. Steps run with the loop held,
+    so their sum per request is the time it blocked; the rest of the
+    request's wall time was spent awaiting.
+
+GET /debug/loop returns recent lag, the last stalls with their stacks,
+and per-route blocked/awaiting totals. Timing every step swaps in the
+pure-Python Task, which is slower than the C one: leave this off unless
+looking for a regression.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Any, Deque, Dict, Optional
+
+from . import metrics
+
+log = logging.getLogger(__name__)
+
+ENABLED = os.getenv("LOOP_MONITOR", "0").lower() in ("1", "true", "yes")
+STALL = float(os.getenv("LOOP_STALL_MS", "100")) / 1000   # loop held this long counts as a stall
+SAMPLE = 0.05                                             # sampler period, seconds
+LAG_WINDOW = 1200                                         # samples kept for /debug/loop (~1 min)
+STALLS_KEPT = 50
+STACK_FRAMES = 15
+
+LAG_SECONDS = metrics.Histogram("event_loop_lag_seconds", "How late the loop sampler woke up.",
+                                buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+STALLS = metrics.Counter("event_loop_stalls_total", "Times the loop was held longer than LOOP_STALL_MS.", ("route",))
+BLOCKED_SECONDS = metrics.Counter("route_loop_blocked_seconds_total", "Time a route held the event loop.", ("route",))
+
+# per-request accumulator [blocked seconds, longest step, "METHOD route"]; child tasks share it through the copied context
+_request: ContextVar[Optional[list]] = ContextVar("loopmon_request", default=None)
+
+class _RouteStats:
+    __slots__ = ("requests", "wall", "blocked", "max_step")
+
+    def __init__(self):
+        self.requests = 0
+        self.wall = self.blocked = self.max_step = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "wall_ms": round(self.wall * 1000, 1),
+            "blocked_ms": round(self.blocked * 1000, 1),
+            "awaiting_ms": round(max(self.wall - self.blocked, 0.0) * 1000, 1),
+            "blocked_share": round(self.blocked / self.wall, 3) if self.wall else 0.0,
+            "max_step_ms": round(self.max_step * 1000, 1),
+        }
+
+class LoopMonitor:
+    def __init__(self):
+        self._lags: Deque[float] = deque(maxlen=LAG_WINDOW)
+        self._stalls: Deque[Dict[str, Any]] = deque(maxlen=STALLS_KEPT)
+        self._routes: Dict[str, _RouteStats] = {}
+        self._lock = threading.Lock()
+        self._beat = time.monotonic()
+        self._step: Optional[asyncio.Task] = None   # task whose step is holding the loop
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._sampler: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+
+    # ---- lifecycle ----
+    def start(self) -> None:
+        """Call from the running loop (app lifespan)."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        if _TimedTask is not None:
+            self._loop.set_task_factory(_task_factory)
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._sampler = self._loop.create_task(self._sample(), name="loopmon-sampler")
+        threading.Thread(target=self._watch, name="loopmon-watchdog", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.cancel()
+        if self._loop is not None and self._loop.get_task_factory() is _task_factory:
+            self._loop.set_task_factory(None)
+
+    # ---- lag ----
+    async def _sample(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._beat = time.monotonic()
+            t0 = loop.time()
+            await asyncio.sleep(SAMPLE)
+            lag = max(loop.time() - t0 - SAMPLE, 0.0)
+            self._lags.append(lag)
+            if metrics.ENABLED:
+                LAG_SECONDS.observe(value=lag)
+
+    # ---- stalls ----
+    def _watch(self) -> None:
+        stalled_since = None     # beat of the stall already captured
+        while not self._stop.wait(STALL / 2):
+            beat = self._beat
+            held = time.monotonic() - beat - SAMPLE
+            if held < STALL or stalled_since == beat:
+                continue
+            stalled_since = beat
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame)[-STACK_FRAMES:])
+            step = self._step
+            req = step._context.get(_request) if step is not None else None
+            route = req[2] if req else None
+            task = step.get_name() if step is not None else None
+            with self._lock:
+                self._stalls.append({"at": time.time(), "held_ms": round(held * 1000, 1),
+                                     "route": route, "task": task, "stack": stack})
+            if metrics.ENABLED:
+                STALLS.inc(route or "none")
+            log.warning("event loop held for %.0f ms+ (route %s, task %s)\n%s",
+                        held * 1000, route or "-", task or "-", stack)
+
+    # ---- per task step / per request ----
+    def _stepped(self, req: Optional[list], dt: float) -> None:
+        if req is not None:
+            req[0] += dt
+            if dt > req[1]:
+                req[1] = dt
+
+    def finish(self, route: str, req: list, wall: float) -> None:
+        blocked, longest = req[0], req[1]
+        with self._lock:
+            s = self._routes.get(route)
+            if s is None:
+                s = self._routes[route] = _RouteStats()
+            s.requests += 1
+            s.wall += wall
+            s.blocked += blocked
+            s.max_step = max(s.max_step, longest)
+        if metrics.ENABLED and blocked:
+            BLOCKED_SECONDS.inc(route, by=blocked)
+        if longest >= STALL:
+            log.warning("%s held the event loop for %.0f ms of %.0f ms (longest step %.0f ms)",
+                        route, blocked * 1000, wall * 1000, longest * 1000)
+
+    def snapshot(self) -> Dict[str, Any]:
+        lags = sorted(self._lags)
+
+        def pct(p: float) -> float:
+            return round(lags[min(int(p * len(lags)), len(lags) - 1)] * 1000, 2) if lags else 0.0
+
+        with self._lock:
+            stalls = list(self._stalls)[::-1]
+            routes = {r: s.as_dict() for r, s in self._routes.items()}
+        return {
+            "stall_threshold_ms": STALL * 1000,
+            "step_timing": _TimedTask is not None,
+            "lag_ms": {"samples": len(lags), "p50": pct(0.5), "p99": pct(0.99),
+                       "max": round(lags[-1] * 1000, 2) if lags else 0.0},
+            "stalls": stalls,
+            "routes": dict(sorted(routes.items(), key=lambda kv: -kv[1]["blocked_ms"])),
+        }
+
+monitor = LoopMonitor()
+
+# ---- timed tasks ----
+# The C Task doesn't expose its step; the pure-Python one does (name-mangled).
+_PyTask = getattr(asyncio.tasks, "_PyTask", None)
+_TimedTask = None
+if _PyTask is not None and hasattr(_PyTask, f"_{_PyTask.__name__}__step"):
+    _STEP = f"_{_PyTask.__name__}__step"
+    _base_step = getattr(_PyTask, _STEP)
+
+    def _timed_step(self, exc=None):
+        prev = monitor._step
+        monitor._step = self
+        t0 = perf_counter()
+        try:
+            _base_step(self, exc)
+        finally:
+            monitor._step = prev
+            # read after the step: the request's first step is the one that sets its accumulator
+            monitor._stepped(self._context.get(_request), perf_counter() - t0)
+
+    _TimedTask = type("TimedTask", (_PyTask,), {_STEP: _timed_step})
+
+def _task_factory(loop, coro, context=None):
+    return _TimedTask(coro, loop=loop, context=context)
+
+class LoopMonitorMiddleware:
+    """Pure ASGI: opens the per-request accumulator and files it under the matched route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        req = [0.0, 0.0, f'{scope.get("method", "")} {scope.get("path", "")}']   # blocked, longest step, label
+        token = _request.set(req)
+        t0 = perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request.reset(token)
+            route = scope.get("route")
+            req[2] = f'{scope.get("method", "")} {getattr(route, "path", "unmatched")}'
+            monitor.finish(req[2], req, perf_counter() - t0)
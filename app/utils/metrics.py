@@ -0,0 +1,173 @@
+"""
+Per-stage latency instrumentation.
+
+    with stage("open_meteo"):
+        r = httpx.get(...)
+
+Every stage is recorded on the current request (returned as a
+`Server-Timing` header by ServerTimingMiddleware). With METRICS_ENABLED=1
+it is also folded into Prometheus histograms/counters served on /metrics.
+With metrics off a stage is two perf_counter() calls and a list append.
+"""
+import os
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+
+ENABLED = os.getenv("METRICS_ENABLED", "0").lower() in ("1", "true", "yes")
+
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _fmt_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    esc = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, esc)) + "}"
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def inc(self, *labels: str, by: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + by
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for lv, v in sorted(self._values.items()):
+                out.append(f"{self.name}{_fmt_labels(self.labels, lv)} {v:g}")
+        return out
+
+class Gauge(Counter):
+    def set(self, *labels: str, value: float) -> None:
+        with self._lock:
+            self._values[labels] = float(value)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, tuple(buckets)
+        self._series: Dict[tuple, list] = {}   # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def observe(self, *labels: str, value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            if i < len(self.buckets):
+                s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ("le",)
+        with self._lock:
+            for lv, s in sorted(self._series.items()):
+                cum = 0
+                for b, c in zip(self.buckets, s):
+                    cum += c
+                    out.append(f"{self.name}_bucket{_fmt_labels(names, lv + (f'{b:g}',))} {cum}")
+                out.append(f"{self.name}_bucket{_fmt_labels(names, lv + ('+Inf',))} {s[-1]}")
+                out.append(f"{self.name}_sum{_fmt_labels(self.labels, lv)} {s[-2]:.6f}")
+                out.append(f"{self.name}_count{_fmt_labels(self.labels, lv)} {s[-1]}")
+        return out
+
+_REGISTRY: list = []
+
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Request latency by route.", ("method", "route", "status"))
+STAGE_SECONDS = Histogram("stage_duration_seconds", "Latency of one pipeline stage.", ("stage",))
+STAGE_ERRORS = Counter("stage_errors_total", "Stages that raised.", ("stage",))
+CACHE_EVENTS = Counter("cache_events_total", "Cache lookups by outcome.", ("cache", "result"))
+UPSTREAM_ERRORS = Counter("upstream_errors_total", "Failed calls to an upstream service.", ("upstream",))
+
+_timings: ContextVar[Optional[list]] = ContextVar("stage_timings", default=None)
+
+@contextmanager
+def stage(name: str):
+    t0 = perf_counter()
+    try:
+        yield
+    except BaseException:
+        if ENABLED:
+            STAGE_ERRORS.inc(name)
+        raise
+    finally:
+        dt = perf_counter() - t0
+        rec = _timings.get()
+        if rec is not None:
+            rec.append((name, dt))
+        if ENABLED:
+            STAGE_SECONDS.observe(name, value=dt)
+
+def cache_event(cache: str, hit: bool) -> None:
+    if ENABLED:
+        CACHE_EVENTS.inc(cache, "hit" if hit else "miss")
+
+def upstream_error(upstream: str) -> None:
+    if ENABLED:
+        UPSTREAM_ERRORS.inc(upstream)
+
+def render() -> str:
+    lines: List[str] = []
+    for m in _REGISTRY:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+def server_timing(rec: List[Tuple[str, float]]) -> str:
+    # parallel stages (e.g. several ICS feeds) share a name: report the sum and how many ran
+    agg: Dict[str, list] = {}
+    for name, dt in rec:
+        a = agg.setdefault(name, [0.0, 0])
+        a[0] += dt; a[1] += 1
+    parts = []
+    for name, (dt, n) in agg.items():
+        parts.append(f'{name};dur={dt * 1000:.1f}' + (f';desc="x{n}"' if n > 1 else ""))
+    return ", ".join(parts)
+
+class ServerTimingMiddleware:
+    """Pure ASGI so it also works for StreamingResponse (timings up to the first byte)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        rec: list = []
+        token = _timings.set(rec)
+        t0 = perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                rec.append(("total", perf_counter() - t0))
+                value = server_timing(rec)
+                if value:
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [(b"server-timing", value.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _timings.reset(token)
+            if ENABLED:
+                route = scope.get("route")
+                REQUEST_SECONDS.observe(scope.get("method", ""), getattr(route, "path", "unmatched"),
+                                        str(status["code"]), value=perf_counter() - t0)
@@ -1,21 +1,114 @@
-from datetime import datetime, time, timedelta
+from datetime import date, datetime, time, timedelta, timezone, tzinfo
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from zoneinfo import ZoneInfo
 
-def blocks_from_events(events):
+Interval = Tuple[datetime, datetime]
+
+DAY_START = time(7, 0)
+DAY_END = time(22, 0)
+MIN_GAP = timedelta(minutes=30)
+
+def _tz(tz) -> tzinfo:
+    if tz is None:
+        return ZoneInfo("UTC")
+    return ZoneInfo(tz) if isinstance(tz, str) else tz
+
+def _as_dt(v, tz: tzinfo) -> datetime:
+    # all-day values are dates: they start at local midnight; naive datetimes are local wall time
+    if isinstance(v, datetime):
+        return v.replace(tzinfo=tz) if v.tzinfo is None else v
+    if isinstance(v, date):
+        return datetime.combine(v, time(0), tzinfo=tz)
+    raise TypeError(f"expected date or datetime, got {type(v).__name__}")
+
+def merge_busy(events: Iterable[Sequence], tz=None) -> List[Interval]:
+    """
+    Union of busy intervals from any number of calendars, sorted by start.
+    Each event is (start, end, ...) with datetimes (aware, or naive in `tz`)
+    or dates for all-day / multi-day events (end date exclusive, as in ICS).
+    Overlapping and touching intervals are merged; O(n log n). Returned in UTC.
+    """
+    z = _tz(tz)
+    spans = []
+    for ev in events:
+        s, e = _as_dt(ev[0], z), _as_dt(ev[1] if ev[1] is not None else ev[0], z)
+        if isinstance(ev[0], date) and not isinstance(ev[0], datetime) and e <= s:
+            e = s + timedelta(days=1)  # all-day event with no/zero-length end
+        if e > s:
+            # compare and subtract in UTC: same-tzinfo arithmetic is wall-clock and skews across DST
+            spans.append((s.astimezone(timezone.utc), e.astimezone(timezone.utc)))
+    spans.sort()
+    merged: List[Interval] = []
+    for s, e in spans:
+        if merged and s <= merged[-1][1]:
+            if e > merged[-1][1]:
+                merged[-1] = (merged[-1][0], e)
+        else:
+            merged.append((s, e))
+    return merged
+
+def _windows(start: date, end: date, tz: tzinfo, day_start: time, day_end: time):
+    d = start
+    while d < end:
+        ws = datetime.combine(d, day_start, tzinfo=tz)
+        we = datetime.combine(d, day_end, tzinfo=tz) if day_end > day_start \
+            else datetime.combine(d + timedelta(days=1), day_end, tzinfo=tz)
+        yield ws.astimezone(timezone.utc), we.astimezone(timezone.utc)
+        d += timedelta(days=1)
+
+def free_blocks(
+    events: Iterable[Sequence],
+    start: date,
+    end: date,
+    tz=None,
+    day_start: time = DAY_START,
+    day_end: time = DAY_END,
+    min_gap: timedelta = MIN_GAP,
+) -> List[Interval]:
+    """
+    Free time inside working hours for every day in [start, end), in one
+    sweep over the merged busy list. Working-hour bounds are local wall
+    time in `tz`, so DST days keep 07:00–22:00. Gaps shorter than
+    `min_gap` are dropped. Returns aware (start, end) pairs in `tz`.
+    """
+    z = _tz(tz)
+    busy = merge_busy(events, z)
+    free: List[Interval] = []
+    i = 0
+    for ws, we in _windows(start, end, z, day_start, day_end):
+        # skip busy spans that ended before this window; busy is sorted and
+        # windows only move forward, so the cursor never goes back
+        while i < len(busy) and busy[i][1] <= ws:
+            i += 1
+        cur = ws
+        j = i
+        while j < len(busy) and busy[j][0] < we:
+            s, e = busy[j]
+            if s - cur >= min_gap:
+                free.append((cur, s))
+            if e > cur:
+                cur = e
+            j += 1
+        if cur < we and we - cur >= min_gap:
+            free.append((cur, we))
+    return [(a.astimezone(z), b.astimezone(z)) for a, b in free]
+
+def by_day(blocks: Iterable[Interval]) -> Dict[date, List[Interval]]:
+    """Group free blocks by the local date they start on."""
+    out: Dict[date, List[Interval]] = {}
+    for a, b in blocks:
+        out.setdefault(a.date(), []).append((a, b))
+    return out
+
+def fmt_block(a: datetime, b: datetime) -> str:
+    return f"{a.hour:02d}:{a.minute:02d}–{b.hour:02d}:{b.minute:02d}"
+
+def blocks_from_events(events, day: Optional[date] = None, tz=None):
     # events: list of tuples (start,end,title) in local time strings "HH:MM"
+    z = _tz(tz)
+    day = day or datetime.now(z).date()
     parsed = []
-    for s,e,t in events:
+    for s, e, _ in events:
         sh, sm = map(int, s.split(":")); eh, em = map(int, e.split(":"))
-        parsed.append((time(sh,sm), time(eh,em), t))
-    parsed.sort(key=lambda x: x[0])
-    # compute free gaps > 30 min between 07:00-22:00
-    day_start, day_end = time(7,0), time(22,0)
-    free = []
-    current = day_start
-    for s,e,_ in parsed:
-        if (datetime.combine(datetime.today(), s) - datetime.combine(datetime.today(), current)).seconds >= 30*60:
-            free.append((current, s))
-        current = max(current, e)
-    if (datetime.combine(datetime.today(), day_end) - datetime.combine(datetime.today(), current)).seconds >= 30*60:
-        free.append((current, day_end))
-    def fmt(t): return f"{t.hour:02d}:{t.minute:02d}"
-    return [f"{fmt(a)}–{fmt(b)}" for a,b in free]
+        parsed.append((datetime.combine(day, time(sh, sm)), datetime.combine(day, time(eh, em))))
+    return [fmt_block(a, b) for a, b in free_blocks(parsed, day, day + timedelta(days=1), z)]
@@ -0,0 +1,95 @@
+"""
+Micro-benchmarks for ICS parsing and free-time computation.
+
+    python -m bench.bench_calendar --events 500 --recurring 50 --out bench_calendar.json
+
+parse_events is timed with and without a one-day window (the window turns
+on recurrence expansion); blocks_from_events / free_blocks on a synthetic
+busy day and a synthetic month.
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from app.services import recurrence
+from app.services.calendar import parse_events
+from app.utils.time import blocks_from_events, free_blocks
+
+def synth_ics(n: int, recurring: int, seed: int = 7) -> str:
+    rnd = random.Random(seed)
+    today = date.today()
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//bench//calendar//EN"]
+    for i in range(n):
+        d = today + timedelta(days=rnd.randint(-60, 60))
+        h, m = rnd.randint(7, 20), rnd.choice((0, 15, 30, 45))
+        s = datetime(d.year, d.month, d.day, h, m, tzinfo=timezone.utc)
+        e = s + timedelta(minutes=rnd.choice((30, 45, 60, 90)))
+        lines += ["BEGIN:VEVENT", f"UID:one-{i}@bench", f"DTSTART:{s:%Y%m%dT%H%M%SZ}",
+                  f"DTEND:{e:%Y%m%dT%H%M%SZ}", f"SUMMARY:Event {i}", "LOCATION:Room 1", "END:VEVENT"]
+    for i in range(recurring):
+        d = today - timedelta(days=rnd.randint(30, 900))
+        freq = rnd.choice(("DAILY", "WEEKLY;BYDAY=MO,WE,FR", "WEEKLY"))
+        h = rnd.randint(7, 20)
+        lines += ["BEGIN:VEVENT", f"UID:rec-{i}@bench", f"DTSTART:{d:%Y%m%d}T{h:02d}0000Z",
+                  f"DTEND:{d:%Y%m%d}T{h:02d}5000Z", f"RRULE:FREQ={freq}",
+                  f"SUMMARY:Series {i}", "END:VEVENT"]
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(lines)
+
+def _time(fn, repeat: int) -> dict:
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        runs.append((time.perf_counter() - t0) * 1000)
+    return {"ms_first": round(runs[0], 3), "ms_median": round(statistics.median(runs), 3),
+            "ms_min": round(min(runs), 3), "items": len(out)}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--events", type=int, default=500)
+    ap.add_argument("--recurring", type=int, default=50)
+    ap.add_argument("--day-events", type=int, default=12, help="busy slots for blocks_from_events")
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--out", default=None)
+    a = ap.parse_args()
+
+    text = synth_ics(a.events, a.recurring)
+    start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    window = (start, start + timedelta(days=1))
+
+    def windowed_cold():
+        recurrence._cache.clear()
+        return parse_events(text, window)
+
+    rnd = random.Random(11)
+    day = []
+    for _ in range(a.day_events):
+        h, m = rnd.randint(7, 20), rnd.choice((0, 30))
+        day.append((f"{h:02d}:{m:02d}", f"{min(h + 1, 23):02d}:{m:02d}", "busy"))
+    month = [(start + timedelta(hours=rnd.randint(0, 24 * 30)),) for _ in range(a.events)]
+    month = [(s[0], s[0] + timedelta(minutes=rnd.choice((30, 60, 90)))) for s in month]
+    today = start.date()
+
+    res = {
+        "bench": "calendar",
+        "ics_bytes": len(text),
+        "events": a.events,
+        "recurring": a.recurring,
+        "parse_events": _time(lambda: parse_events(text), a.repeat),
+        "parse_events_window_cold": _time(windowed_cold, a.repeat),
+        "parse_events_window_warm": _time(lambda: parse_events(text, window), a.repeat),
+        "blocks_from_events": _time(lambda: blocks_from_events(day, today, "America/Los_Angeles"), a.repeat * 50),
+        "free_blocks_30d": _time(lambda: free_blocks(month, today, today + timedelta(days=30), "America/Los_Angeles"),
+                                 a.repeat),
+    }
+    print(json.dumps(res, indent=2))
+    if a.out:
+        with open(a.out, "w", encoding="utf-8") as f:
+            json.dump(res, f, indent=2)
+
+if __name__ == "__main__":
+    main()
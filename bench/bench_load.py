@@ -0,0 +1,177 @@
+"""
+Load test the main endpoints against local upstream stubs.
+
+    python -m bench.bench_load --concurrency 1,4,16 --requests 200 --out load.json
+    python -m bench.bench_load --stub openai=1500:500:0.05 --endpoints ask,speak
+
+Starts the stubs from bench/stubs.py, runs the app under uvicorn in a temp
+directory (its own app.db, prefs.json, news index and notes index) with the
+upstream URLs pointed at the stubs, then drives each endpoint at each
+concurrency level. Reports p50/p95/p99 latency, throughput and error counts.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+
+from bench.stubs import StubConfig, app_env, ics_urls, start_stubs
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+ENDPOINTS = {
+    "morning": ("GET", "/report/morning", None),
+    "speak": ("GET", "/report/morning/speak", None),
+    "for-me": ("GET", "/news/for-me?live=true", None),
+    "ask": ("POST", "/study/ask", {"question": "What does the Krebs cycle produce?"}),
+}
+
+NOTE = ("The Krebs cycle (citric acid cycle) runs in the mitochondrial matrix. Each turn oxidises "
+        "acetyl-CoA to two CO2 and produces 3 NADH, 1 FADH2 and 1 GTP. NADH and FADH2 feed the "
+        "electron transport chain, which makes most of the cell's ATP.")
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _pct(sorted_ms: List[float], p: float) -> float:
+    if not sorted_ms:
+        return 0.0
+    i = min(len(sorted_ms) - 1, max(0, round(p / 100 * len(sorted_ms)) - 1))
+    return round(sorted_ms[i], 1)
+
+def start_app(env: Dict[str, str], workdir: str, port: int, workers: int) -> subprocess.Popen:
+    full = {**os.environ, **env, "PYTHONPATH": REPO + os.pathsep + os.environ.get("PYTHONPATH", "")}
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=workdir, env=full,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/healthz", timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            pass
+        if proc.poll() is not None:
+            raise SystemExit("app exited during startup")
+        time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit("app did not become healthy in 30s")
+
+async def run_level(base: str, name: str, concurrency: int, total: int, timeout: float) -> dict:
+    method, path, body = ENDPOINTS[name]
+    lat: List[float] = []
+    statuses: Dict[str, int] = {}
+    todo = iter(range(total))
+
+    async def worker(client: httpx.AsyncClient):
+        for _ in todo:
+            t0 = time.perf_counter()
+            try:
+                r = await client.request(method, path, json=body)
+                await r.aread()
+                key = str(r.status_code)
+            except httpx.HTTPError as e:
+                key = type(e).__name__
+            lat.append((time.perf_counter() - t0) * 1000)
+            statuses[key] = statuses.get(key, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base, timeout=timeout, limits=limits) as client:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        wall = time.perf_counter() - t0
+
+    lat.sort()
+    ok = sum(v for k, v in statuses.items() if k.startswith("2"))
+    return {
+        "endpoint": path, "concurrency": concurrency, "requests": len(lat), "ok": ok,
+        "errors": len(lat) - ok, "statuses": statuses,
+        "p50_ms": _pct(lat, 50), "p95_ms": _pct(lat, 95), "p99_ms": _pct(lat, 99),
+        "max_ms": round(lat[-1], 1) if lat else 0.0,
+        "rps": round(len(lat) / wall, 2) if wall else 0.0,
+    }
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--endpoints", default=",".join(ENDPOINTS), help="comma list of " + ", ".join(ENDPOINTS))
+    ap.add_argument("--concurrency", default="1,4,16")
+    ap.add_argument("--requests", type=int, default=100, help="per endpoint per concurrency level")
+    ap.add_argument("--warmup", type=int, default=5)
+    ap.add_argument("--stub", action="append", default=[], metavar="NAME=LAT[:JITTER[:FAIL]]",
+                    help="override a stub, e.g. openai=1500:500:0.05 (ms, ms, fraction)")
+    ap.add_argument("--topics", default="padres,science,san diego traffic")
+    ap.add_argument("--feeds", type=int, default=3, help="ICS feeds on the calendar")
+    ap.add_argument("--feed-ttl", type=float, default=None, help="NEWS_FEED_TTL for the app; 0 = always revalidate")
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--timeout", type=float, default=60.0)
+    ap.add_argument("--out", default=None)
+    a = ap.parse_args()
+
+    overrides = {}
+    for spec in a.stub:
+        name, _, cfg = spec.partition("=")
+        overrides[name] = StubConfig.parse(cfg)
+    stubs = start_stubs(overrides)
+
+    workdir = tempfile.mkdtemp(prefix="pa-bench-")
+    with open(os.path.join(workdir, "prefs.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "topics": [t.strip() for t in a.topics.split(",") if t.strip()],
+            "home": {"city": "San Diego", "tz": "America/Los_Angeles", "units": "imperial"},
+            "calendar": {"ics_urls": ics_urls(stubs, a.feeds)},
+        }, f)
+    env = {
+        **app_env(stubs),
+        "APP_DATA_DIR": workdir,
+        "NEWS_DB": os.path.join(workdir, "news.db"),
+        "NOTES_INDEX_DIR": os.path.join(workdir, "notes_index"),
+        "NEWS_INGEST_INTERVAL": "0",
+    }
+    if a.feed_ttl is not None:
+        env["NEWS_FEED_TTL"] = str(a.feed_ttl)
+
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    proc = start_app(env, workdir, port, a.workers)
+    results = []
+    try:
+        httpx.post(base + "/study/notes", json={"title": "Krebs cycle", "text": NOTE}, timeout=30)
+        for name in [n.strip() for n in a.endpoints.split(",") if n.strip()]:
+            if name not in ENDPOINTS:
+                raise SystemExit(f"unknown endpoint {name!r}")
+            asyncio.run(run_level(base, name, 1, a.warmup, a.timeout))
+            for c in [int(x) for x in a.concurrency.split(",")]:
+                res = run_level(base, name, c, a.requests, a.timeout)
+                results.append(asyncio.run(res))
+                print(json.dumps(results[-1]), flush=True)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+        for s in stubs.values():
+            s.shutdown()
+
+    report = {
+        "bench": "load",
+        "stubs": {k: vars(s.cfg) | {"hits": s.hits} for k, s in stubs.items()},
+        "requests_per_level": a.requests,
+        "workers": a.workers,
+        "feed_ttl": a.feed_ttl,
+        "results": results,
+    }
+    if a.out:
+        with open(a.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
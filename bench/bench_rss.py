@@ -0,0 +1,155 @@
+"""
+Streaming RSS reader (routers/news_rss) vs feedparser on a Google-News-sized feed.
+
+    python -m bench.bench_rss --items 100 --keep 20 --kbps 2000 --out bench_rss.json
+
+The feed is synthetic: `--items` items, each with a Google-style HTML
+description. "parse" compares the two parsers on the in-memory body:
+median CPU time, tracemalloc peak, and how much of the body each one read.
+"fetch" serves the feed from a local server in another process (throttled to
+`--kbps`, 0 = unthrottled) and times a full GET: feedparser.parse(url)
+against news_rss.fetch_items, which closes the connection after `--keep`
+items.
+"""
+import argparse
+import json
+import multiprocessing
+import statistics
+import time
+import tracemalloc
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+import feedparser
+
+from routers import news_rss
+
+_SOURCES = ["Reuters", "AP News", "ESPN", "San Diego Union-Tribune", "NBC 7 San Diego", "CNN", "Fox 5"]
+
+def synth_rss(n: int) -> bytes:
+    now = datetime.now(timezone.utc)
+    items = []
+    for i in range(n):
+        src = _SOURCES[i % len(_SOURCES)]
+        title = f"Story {i}: council approves budget as storm brings rain to the coast - {src}"
+        link = f"https://news.google.com/rss/articles/CBMi{'x' * 180}{i}?oc=5"
+        # Google News descriptions are an escaped HTML list of related coverage
+        desc = "".join(f'<li><a href="{link}&amp;r={j}" target="_blank">{title} ({j})</a>'
+                       f'&nbsp;&nbsp;<font color="#6f6f6f">{src}</font></li>' for j in range(4))
+        items.append(
+            f"<item><title>{escape(title)}</title><link>{link}</link>"
+            f'<guid isPermaLink="false">CBMi{i}</guid>'
+            f"<pubDate>{format_datetime(now - timedelta(minutes=11 * i))}</pubDate>"
+            f"<description>{escape('<ol>' + desc + '</ol>')}</description>"
+            f'<source url="https://example.com/{i % 7}">{escape(src)}</source></item>')
+    return (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><rss version="2.0" '
+            f'xmlns:media="http://search.yahoo.com/mrss/"><channel><generator>NFE/5.0</generator>'
+            f"<title>\"padres\" - Google News</title><link>https://news.google.com/</link>"
+            f"<language>en-US</language>{''.join(items)}</channel></rss>").encode()
+
+def _chunks(body: bytes, size: int, counter: list):
+    for i in range(0, len(body), size):
+        counter[0] += min(size, len(body) - i)
+        yield body[i:i + size]
+
+def _measure(fn, repeat: int) -> dict:
+    cpu = []
+    for _ in range(repeat):
+        t0 = time.process_time()
+        out = fn()
+        cpu.append((time.process_time() - t0) * 1000)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"cpu_ms_median": round(statistics.median(cpu), 3), "cpu_ms_min": round(min(cpu), 3),
+            "peak_kib": round(peak / 1024, 1), "items": len(out)}
+
+def _serve(body: bytes, kbps: int, port_q) -> None:
+    class H(BaseHTTPRequestHandler):
+        def log_message(self, *a):
+            pass
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/rss+xml")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            step = 8192
+            try:
+                for i in range(0, len(body), step):
+                    self.wfile.write(body[i:i + step])
+                    if kbps:
+                        time.sleep(step / (kbps * 1024))
+            except (BrokenPipeError, ConnectionResetError):
+                pass     # the streaming reader hung up early, as intended
+
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), H)
+    port_q.put(srv.server_port)
+    srv.serve_forever()
+
+def _fetch(fn, repeat: int) -> dict:
+    wall, cpu, n = [], [], 0
+    for _ in range(repeat):
+        t0, c0 = time.perf_counter(), time.process_time()
+        n = fn()
+        wall.append((time.perf_counter() - t0) * 1000)
+        cpu.append((time.process_time() - c0) * 1000)
+    return {"wall_ms_median": round(statistics.median(wall), 2), "cpu_ms_median": round(statistics.median(cpu), 3),
+            "items": n}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--items", type=int, default=100, help="items in the feed")
+    ap.add_argument("--keep", type=int, default=20, help="items the streaming reader stops after")
+    ap.add_argument("--kbps", type=int, default=2000, help="server throttle for the fetch run; 0 = none")
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--out", default=None)
+    a = ap.parse_args()
+
+    body = synth_rss(a.items)
+    read = [0]
+
+    def stream():
+        read[0] = 0
+        return news_rss.parse_items(_chunks(body, news_rss.CHUNK, read), a.keep)
+
+    parse = {
+        "feedparser": _measure(lambda: feedparser.parse(body).entries, a.repeat),
+        "stream": _measure(stream, a.repeat),
+    }
+    parse["feedparser"]["bytes_read"] = len(body)
+    parse["stream"]["bytes_read"] = read[0]
+
+    q = multiprocessing.Queue()
+    server = multiprocessing.Process(target=_serve, args=(body, a.kbps, q), daemon=True)
+    server.start()
+    url = f"http://127.0.0.1:{q.get(timeout=10)}/rss"
+    try:
+        fetch = {
+            "feedparser": _fetch(lambda: len(feedparser.parse(url).entries), a.repeat),
+            "stream": _fetch(lambda: len(news_rss.fetch_items(url, a.keep).items), a.repeat),
+        }
+    finally:
+        server.terminate()
+
+    res = {
+        "bench": "rss",
+        "feed_bytes": len(body),
+        "items": a.items,
+        "keep": a.keep,
+        "kbps": a.kbps,
+        "parse": parse,
+        "fetch": fetch,
+        "speedup_parse_cpu": round(parse["feedparser"]["cpu_ms_median"] / max(parse["stream"]["cpu_ms_median"], 1e-6), 1),
+        "speedup_fetch_wall": round(fetch["feedparser"]["wall_ms_median"] / max(fetch["stream"]["wall_ms_median"], 1e-6), 1),
+    }
+    print(json.dumps(res, indent=2))
+    if a.out:
+        with open(a.out, "w", encoding="utf-8") as f:
+            json.dump(res, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Import-time budget for the app (worker cold start).
+
+    python -m bench.import_budget --budget-ms 1200 --out import_budget.json
+
+Runs `python -X importtime -c "import app.main"` in a fresh interpreter,
+reports the cumulative time and the slowest top-level imports, and exits 1
+if the total is over budget or if any SDK that should load lazily (openai,
+ics, feedparser, numpy, redis, httpx) was imported. Run in CI.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+LAZY = ("openai", "ics", "feedparser", "numpy", "redis", "httpx")
+
+def measure(target: str = "app.main") -> dict:
+    env = {**os.environ, "PYTHONPATH": REPO + os.pathsep + os.environ.get("PYTHONPATH", "")}
+    p = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {target}"],
+                       capture_output=True, text=True, env=env, cwd=REPO)
+    if p.returncode != 0:
+        raise SystemExit(p.stderr[-2000:])
+    rows = []   # (name, depth, self_us, cumulative_us)
+    for line in p.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cum_us, raw = line[len("import time:"):].split("|", 2)
+        if not self_us.strip().isdigit():
+            continue  # header line
+        name = raw.strip()
+        depth = (len(raw) - 1 - len(raw.lstrip())) // 2   # one space after "|", then two per level
+        rows.append((name, depth, int(self_us), int(cum_us)))
+    total = next((cum for name, depth, _, cum in reversed(rows) if name == target and depth == 0), 0)
+    names = {name for name, *_ in rows}
+    # children of the target (depth 1) are what a change to app code can move
+    top = sorted(((n, c) for n, d, _, c in rows if d == 1), key=lambda r: -r[1])
+    return {
+        "target": target,
+        "total_ms": round(total / 1000, 1),
+        "modules": len(rows),
+        "slowest": [{"module": n, "ms": round(c / 1000, 1)} for n, c in top[:10]],
+        "lazy_violations": sorted(m for m in LAZY if m in names),
+    }
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--budget-ms", type=float, default=1200.0)
+    ap.add_argument("--target", default="app.main")
+    ap.add_argument("--out", default=None)
+    a = ap.parse_args()
+
+    res = measure(a.target)
+    res["budget_ms"] = a.budget_ms
+    res["ok"] = res["total_ms"] <= a.budget_ms and not res["lazy_violations"]
+    print(json.dumps(res, indent=2))
+    if a.out:
+        with open(a.out, "w", encoding="utf-8") as f:
+            json.dump(res, f, indent=2)
+    if not res["ok"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Local stand-ins for the app's upstreams, for load tests.
+
+Each stub is a threaded HTTP server with its own latency, jitter and
+failure rate, so a slow OpenAI and a flaky ICS host can be simulated
+independently:
+
+    meteo   /v1/search (geocoding), /v1/forecast
+    news    /rss/search?q=...       Google-News-shaped RSS
+    ics     /cal/<n>.ics            today's one-off, all-day and recurring events
+    openai  /v1/chat/completions, /v1/audio/speech
+
+`app_env(stubs)` returns the environment variables that point the app at
+them (see app/config.py; the OpenAI SDK reads OPENAI_BASE_URL itself).
+"""
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, quote, urlparse
+from xml.sax.saxutils import escape
+
+@dataclass
+class StubConfig:
+    latency_ms: float = 50.0
+    jitter_ms: float = 10.0
+    fail_rate: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "StubConfig":
+        """'LAT[:JITTER[:FAIL]]', e.g. '800:300:0.02'."""
+        parts = [float(x) for x in spec.split(":")]
+        return cls(*parts)
+
+DEFAULTS = {
+    "meteo": StubConfig(60, 20, 0.0),
+    "news": StubConfig(150, 50, 0.01),
+    "ics": StubConfig(100, 40, 0.0),
+    "openai": StubConfig(800, 300, 0.01),
+}
+
+_WORDS = ("council approves budget storm brings rain padres rally late science fair winners "
+          "freeway closure planned tech layoffs continue court ruling expected heat wave").split()
+
+def _rss(query: str, n: int = 20) -> bytes:
+    rnd = random.Random(query)
+    now = datetime.now(timezone.utc)
+    items = []
+    for i in range(n):
+        title = f"{query.title()}: " + " ".join(rnd.sample(_WORDS, 6)) + " - Stub News"
+        items.append(
+            f"<item><title>{escape(title)}</title>"
+            f"<link>https://stub.example/{quote(query)}/{i}</link>"
+            f"<pubDate>{format_datetime(now - timedelta(minutes=17 * i))}</pubDate>"
+            f'<source url="https://stub.example">Stub News</source></item>'
+        )
+    return (f'<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+            f"<title>{escape(query)}</title>{''.join(items)}</channel></rss>").encode()
+
+def _ics(feed: str) -> bytes:
+    today = datetime.now().date()
+    d = today.strftime("%Y%m%d")
+    start = (today - timedelta(days=180)).strftime("%Y%m%d")
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//bench//stub//EN"]
+    for h in range(8, 18, 2):
+        lines += ["BEGIN:VEVENT", f"UID:{feed}-one-{h}@stub", f"DTSTART:{d}T{h:02d}0000",
+                  f"DTEND:{d}T{h:02d}4500", f"SUMMARY:{feed} meeting {h}", "END:VEVENT"]
+    lines += ["BEGIN:VEVENT", f"UID:{feed}-daily@stub", f"DTSTART:{start}T180000", f"DTEND:{start}T190000",
+              "RRULE:FREQ=DAILY", f"SUMMARY:{feed} practice", "END:VEVENT",
+              "BEGIN:VEVENT", f"UID:{feed}-allday@stub", f"DTSTART;VALUE=DATE:{d}",
+              f"DTEND;VALUE=DATE:{(today + timedelta(days=1)).strftime('%Y%m%d')}",
+              f"SUMMARY:{feed} all-day", "END:VEVENT", "END:VCALENDAR"]
+    return "\r\n".join(lines).encode()
+
+def _forecast(latitude: str = "") -> bytes:
+    one = {
+        "current": {"temperature_2m": 68.0, "precipitation": 0.0, "weather_code": 1},
+        "daily": {"temperature_2m_max": [74.0], "temperature_2m_min": [61.0],
+                  "precipitation_probability_max": [10]},
+    }
+    # like Open-Meteo: comma-separated coordinates get a list, one per location
+    n = latitude.count(",") + 1
+    return json.dumps([one] * n if n > 1 else one).encode()
+
+def _completion(body: dict) -> bytes:
+    prompt = (body.get("messages") or [{}])[-1].get("content", "")
+    text = "Stub summary. " + " ".join(prompt.split()[:60])
+    return json.dumps({
+        "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": text}}],
+        "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(text) // 4,
+                  "total_tokens": (len(prompt) + len(text)) // 4},
+    }).encode()
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_Server"
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status: int, body: bytes, ctype: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _delay_or_fail(self) -> bool:
+        cfg = self.server.cfg
+        with self.server.lock:
+            self.server.hits += 1
+        time.sleep(max(0.0, cfg.latency_ms + random.uniform(-cfg.jitter_ms, cfg.jitter_ms)) / 1000)
+        if random.random() < cfg.fail_rate:
+            self._reply(503, b'{"error": "stub failure"}', "application/json")
+            return True
+        return False
+
+    def do_GET(self):
+        if self._delay_or_fail():
+            return
+        u = urlparse(self.path)
+        q = {k: v[0] for k, v in parse_qs(u.query).items()}
+        kind = self.server.kind
+        if kind == "meteo" and u.path.endswith("/search"):
+            self._reply(200, json.dumps({"results": [{"latitude": 32.72, "longitude": -117.16}]}).encode(),
+                        "application/json")
+        elif kind == "meteo" and u.path.endswith("/forecast"):
+            self._reply(200, _forecast(q.get("latitude", "")), "application/json")
+        elif kind == "news":
+            self._reply(200, _rss(q.get("q", "news")), "application/rss+xml")
+        elif kind == "ics" and u.path.endswith(".ics"):
+            self._reply(200, _ics(u.path.rsplit("/", 1)[-1][:-4]), "text/calendar")
+        else:
+            self._reply(404, b"not found", "text/plain")
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if self._delay_or_fail():
+            return
+        if self.server.kind != "openai":
+            return self._reply(404, b"not found", "text/plain")
+        if self.path.endswith("/chat/completions"):
+            self._reply(200, _completion(body), "application/json")
+        elif self.path.endswith("/audio/speech"):
+            # ~1 KB of "audio" per 16 characters of input, roughly mp3 at 64 kbps
+            self._reply(200, b"\0" * (len(body.get("input", "")) * 64), "audio/mpeg")
+        else:
+            self._reply(404, b"not found", "text/plain")
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, kind: str, cfg: StubConfig):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.kind, self.cfg = kind, cfg
+        self.hits = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+def start_stubs(configs: Optional[Dict[str, StubConfig]] = None) -> Dict[str, _Server]:
+    """Start all four stubs on free ports (daemon threads); returns {name: server}."""
+    cfgs = {**DEFAULTS, **(configs or {})}
+    servers = {}
+    for kind, cfg in cfgs.items():
+        s = _Server(kind, cfg)
+        threading.Thread(target=s.serve_forever, name=f"stub-{kind}", daemon=True).start()
+        servers[kind] = s
+    return servers
+
+def app_env(stubs: Dict[str, _Server]) -> Dict[str, str]:
+    return {
+        "GEOCODE_URL": stubs["meteo"].url + "/v1/search",
+        "WEATHER_URL": stubs["meteo"].url + "/v1/forecast",
+        "NEWS_RSS_URL": stubs["news"].url + "/rss/search",
+        "OPENAI_BASE_URL": stubs["openai"].url + "/v1",
+        "OPENAI_API_KEY": "sk-stub",
+    }
+
+def ics_urls(stubs: Dict[str, _Server], n: int = 3):
+    return [f"{stubs['ics'].url}/cal/feed{i}.ics" for i in range(n)]
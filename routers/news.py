@@ -1,8 +1,20 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Depends, Query
 from pydantic import BaseModel
-from typing import List
-import feedparser
-import os, json
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from typing import Callable, List, Optional, Tuple
+from urllib.parse import quote_plus
+import os, json, logging, threading, time
+
+from app.config import settings
+from app.services.dedupe import collapse
+from app.services.prefs import get_store, saved_topics
+from app.services.users import DEFAULT_USER_ID, current_user_id
+from app.utils import breaker
+from app.utils.metrics import cache_event, stage, upstream_error
+from routers import news_index, news_rss
+
+log = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/news", tags=["news"])
 
@@ -12,6 +24,7 @@ class Article(BaseModel):
     link: str
     source: str | None = None
     published: str | None = None
+    topics: List[str] = []  # every saved topic this story matched (for-me only)
 
 class NewsResponse(BaseModel):
     topic: str
@@ -19,32 +32,108 @@ class NewsResponse(BaseModel):
     articles: List[Article]
 
 # ---- helpers ----
+FEED_TTL = float(os.getenv("NEWS_FEED_TTL", "600"))   # seconds a parsed feed is served without revalidating
+FEED_KEEP = 20                                        # entries kept per topic (callers want 3–5)
+FEED_MAX_TOPICS = 512
+DEFAULT_LOCALE = ("en-US", "US", "US:en")             # (hl, gl, ceid)
+
+def _feed_url(topic: str, locale: Tuple[str, str, str] = DEFAULT_LOCALE) -> str:
+    hl, gl, ceid = locale
+    return f"{settings.news_rss_url}?q={quote_plus(topic)}&hl={hl}&gl={gl}&ceid={ceid}"
+
+class _FeedEntry:
+    __slots__ = ("articles", "etag", "modified", "fetched_at", "lock")
+
+    def __init__(self):
+        self.articles: Optional[List[Article]] = None
+        self.etag: Optional[str] = None
+        self.modified: Optional[str] = None
+        self.fetched_at = 0.0
+        self.lock = threading.Lock()
+
+class TopicFeedCache:
+    """
+    Parsed Google News feeds shared by /news, /news/for-me and the morning
+    report, keyed by (normalized topic, locale). Fresh hits skip the network
+    and the parser; stale entries are revalidated with ETag/If-Modified-Since
+    so an unchanged feed costs a 304 instead of a download and re-parse.
+    Only the first FEED_KEEP items are read off the wire (news_rss).
+    Concurrent misses for the same key wait on one fetch.
+    """
+
+    def __init__(self, ttl: float = FEED_TTL, max_topics: int = FEED_MAX_TOPICS):
+        self.ttl = ttl
+        self.max_topics = max_topics
+        self._entries: "OrderedDict[tuple, _FeedEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(topic: str, locale: Tuple[str, str, str] = DEFAULT_LOCALE) -> tuple:
+        return (" ".join((topic or "").lower().split()), *locale)
+
+    def _slot(self, key: tuple) -> _FeedEntry:
+        with self._lock:
+            ent = self._entries.get(key)
+            if ent is None:
+                ent = self._entries[key] = _FeedEntry()
+                while len(self._entries) > self.max_topics:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+            return ent
+
+    def get(self, topic: str, n: int = 5, locale: Tuple[str, str, str] = DEFAULT_LOCALE) -> List[Article]:
+        key = self.key(topic, locale)
+        ent = self._slot(key)
+        hit = True
+        if ent.articles is None or time.monotonic() - ent.fetched_at >= self.ttl:
+            with ent.lock:
+                # another request may have refreshed it while we waited
+                if ent.articles is None or time.monotonic() - ent.fetched_at >= self.ttl:
+                    hit = False
+                    with stage("rss"):
+                        self._refresh(ent, _feed_url(key[0], locale))
+        cache_event("news_feed", hit)
+        # callers annotate articles (e.g. matched topics); never hand out the cached objects
+        return [a.model_copy() for a in (ent.articles or [])[:n]]
+
+    def _refresh(self, ent: _FeedEntry, url: str) -> None:
+        cb = breaker.breaker_for(url)
+        if not cb.allow():
+            # Google News is down: don't wait on it, keep serving what we have
+            return
+        t0 = time.perf_counter()
+        try:
+            page = news_rss.fetch_items(url, FEED_KEEP, etag=ent.etag, modified=ent.modified)
+        except Exception:
+            page = None
+        if page is not None and page.items is None and ent.articles is not None:
+            cb.record(True, time.perf_counter() - t0)
+            cache_event("news_feed_revalidate", True)
+            ent.fetched_at = time.monotonic()
+            return
+        failed = page is None or page.items is None
+        cb.record(not failed, time.perf_counter() - t0)
+        if failed:
+            # upstream error: keep serving what we have, retry on the next request
+            upstream_error("google-news")
+            return
+        ent.articles = [Article(**item) for item in page.items]
+        ent.etag = page.etag
+        ent.modified = page.modified
+        ent.fetched_at = time.monotonic()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+feed_cache = TopicFeedCache()
+
 def _google_news(topic: str, n: int = 5) -> List[Article]:
-    url = f"https://news.google.com/rss/search?q={topic}&hl=en-US&gl=US&ceid=US:en"
-    feed = feedparser.parse(url)
-    items: List[Article] = []
-    for e in feed.entries[:n]:
-        src = None
-        if hasattr(e, "source") and getattr(e, "source"):
-            try:
-                src = e.source.get("title")  # not always present
-            except Exception:
-                src = None
-        items.append(Article(
-            title=e.get("title", ""),
-            link=e.get("link", ""),
-            source=src,
-            published=e.get("published"),
-        ))
-    return items
-
-# read saved topics (shared with prefs.py path)
-DATA_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "prefs.json"))
-def _read_topics() -> List[str]:
-    if not os.path.exists(DATA_FILE):
-        return []
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
-        return json.load(f).get("topics", [])
+    return feed_cache.get(topic, n)
+
+def _read_topics(user_id: int = DEFAULT_USER_ID) -> List[str]:
+    return get_store().get(user_id).get("topics", [])
 
 # ---- routes ----
 @router.get("/", response_model=NewsResponse)
@@ -60,8 +149,99 @@ class ForMeResponse(BaseModel):
     topics: List[str]
     buckets: List[Bucket]
 
+SERVE_FROM_INDEX = os.getenv("NEWS_SERVE_FROM_INDEX", "1") not in ("0", "false", "no")
+
+def _topic_articles(topic: str, n: int, live: bool) -> List[Article]:
+    # the ingest job keeps the index warm; only topics it hasn't seen yet go to the network
+    if not live and SERVE_FROM_INDEX:
+        try:
+            rows = news_index.latest(topic, n)
+        except Exception:
+            rows = []
+        if rows:
+            return [Article(**r) for r in rows]
+    return _google_news(topic, n=n)
+
 @router.get("/for-me", response_model=ForMeResponse)
-def news_for_me(limit_per_topic: int = 3):
-    topics = _read_topics()
-    buckets = [Bucket(topic=t, articles=_google_news(t, n=limit_per_topic)) for t in topics]
-    return ForMeResponse(topics=topics, buckets=buckets)
+def news_for_me(limit_per_topic: int = 3, live: bool = False, user_id: int = Depends(current_user_id)):
+    topics = _read_topics(user_id)
+    fetched = [(t, _topic_articles(t, limit_per_topic, live)) for t in topics]
+    return ForMeResponse(topics=topics, buckets=_dedupe_buckets(fetched))
+
+class SearchHit(Article):
+    score: float
+
+class SearchResponse(BaseModel):
+    q: str
+    count: int
+    results: List[SearchHit]
+
+def _day_ts(d: Optional[date]) -> Optional[int]:
+    return int(datetime(d.year, d.month, d.day, tzinfo=timezone.utc).timestamp()) if d else None
+
+@router.get("/search", response_model=SearchResponse)
+def search_news(
+    q: str = Query(..., min_length=2, max_length=200),
+    since: Optional[date] = Query(None, description="published on/after (UTC date)"),
+    until: Optional[date] = Query(None, description="published before (UTC date)"),
+    topic: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+):
+    rows = news_index.search(q, limit=limit, since_ts=_day_ts(since), until_ts=_day_ts(until), topic=topic)
+    hits = [SearchHit(**r) for r in rows]
+    return SearchResponse(q=q, count=len(hits), results=hits)
+
+def _dedupe_buckets(fetched: List[tuple]) -> List[Bucket]:
+    """
+    The same wire story often shows up under several topics. Keep one copy,
+    in the first topic that returned it, and list every matching topic on it.
+    """
+    flat = [(t, a) for t, arts in fetched for a in arts]
+    keep = set()
+    for (topic, art), members in collapse(flat, title=lambda x: x[1].title):
+        art.topics = list(dict.fromkeys(t for t, _ in members))
+        keep.add(id(art))
+    return [Bucket(topic=t, articles=[a for a in arts if id(a) in keep]) for t, arts in fetched]
+
+# ---- background ingest ----
+INGEST_INTERVAL = float(os.getenv("NEWS_INGEST_INTERVAL", "900"))  # seconds; 0 disables
+
+def ingest_once(topics: List[str]) -> int:
+    """Pull every topic through the shared feed cache into the local index."""
+    new = 0
+    for t in dict.fromkeys(t for t in topics if t):
+        try:
+            arts = feed_cache.get(t, FEED_KEEP)
+            new += news_index.upsert(t, (a.model_dump(exclude={"topics"}) for a in arts))
+        except Exception:
+            log.exception("news ingest failed for topic %r", t)
+    return new
+
+class _IngestJob:
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, topics: Callable[[], List[str]] = saved_topics, interval: float = INGEST_INTERVAL) -> None:
+        if interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    ingest_once(topics())
+                except Exception:
+                    log.exception("news ingest pass failed")
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=loop, name="news-ingest", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+ingest_job = _IngestJob()
@@ -0,0 +1,158 @@
+# routers/news_index.py
+"""
+Local SQLite index of headlines already pulled from Google News.
+
+`articles` is deduplicated by link; `article_topics` records which saved
+topics returned each article; `articles_fts` is an external-content FTS5
+table over title/source kept in sync by triggers. Readers and the ingest
+job each open their own connection (WAL), so searches never wait on an
+ingest write.
+"""
+from __future__ import annotations
+import os
+import re
+import sqlite3
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterable, List, Optional
+
+DB_FILE = os.getenv(
+    "NEWS_DB",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "news.db")),
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    id           INTEGER PRIMARY KEY,
+    link         TEXT NOT NULL UNIQUE,
+    title        TEXT NOT NULL,
+    source       TEXT,
+    published    TEXT,
+    published_ts INTEGER,
+    fetched_ts   INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_articles_published ON articles(published_ts);
+CREATE TABLE IF NOT EXISTS article_topics (
+    topic      TEXT NOT NULL,
+    article_id INTEGER NOT NULL REFERENCES articles(id) ON DELETE CASCADE,
+    PRIMARY KEY (topic, article_id)
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+    title, source, content='articles', content_rowid='id', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS articles_ai AFTER INSERT ON articles BEGIN
+    INSERT INTO articles_fts(rowid, title, source) VALUES (new.id, new.title, new.source);
+END;
+CREATE TRIGGER IF NOT EXISTS articles_ad AFTER DELETE ON articles BEGIN
+    INSERT INTO articles_fts(articles_fts, rowid, title, source) VALUES ('delete', old.id, old.title, old.source);
+END;
+CREATE TRIGGER IF NOT EXISTS articles_au AFTER UPDATE OF title, source ON articles BEGIN
+    INSERT INTO articles_fts(articles_fts, rowid, title, source) VALUES ('delete', old.id, old.title, old.source);
+    INSERT INTO articles_fts(rowid, title, source) VALUES (new.id, new.title, new.source);
+END;
+"""
+
+_ready = False
+
+def _connect() -> sqlite3.Connection:
+    global _ready
+    os.makedirs(os.path.dirname(DB_FILE), exist_ok=True)
+    conn = sqlite3.connect(DB_FILE, timeout=10)
+    conn.row_factory = sqlite3.Row
+    if not _ready:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _ready = True
+    return conn
+
+def topic_key(topic: str) -> str:
+    return " ".join((topic or "").lower().split())
+
+def _ts(published: Optional[str]) -> Optional[int]:
+    if not published:
+        return None
+    try:
+        return int(parsedate_to_datetime(published).timestamp())
+    except Exception:
+        return None
+
+def upsert(topic: str, articles: Iterable[Dict]) -> int:
+    """Store articles for `topic` in one transaction; returns how many links were new."""
+    now = int(time.time())
+    key = topic_key(topic)
+    new = 0
+    conn = _connect()
+    try:
+        with conn:
+            for a in articles:
+                link = a.get("link")
+                if not link:
+                    continue
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO articles(link, title, source, published, published_ts, fetched_ts) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (link, a.get("title") or "", a.get("source"), a.get("published"), _ts(a.get("published")), now),
+                )
+                if cur.rowcount:
+                    new += 1
+                    aid = cur.lastrowid
+                else:
+                    aid = conn.execute("SELECT id FROM articles WHERE link = ?", (link,)).fetchone()[0]
+                conn.execute("INSERT OR IGNORE INTO article_topics(topic, article_id) VALUES (?, ?)", (key, aid))
+    finally:
+        conn.close()
+    return new
+
+def latest(topic: str, n: int) -> List[Dict]:
+    """Newest `n` indexed articles for a topic (by publish time, then fetch time)."""
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT a.title, a.link, a.source, a.published FROM article_topics t "
+            "JOIN articles a ON a.id = t.article_id WHERE t.topic = ? "
+            "ORDER BY a.published_ts DESC, a.fetched_ts DESC LIMIT ?",
+            (topic_key(topic), n),
+        ).fetchall()
+        return [dict(r) for r in rows]
+    finally:
+        conn.close()
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+def _match_expr(q: str) -> Optional[str]:
+    # treat user input as plain terms (AND), last one as a prefix; no FTS syntax leaks through
+    terms = _TERM.findall(q or "")
+    if not terms:
+        return None
+    parts = [f'"{t}"' for t in terms[:-1]] + [f'"{terms[-1]}"*']
+    return " ".join(parts)
+
+def search(
+    q: str,
+    limit: int = 20,
+    since_ts: Optional[int] = None,
+    until_ts: Optional[int] = None,
+    topic: Optional[str] = None,
+) -> List[Dict]:
+    """BM25-ranked (title weighted over source) search with optional publish-date and topic filters."""
+    expr = _match_expr(q)
+    if not expr:
+        return []
+    sql = [
+        "SELECT a.title, a.link, a.source, a.published, bm25(articles_fts, 4.0, 1.0) AS score",
+        "FROM articles_fts JOIN articles a ON a.id = articles_fts.rowid",
+        "WHERE articles_fts MATCH ?",
+    ]
+    args: list = [expr]
+    if since_ts is not None:
+        sql.append("AND a.published_ts >= ?"); args.append(since_ts)
+    if until_ts is not None:
+        sql.append("AND a.published_ts < ?"); args.append(until_ts)
+    if topic:
+        sql.append("AND a.id IN (SELECT article_id FROM article_topics WHERE topic = ?)"); args.append(topic_key(topic))
+    sql.append("ORDER BY score LIMIT ?"); args.append(limit)
+    conn = _connect()
+    try:
+        return [dict(r) for r in conn.execute(" ".join(sql), args).fetchall()]
+    finally:
+        conn.close()
@@ -1,62 +1,35 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
-import os, json
+
+from app.services.prefs import get_store
+from app.services.users import current_user_id
 
 router = APIRouter(prefix="/prefs", tags=["prefs"])
 
-# ---- file fallback paths (used locally if no KV) ----
-DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data"))
-TOPICS_FILE = os.path.join(DATA_DIR, "prefs_topics.json")
-HOME_FILE   = os.path.join(DATA_DIR, "prefs_home.json")
-CAL_FILE    = os.path.join(DATA_DIR, "prefs_calendar.json")
-
-# ---- optional Key-Value (Redis) backend ----
-KV_URL = os.getenv("KV_URL", "redis://red-d2v10gbe5dus73f7orv0:6379")  # swap to rediss:// if TLS
-_R = None
-try:
-    import redis  # requires 'redis' in requirements.txt
-    if KV_URL:
-        _R = redis.from_url(KV_URL, decode_responses=True)
-except Exception:
-    _R = None
-
-_KV_TOPICS   = "prefs:topics"
-_KV_HOME     = "prefs:home"
-_KV_CALENDAR = "prefs:calendar"
-
-def _ensure_dir():
-    os.makedirs(DATA_DIR, exist_ok=True)
+# Per-user documents live in app.services.prefs (user_prefs table, or Redis
+# when KV_URL is set); this router exposes them in its typed shapes.
 
 # ---------- News topics (unchanged API) ----------
 class NewsPrefsIn(BaseModel):
     topics: List[str] = []
 
-def _read_topics() -> List[str]:
-    if _R:
-        raw = _R.get(_KV_TOPICS)
-        return json.loads(raw) if raw else []
-    _ensure_dir()
-    if not os.path.exists(TOPICS_FILE):
-        return []
-    with open(TOPICS_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-def _write_topics(topics: List[str]):
-    if _R:
-        _R.set(_KV_TOPICS, json.dumps(topics))
-        return
-    _ensure_dir()
-    with open(TOPICS_FILE, "w", encoding="utf-8") as f:
-        json.dump(topics, f, indent=2)
+def _update(user_id: int, key: str, value) -> None:
+    store = get_store()
+    d = store.get(user_id)
+    d[key] = value
+    store.put(user_id, d)
+
+def _read_topics(user_id: int) -> List[str]:
+    return get_store().get(user_id).get("topics", [])
 
 @router.get("/news", response_model=NewsPrefsIn)
-def get_news_prefs():
-    return NewsPrefsIn(topics=_read_topics())
+def get_news_prefs(user_id: int = Depends(current_user_id)):
+    return NewsPrefsIn(topics=_read_topics(user_id))
 
 @router.post("/news", response_model=NewsPrefsIn)
-def set_news_prefs(prefs: NewsPrefsIn):
-    _write_topics(prefs.topics or [])
+def set_news_prefs(prefs: NewsPrefsIn, user_id: int = Depends(current_user_id)):
+    _update(user_id, "topics", prefs.topics or [])
     return prefs
 
 # ---------- Home location (new) ----------
@@ -65,70 +38,60 @@ class HomePrefs(BaseModel):
     lon: float
     tz: Optional[str] = None  # e.g., "America/Los_Angeles"
 
-def _read_home() -> Optional[HomePrefs]:
-    if _R:
-        raw = _R.get(_KV_HOME)
-        return HomePrefs(**json.loads(raw)) if raw else None
-    _ensure_dir()
-    if not os.path.exists(HOME_FILE):
+def _read_home(user_id: int) -> Optional[HomePrefs]:
+    home = get_store().get(user_id).get("home") or {}
+    # the app's home may only have city/zip; this shape needs coordinates
+    if home.get("lat") is None or home.get("lon") is None:
         return None
-    with open(HOME_FILE, "r", encoding="utf-8") as f:
-        return HomePrefs(**json.load(f))
-
-def _write_home(h: HomePrefs):
-    data = h.dict()
-    if _R:
-        _R.set(_KV_HOME, json.dumps(data))
-        return
-    _ensure_dir()
-    with open(HOME_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+    return HomePrefs(lat=home["lat"], lon=home["lon"], tz=home.get("tz"))
+
+def _write_home(user_id: int, h: HomePrefs):
+    home = get_store().get(user_id).get("home") or {}
+    home.update(h.dict())
+    _update(user_id, "home", home)
 
 @router.get("/home", response_model=HomePrefs)
-def get_home_prefs():
-    h = _read_home()
+def get_home_prefs(user_id: int = Depends(current_user_id)):
+    h = _read_home(user_id)
     if not h:
         raise HTTPException(404, "Home location not set.")
     return h
 
 @router.post("/home", response_model=HomePrefs)
-def set_home_prefs(h: HomePrefs):
-    _write_home(h)
+def set_home_prefs(h: HomePrefs, user_id: int = Depends(current_user_id)):
+    _write_home(user_id, h)
     return h
 
 # ---------- Calendar ICS (new) ----------
 class CalendarPrefs(BaseModel):
-    ics_url: str  # public or private ICS URL
-
-def _read_calendar() -> Optional[CalendarPrefs]:
-    if _R:
-        raw = _R.get(_KV_CALENDAR)
-        return CalendarPrefs(**json.loads(raw)) if raw else None
-    _ensure_dir()
-    if not os.path.exists(CAL_FILE):
-        return None
-    with open(CAL_FILE, "r", encoding="utf-8") as f:
-        return CalendarPrefs(**json.load(f))
-
-def _write_calendar(c: CalendarPrefs):
-    data = c.dict()
-    if _R:
-        _R.set(_KV_CALENDAR, json.dumps(data))
-        return
-    _ensure_dir()
-    with open(CAL_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+    ics_url: Optional[str] = None  # public or private ICS URL
+    ics_urls: List[str] = []       # several feeds (school, sports, personal)
+
+    def urls(self) -> List[str]:
+        return list(dict.fromkeys(u.strip() for u in [*self.ics_urls, self.ics_url or ""] if u and u.strip()))
+
+def _read_calendar(user_id: int) -> Optional[CalendarPrefs]:
+    cal = get_store().get(user_id).get("calendar") or {}
+    c = CalendarPrefs(ics_url=cal.get("ics_url"), ics_urls=cal.get("ics_urls") or [])
+    return c if c.urls() else None
+
+def _write_calendar(user_id: int, c: CalendarPrefs):
+    _update(user_id, "calendar", c.dict())
 
 @router.get("/calendar", response_model=CalendarPrefs)
-def get_calendar_prefs():
-    c = _read_calendar()
+def get_calendar_prefs(user_id: int = Depends(current_user_id)):
+    c = _read_calendar(user_id)
     if not c:
         raise HTTPException(404, "Calendar ICS URL not set.")
     return c
 
 @router.post("/calendar", response_model=CalendarPrefs)
-def set_calendar_prefs(c: CalendarPrefs):
-    _write_calendar(c)
+def set_calendar_prefs(c: CalendarPrefs, user_id: int = Depends(current_user_id)):
+    urls = c.urls()
+    if not urls:
+        raise HTTPException(400, "ics_url or ics_urls is required.")
+    c = CalendarPrefs(ics_url=urls[0], ics_urls=urls)
+    _write_calendar(user_id, c)
     return c
 
 
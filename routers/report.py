@@ -1,15 +1,25 @@
 # routers/report.py
 from __future__ import annotations
+import asyncio
 import os
 from typing import List, Optional
 from datetime import datetime, timedelta
-from urllib.parse import quote_plus
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.responses import StreamingResponse
-import feedparser
 import httpx
-from ics import Calendar  # make sure requirements.txt has: ics==0.7.2
+
+from app.config import settings
+from app.services.calendar import afetch_events_aged
+from app.services.calendar_store import events_between
+from app.services import snapshots
+from app.services.dedupe import collapse
+from app.services.limiter import REPORT, Overloaded, estimate_tokens, http_429, limiter, retry_after_of
+from app.services.tts import split_segments, stream_speech, synthesize
+from app.services.users import current_user_id
+from app.utils import breaker
+from app.utils.breaker import describe_age
+from app.utils.metrics import stage, upstream_error
 
 # Try to reuse study client; fall back to local OpenAI client
 try:
@@ -17,12 +27,6 @@ try:
 except Exception:
     study_get_client = None
 
-try:
-    from dotenv import load_dotenv
-    load_dotenv(); load_dotenv("/etc/secrets/.env")
-except Exception:
-    pass
-
 def _local_get_client():
     try:
         from openai import OpenAI
@@ -32,6 +36,7 @@ def _local_get_client():
         return None
 
 from routers.prefs import get_news_prefs, get_home_prefs, get_calendar_prefs
+from routers.news import _google_news
 
 try:
     from zoneinfo import ZoneInfo  # py>=3.9
@@ -40,6 +45,8 @@ except Exception:
 
 router = APIRouter(prefix="/report", tags=["report"])
 
+REWRITE_MODEL = "gpt-4o-mini"
+
 # ----------------- helpers -----------------
 def _local_today_and_bounds(tz: Optional[str]):
     """
@@ -62,9 +69,8 @@ def _pretty_date_str(tz: Optional[str]) -> str:
     return now.strftime("%A, %B %d")
 
 def _fetch_headlines(topic: str, per: int) -> List[str]:
-    url = f"https://news.google.com/rss/search?q={quote_plus(topic)}&hl=en-US&gl=US&ceid=US:en"
-    d = feedparser.parse(url)
-    return [e.title for e in d.entries[:per]]
+    # shared with /news and /news/for-me, so a topic is fetched once per TTL
+    return [a.title for a in _google_news(topic, per)]
 
 async def _fetch_weather(lat: Optional[float], lon: Optional[float], tz: Optional[str]) -> Optional[str]:
     """
@@ -80,84 +86,89 @@ async def _fetch_weather(lat: Optional[float], lon: Optional[float], tz: Optiona
         "timezone": tz or "auto",
         "temperature_unit": "fahrenheit",   # << force °F
     }
-    try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            r = await client.get("https://api.open-meteo.com/v1/forecast", params=params)
-            r.raise_for_status()
-            j = r.json()
+    async def fetch() -> str:
+        try:
+            with stage("open_meteo"):
+                async with httpx.AsyncClient(timeout=10) as client:
+                    r = await client.get(settings.weather_url, params=params)
+                    r.raise_for_status()
+                    j = r.json()
+        except httpx.HTTPError:
+            upstream_error("open-meteo")
+            raise
         d = j.get("daily", {})
         highs = d.get("temperature_2m_max", [])
         lows  = d.get("temperature_2m_min", [])
         pops  = d.get("precipitation_probability_max", [])
         if not highs or not lows:
-            return None
+            raise ValueError("incomplete forecast")
         hi = round(highs[0]); lo = round(lows[0]); pop = (pops[0] if pops else 0)
         return f"Weather: high {hi}°F, low {lo}°F, rain {pop}%."
-    except Exception:
-        return None
 
-async def _fetch_schedule_today(ics_url: Optional[str], tz: Optional[str]) -> Optional[List[str]]:
+    # while Open-Meteo is down, repeat the last forecast for this spot (marked) instead of waiting it out
+    text, age = await breaker.acall(settings.weather_url, ("weather-f", lat, lon, tz), fetch)
+    if text and age is not None:
+        text = f"{text[:-1]} ({describe_age(age)})."
+    return text
+
+async def _fetch_schedule_today(ics_urls: List[str], tz: Optional[str],
+                                user_id: Optional[int] = None) -> Optional[List[str]]:
     """
     Returns today's events as lines. Handles timed and all-day/multi-day events.
+    With a user_id they come from the synced event store; otherwise all feeds
+    are fetched concurrently and merged in start order, de-duplicated by UID.
     """
-    if not ics_url:
+    if not ics_urls:
         return None
-    try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            r = await client.get(ics_url)
-            r.raise_for_status()
-            cal = Calendar(r.text)
-    except Exception:
+    now_local, day_start, day_end, date_only = _local_today_and_bounds(tz)
+    if day_start.tzinfo is None:
+        day_start, day_end = day_start.astimezone(), day_end.astimezone()
+    # weekly classes etc. are expanded only inside today's window
+    if user_id is not None:
+        events, age = await asyncio.to_thread(events_between, user_id, ics_urls, day_start, day_end)
+    else:
+        events, age = await afetch_events_aged(ics_urls, window=(day_start, day_end))
+    if not events:
         return None
 
-    now_local, day_start, day_end, date_only = _local_today_and_bounds(tz)
+    all_day: List[str] = []
     items: List[str] = []
 
-    for e in cal.events:
+    for e in events:
         try:
-            b = e.begin  # Arrow
-            # Convert to tz if provided
-            if tz:
-                b = b.to(tz)
-            # End can be None; for all-day events, ics usually sets end to day after.
-            e_end = getattr(e, "end", None)
-            if e_end and tz:
-                try:
-                    e_end = e_end.to(tz)
-                except Exception:
-                    pass
-
-            title = e.name or "Untitled"
-            loc = f" @ {e.location}" if getattr(e, "location", None) else ""
+            title = e.title or "Untitled"
+            loc = f" @ {e.location}" if e.location else ""
 
-            if getattr(e, "all_day", False):
+            if e.all_day:
                 # All-day or multi-day: include if today's date is within [begin.date(), end.date())
-                start_d = b.date()
-                end_d = (e_end.date() if e_end else start_d)
-                # Some calendars set end = next day for all-day; make inclusive of start only.
-                if start_d <= date_only <= end_d:
-                    # If event ends next day, it's still "today".
-                    items.append(f"All-day: {title}{loc}")
+                start_d = e.day
+                end_d = max(e.end.date() if e.end else start_d, start_d + timedelta(days=1))
+                if start_d <= date_only < end_d:
+                    all_day.append(f"All-day: {title}{loc}")
             else:
                 # Timed event: include if starts today (local)
+                b = e.begin.astimezone(day_start.tzinfo)
                 if b.date() == date_only:
-                    tstr = b.format("HH:mm")
-                    items.append(f"{tstr}: {title}{loc}")
+                    items.append(f"{b:%H:%M}: {title}{loc}")
         except Exception:
             continue
 
+    items = all_day + items
+    if items and age is not None:
+        items.append(f"(calendar {describe_age(age)})")
     return items if items else None
 
 async def _build_script(
     smart: bool,
     per: int,
-    qlat: Optional[float], qlon: Optional[float], qtz: Optional[str]
+    qlat: Optional[float], qlon: Optional[float], qtz: Optional[str],
+    user_id: int,
 ) -> str:
     # Home prefs fallback if lat/lon/tz not provided
     lat, lon, tz = qlat, qlon, qtz
     try:
         if lat is None or lon is None or tz is None:
-            home = get_home_prefs()
+            home = get_home_prefs(user_id)
             lat = lat if lat is not None else getattr(home, "lat", None)
             lon = lon if lon is not None else getattr(home, "lon", None)
             tz  = tz  if tz  is not None else getattr(home, "tz",  None)
@@ -167,13 +178,12 @@ async def _build_script(
     lines: List[str] = [f"Good morning. Here’s your report for {_pretty_date_str(tz)}."]
 
     # Calendar
-    ics_url = None
+    ics_urls: List[str] = []
     try:
-        ics = get_calendar_prefs()
-        ics_url = getattr(ics, "ics_url", None)
+        ics_urls = get_calendar_prefs(user_id).urls()
     except Exception:
         pass
-    sched = await _fetch_schedule_today(ics_url, tz)
+    sched = await _fetch_schedule_today(ics_urls, tz, user_id)
     if sched:
         lines.append("Today:")
         lines.extend([f"• {s}" for s in sched])
@@ -186,11 +196,14 @@ async def _build_script(
         lines.append(w)
 
     # News
-    prefs = get_news_prefs()
+    prefs = get_news_prefs(user_id)
     topics = (getattr(prefs, "topics", None) or [])
     if topics:
+        # the same wire story often comes back under several topics; read it once
+        flat = [(t, h) for t in topics for h in _fetch_headlines(t, per)]
+        reps = [rep for rep, _ in collapse(flat, title=lambda x: x[1])]
         for t in topics:
-            hs = _fetch_headlines(t, per)
+            hs = [h for tt, h in reps if tt == t]
             if not hs:
                 continue
             lines.append(f"{t}:")
@@ -205,19 +218,29 @@ async def _build_script(
         client = (study_get_client() if callable(study_get_client) else _local_get_client())
         if not client:
             return script + "\n\n(Note: smart summary unavailable.)"
+        messages = [
+            {"role": "system", "content": "Rewrite into a crisp 60–90 second spoken brief. Keep names, avoid fluff."},
+            {"role": "user",   "content": script},
+        ]
         try:
-            resp = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "Rewrite into a crisp 60–90 second spoken brief. Keep names, avoid fluff."},
-                    {"role": "user",   "content": script},
-                ],
-                temperature=0.2,
-                max_tokens=500,
-            )
+            async with limiter.aslot(REWRITE_MODEL, estimate_tokens(messages, 500), REPORT) as lease:
+                with stage("llm_rewrite"):
+                    resp = client.chat.completions.create(
+                        model=REWRITE_MODEL,
+                        messages=messages,
+                        temperature=0.2,
+                        max_tokens=500,
+                    )
+                lease.settle(getattr(getattr(resp, "usage", None), "total_tokens", None))
             text = (resp.choices[0].message.content or "").strip()
             return text or script
-        except Exception:
+        except Overloaded:
+            # the plain script is a fine report; don't queue behind interactive work for polish
+            return script + "\n\n(Note: smart summary skipped, assistant busy; reading headlines.)"
+        except Exception as e:
+            upstream_error("openai")
+            if type(e).__name__ == "RateLimitError":
+                limiter.pause(REWRITE_MODEL, retry_after_of(e))
             return script + "\n\n(Note: smart summary failed; reading headlines.)"
     return script
 
@@ -229,9 +252,10 @@ async def morning(
     lat: Optional[float] = Query(None),
     lon: Optional[float] = Query(None),
     tz: Optional[str] = Query(None),
+    user_id: int = Depends(current_user_id),
 ):
-    text = await _build_script(smart, per, lat, lon, tz)
-    return {"text": text}
+    text = await _build_script(smart, per, lat, lon, tz, user_id)
+    return {"text": text, "report_id": await asyncio.to_thread(snapshots.save, user_id, text)}
 
 @router.get("/morning/speak")
 async def morning_speak(
@@ -240,8 +264,15 @@ async def morning_speak(
     lat: Optional[float] = Query(None),
     lon: Optional[float] = Query(None),
     tz: Optional[str] = Query(None),
+    report_id: Optional[str] = Query(None, description="speak this snapshot from /report/morning"),
+    user_id: int = Depends(current_user_id),
 ):
-    text = await _build_script(smart, per, lat, lon, tz)
+    if report_id:
+        text = await asyncio.to_thread(snapshots.load, user_id, report_id)
+        if text is None:
+            raise HTTPException(404, "Report not found or expired; fetch /report/morning again.")
+    else:
+        text = await _build_script(smart, per, lat, lon, tz, user_id)
     if not text:
         raise HTTPException(400, "No report content.")
     client = (study_get_client() if callable(study_get_client) else _local_get_client())
@@ -249,10 +280,16 @@ async def morning_speak(
         raise HTTPException(500, "TTS requires OpenAI key. Set OPENAI_API_KEY or use a Secret File.")
     voice = os.getenv("TTS_VOICE", "alloy")
     model = os.getenv("TTS_MODEL", "tts-1")
-    r = client.audio.speech.create(model=model, voice=voice, input=text)
-    def gen():
-        yield r.read()
-    return StreamingResponse(gen(), media_type="audio/mpeg")
-
-
-
+    segments = split_segments(text)
+    try:
+        # first segment up front: an upstream failure still gets a status code, and playback starts on it
+        first = await asyncio.to_thread(synthesize, client, segments[0], model, voice)
+    except Overloaded as e:
+        raise http_429(e)
+    except Exception as e:
+        upstream_error("openai")
+        if type(e).__name__ == "RateLimitError":
+            limiter.pause(model, retry_after_of(e))
+            raise http_429(Overloaded(retry_after_of(e), "upstream"))
+        raise HTTPException(502, f"TTS error: {e}")
+    return StreamingResponse(stream_speech(client, segments, model, voice, first=first), media_type="audio/mpeg")
@@ -5,26 +5,16 @@ from typing import Optional
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
 
-# Load env if using Secret File on Render (and local .env during dev)
-try:
-    from dotenv import load_dotenv  # python-dotenv==1.0.1
-    load_dotenv()
-    load_dotenv("/etc/secrets/.env")
-except Exception:
-    pass
+import app.config  # noqa: F401  loads .env and the Render secret file once
+from app.services.limiter import INTERACTIVE, Overloaded, estimate_tokens, http_429, limiter, retry_after_of
 
-from openai import OpenAI
-# optional specific errors (SDK v1.x)
-try:
-    from openai import (
-        RateLimitError,
-        APIError,
-        APIConnectionError,
-        AuthenticationError,
-        BadRequestError,
-    )
-except Exception:
-    RateLimitError = APIError = APIConnectionError = AuthenticationError = BadRequestError = Exception  # type: ignore
+def _openai_errors():
+    # optional specific errors (SDK v1.x); imported with the SDK on first call
+    try:
+        from openai import RateLimitError, APIError, APIConnectionError, AuthenticationError, BadRequestError
+        return RateLimitError, APIError, APIConnectionError, AuthenticationError, BadRequestError
+    except Exception:
+        return (Exception,) * 5
 
 router = APIRouter(prefix="/study", tags=["study"])
 
@@ -38,10 +28,11 @@ class AnswerOut(BaseModel):
     answer: str
 
 # ---------- helper ----------
-def _get_client() -> OpenAI:
+def _get_client():
     key = os.getenv("OPENAI_API_KEY") or os.getenv("OAI_API_KEY")
     if not key:
         raise HTTPException(500, "OpenAI key not configured. Set OPENAI_API_KEY.")
+    from openai import OpenAI
     return OpenAI(api_key=key)
 
 # ---------- routes ----------
@@ -57,23 +48,32 @@ def ask(q: QuestionIn) -> AnswerOut:
     if q.level:  extras.append(f"Target level: {q.level}.")
     if q.format: extras.append(f"Preferred format: {q.format}.")
     prompt = "\n".join([q.question] + extras)
+    RateLimitError, APIError, APIConnectionError, AuthenticationError, BadRequestError = _openai_errors()
 
+    messages = [
+        {"role": "system", "content": system},
+        {"role": "user",   "content": prompt},
+    ]
     try:
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system},
-                {"role": "user",   "content": prompt},
-            ],
-            temperature=0.2,
-            max_tokens=400,
-        )
+        with limiter.slot("gpt-4o-mini", estimate_tokens(messages, 400), INTERACTIVE) as lease:
+            resp = client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=messages,
+                temperature=0.2,
+                max_tokens=400,
+            )
+            lease.settle(getattr(getattr(resp, "usage", None), "total_tokens", None))
         text = (resp.choices[0].message.content or "").strip()
         if not text:
             raise HTTPException(502, "OpenAI returned an empty response.")
         return AnswerOut(answer=text)
-    except RateLimitError:
-        raise HTTPException(429, "OpenAI quota exceeded. Check billing/limits.")
+    except HTTPException:
+        raise
+    except Overloaded as e:
+        raise http_429(e)
+    except RateLimitError as e:
+        limiter.pause("gpt-4o-mini", retry_after_of(e))
+        raise http_429(Overloaded(retry_after_of(e), "upstream"))
     except AuthenticationError:
         raise HTTPException(401, "OpenAI auth failed. Check OPENAI_API_KEY.")
     except BadRequestError as e:
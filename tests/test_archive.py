@@ -0,0 +1,107 @@
+"""NDJSON export/import (services/archive) against a throwaway SQLite file."""
+import json
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from app.db import Base
+from app.models import Goal, NoteChunk, NoteDoc, StudyItem, Task
+from app.services import archive, vectors
+from app.services.study import ingest_note
+
+class _Prefs:
+    def __init__(self):
+        self.docs = {}
+
+    def get(self, user_id):
+        return self.docs.get(user_id, {"topics": []})
+
+    def put(self, user_id, d):
+        self.docs[user_id] = d
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    # short busy timeout: a write blocked by the export fails fast instead of waiting 5 s
+    eng = create_engine(f"sqlite:///{tmp_path / 'app.db'}", connect_args={"check_same_thread": False, "timeout": 0.2})
+    Base.metadata.create_all(eng)
+    monkeypatch.setattr(archive, "get_store", lambda: _Prefs())
+    yield eng
+    eng.dispose()
+
+def _records(chunks):
+    return [json.loads(line) for line in b"".join(chunks).decode().splitlines()]
+
+def test_writes_go_through_while_an_export_is_paused(engine):
+    n = archive.BATCH * 2 + 10
+    with engine.begin() as conn:
+        conn.execute(insert(Task), [{"user_id": 1, "title": f"t{i}", "status": "todo"} for i in range(n)])
+    gen = archive.export_lines(engine, 1)
+    head = [next(gen), next(gen), next(gen)]       # header, prefs, first page of tasks
+    # the client is slow: the export is suspended mid-table while other requests write
+    with engine.begin() as conn:
+        conn.execute(insert(Task).values(user_id=2, title="other user", status="todo"))
+    recs = _records(head + list(gen))
+    assert sum(r["type"] == "task" for r in recs) == n
+
+def test_round_trip_remaps_ids(engine):
+    with engine.begin() as conn:
+        parent = conn.execute(insert(Goal).values(user_id=1, level="year", title="parent")).inserted_primary_key[0]
+        child = conn.execute(insert(Goal).values(user_id=1, level="month", title="child",
+                                                 parent_goal_id=parent)).inserted_primary_key[0]
+        conn.execute(insert(Task).values(user_id=1, goal_id=child, title="do it", status="todo"))
+    body = b"".join(archive.export_lines(engine, 1))
+
+    reader, imp = archive.LineReader(), archive.Importer(engine, 7)
+    for line, rec in list(reader.feed(body)) + list(reader.close()):
+        imp.add(line, rec)
+    summary = imp.finish()
+    assert summary["imported"]["goal"] == 2 and summary["imported"]["task"] == 1
+
+    with engine.connect() as conn:
+        goals = {g.title: g for g in conn.execute(select(Goal).where(Goal.user_id == 7))}
+        task = conn.execute(select(Task).where(Task.user_id == 7)).one()
+    assert goals["child"].parent_goal_id == goals["parent"].id
+    assert task.goal_id == goals["child"].id
+
+@pytest.mark.parametrize("line, msg", [
+    ('{"type":"task","id":1,"title":null}', "title is required"),
+    ('{"type":"task","id":1,"title":5}', "bad title"),
+    ('{"type":"task","id":1,"title":"x","due":"soon"}', "bad due"),
+])
+def test_malformed_records_are_archive_errors(engine, line, msg):
+    imp = archive.Importer(engine, 1)
+    imp.add(1, {"type": "header", "version": archive.VERSION})
+    with pytest.raises(archive.ArchiveError, match=msg):
+        imp.add(2, json.loads(line))
+
+def test_notes_round_trip_and_keep_their_study_items(engine, tmp_path, monkeypatch):
+    monkeypatch.setattr(vectors, "_index", vectors.VectorIndex(str(tmp_path / "index")))
+    text = "Chloroplasts convert light into chemical energy.\n\n" + "Photosynthesis makes glucose. " * 60
+    with Session(engine) as db:
+        doc = ingest_note(db, 1, "Photosynthesis", text)
+        doc_id = doc.id
+    with engine.begin() as conn:
+        conn.execute(insert(StudyItem).values(user_id=1, topic="bio", difficulty="mixed", source_doc_id=doc_id))
+    body = b"".join(archive.export_lines(engine, 1))
+    kinds = [r["type"] for r in _records([body])]
+    assert kinds.index("note") < kinds.index("study_item")
+
+    reader, imp = archive.LineReader(), archive.Importer(engine, 7)
+    for line, rec in list(reader.feed(body)) + list(reader.close()):
+        imp.add(line, rec)
+    assert imp.finish()["imported"]["note"] == 1
+
+    with engine.connect() as conn:
+        new_doc = conn.execute(select(NoteDoc).where(NoteDoc.user_id == 7)).one()
+        old_chunks = conn.execute(select(NoteChunk.text).where(NoteChunk.doc_id == doc_id).order_by(NoteChunk.ord)).all()
+        new_chunks = conn.execute(select(NoteChunk.id, NoteChunk.text).where(NoteChunk.doc_id == new_doc.id)
+                                  .order_by(NoteChunk.ord)).all()
+        item = conn.execute(select(StudyItem).where(StudyItem.user_id == 7)).one()
+    assert new_doc.id != doc_id and new_doc.title == "Photosynthesis"
+    assert [t for (t,) in old_chunks] == [c.text for c in new_chunks]
+    assert item.source_doc_id == new_doc.id
+    # re-embedded: the importing user's searches find the imported chunks
+    hits = vectors.get_index().search(vectors.embed(["chloroplasts light"]), owner=7, k=3)[0]
+    assert hits and hits[0][0] in {c.id for c in new_chunks}
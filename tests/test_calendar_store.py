@@ -0,0 +1,99 @@
+"""Synced calendar store (services/calendar_store) and /calendar/events, against a local ICS server."""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from zoneinfo import ZoneInfo
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, update
+
+from app.db import Base
+from app.models import CalendarFeed
+from app.routers import calendar as calendar_router
+from app.services import calendar_store
+
+TOKYO = ZoneInfo("Asia/Tokyo")
+
+def _ics() -> bytes:
+    today = datetime.now(TOKYO).date()
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//test//store//EN"]
+    for name, d in (("Yesterday", today - timedelta(days=1)), ("Today", today), ("Tomorrow", today + timedelta(days=1))):
+        lines += ["BEGIN:VEVENT", f"UID:{name}@test", "DTSTAMP:20260101T000000Z", f"DTSTART;VALUE=DATE:{d:%Y%m%d}",
+                  f"DTEND;VALUE=DATE:{d + timedelta(days=1):%Y%m%d}", f"SUMMARY:{name}", "END:VEVENT"]
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(lines).encode()
+
+class _Feed:
+    def __init__(self):
+        self.hits = 0
+        self.delay = 0.0
+        feed = self
+
+        class H(BaseHTTPRequestHandler):
+            def log_message(self, *a):
+                pass
+
+            def do_GET(self):
+                feed.hits += 1
+                time.sleep(feed.delay)
+                body = _ics()
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), H)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/cal.ics"
+
+class _Prefs:
+    def __init__(self, doc):
+        self.doc = doc
+
+    def get(self, user_id):
+        return self.doc
+
+@pytest.fixture
+def feed(tmp_path, monkeypatch):
+    eng = create_engine(f"sqlite:///{tmp_path / 'app.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(eng)
+    monkeypatch.setattr(calendar_store, "engine", eng)
+    f = _Feed()
+    monkeypatch.setattr(calendar_router, "get_store",
+                        lambda: _Prefs({"home": {"tz": "Asia/Tokyo"}, "calendar": {"ics_urls": [f.url]}}))
+    yield f
+    f.server.shutdown()
+    eng.dispose()
+
+def test_day_view_in_a_non_utc_zone_has_only_that_days_all_day_events(feed):
+    out = calendar_router.events(start=None, days=1, user_id=1)
+    assert [e.title for e in out.events] == ["Today"]
+    out = calendar_router.events(start=None, days=2, user_id=1)
+    assert [e.title for e in out.events] == ["Today", "Tomorrow"]
+
+def test_only_the_first_read_downloads_inline(feed):
+    calendar_router.events(start=None, days=1, user_id=1)
+    assert feed.hits == 1
+    # the job fell behind: the read serves the table and refreshes in the background
+    with calendar_store.engine.begin() as conn:
+        conn.execute(update(CalendarFeed).values(checked_at=datetime.utcnow() - 2 * timedelta(seconds=calendar_store.FRESH_FOR)))
+    feed.delay = 1.0
+    t0 = time.monotonic()
+    out = calendar_router.events(start=None, days=1, user_id=1)
+    assert time.monotonic() - t0 < 0.5
+    assert [e.title for e in out.events] == ["Today"]
+    for _ in range(40):
+        if feed.hits == 2:
+            break
+        time.sleep(0.05)
+    assert feed.hits == 2
+
+def test_ranges_outside_the_sync_window_are_rejected(feed):
+    today = datetime.now(TOKYO).date()
+    for start, days in ((today - timedelta(days=30), 1), (today + timedelta(days=59), 5)):
+        with pytest.raises(HTTPException) as e:
+            calendar_router.events(start=start, days=days, user_id=1)
+        assert e.value.status_code == 400
+    assert feed.hits == 0
@@ -0,0 +1,61 @@
+"""Admission control (services/limiter): a blocked model doesn't hold up the others."""
+import threading
+import time
+
+import pytest
+
+from app.services.limiter import BACKGROUND, INTERACTIVE, REPORT, Limiter, Overloaded
+
+LIMITS = {"gpt-4o-mini": (6000, 0), "tts-1": (6000, 0), "*": (6000, 0)}
+
+def _hold(lim, model, priority, started, release, log):
+    with lim.slot(model, priority=priority):
+        log.append(model)
+        started.set()
+        release.wait(5)
+
+def test_paused_model_does_not_block_other_models():
+    lim = Limiter(LIMITS, concurrency=4)
+    lim.pause("tts-1", 1)
+    started, release, log = threading.Event(), threading.Event(), []
+    t = threading.Thread(target=_hold, args=(lim, "tts-1", REPORT, started, release, log))
+    t.start()
+    time.sleep(0.05)                       # the tts call is queued first, and can't go for 1 s
+    t0 = time.monotonic()
+    with lim.slot("gpt-4o-mini", priority=REPORT):
+        waited = time.monotonic() - t0
+    assert waited < 0.5
+    assert not started.is_set()            # still paused
+    release.set()
+    t.join(5)
+    assert log == ["tts-1"]
+
+def test_same_model_keeps_queue_order():
+    lim = Limiter(LIMITS, concurrency=1)
+    gate, release, log = threading.Event(), threading.Event(), []
+    first = threading.Thread(target=_hold, args=(lim, "gpt-4o-mini", INTERACTIVE, gate, release, log))
+    first.start()
+    gate.wait(2)                           # holds the only slot
+    done = []
+
+    def call(model, priority):
+        with lim.slot(model, priority=priority):
+            done.append((model, priority))
+
+    threads = [threading.Thread(target=call, args=("gpt-4o-mini", p)) for p in (BACKGROUND, REPORT, INTERACTIVE)]
+    for th in threads:
+        th.start()
+        time.sleep(0.05)
+    release.set()
+    for th in [first, *threads]:
+        th.join(5)
+    assert [p for _, p in done] == [INTERACTIVE, REPORT, BACKGROUND]
+
+def test_pause_longer_than_max_wait_is_shed_at_once():
+    lim = Limiter(LIMITS, concurrency=4)
+    lim.pause("tts-1", 60)
+    t0 = time.monotonic()
+    with pytest.raises(Overloaded) as e:
+        with lim.slot("tts-1", priority=INTERACTIVE):
+            pass
+    assert time.monotonic() - t0 < 0.5 and e.value.retry_after > 50
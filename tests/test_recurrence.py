@@ -0,0 +1,117 @@
+"""Recurring-event expansion (services/recurrence) across America/Los_Angeles DST changes."""
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+from dateutil.rrule import rrulestr
+
+from app.services import recurrence
+from app.services.calendar import parse_events
+
+LA = ZoneInfo("America/Los_Angeles")
+
+VTIMEZONE = """BEGIN:VTIMEZONE
+TZID:America/Los_Angeles
+BEGIN:DAYLIGHT
+TZOFFSETFROM:-0800
+TZOFFSETTO:-0700
+TZNAME:PDT
+DTSTART:19700308T020000
+RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=2SU
+END:DAYLIGHT
+BEGIN:STANDARD
+TZOFFSETFROM:-0700
+TZOFFSETTO:-0800
+TZNAME:PST
+DTSTART:19701101T020000
+RRULE:FREQ=YEARLY;BYMONTH=11;BYDAY=1SU
+END:STANDARD
+END:VTIMEZONE"""
+
+def ics(*events: str) -> str:
+    return "\r\n".join(["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//test//recurrence//EN", VTIMEZONE,
+                        *events, "END:VCALENDAR"])
+
+def vevent(uid: str, start: str, *props: str, summary: str = "Class", minutes: int = 50) -> str:
+    s = datetime.strptime(start, "%Y%m%dT%H%M%S")
+    e = s + timedelta(minutes=minutes)
+    return "\r\n".join(["BEGIN:VEVENT", f"UID:{uid}", "DTSTAMP:20260101T000000Z",
+                        f"DTSTART;TZID=America/Los_Angeles:{start}",
+                        f"DTEND;TZID=America/Los_Angeles:{e:%Y%m%dT%H%M%S}",
+                        f"SUMMARY:{summary}", *props, "END:VEVENT"])
+
+def window(first: date, last: date):
+    return (datetime(first.year, first.month, first.day, tzinfo=LA),
+            datetime(last.year, last.month, last.day, tzinfo=LA) + timedelta(days=1))
+
+def local(events):
+    return [(e.begin.astimezone(LA).date(), e.begin.astimezone(LA).strftime("%H:%M")) for e in events]
+
+def utc_hours(events):
+    return [e.begin.astimezone(timezone.utc).hour for e in events]
+
+@pytest.fixture(autouse=True)
+def _fresh_cache():
+    recurrence._cache.clear()
+    yield
+    recurrence._cache.clear()
+
+WEEKLY = vevent("weekly@test", "20260105T090000", "RRULE:FREQ=WEEKLY;BYDAY=MO")
+
+def test_weekly_stays_at_nine_across_spring_forward():
+    # DST starts Sunday 2026-03-08: 09:00 PST is 17:00 UTC, 09:00 PDT is 16:00 UTC
+    evs = parse_events(ics(WEEKLY), window(date(2026, 3, 1), date(2026, 3, 17)))
+    assert local(evs) == [(date(2026, 3, 2), "09:00"), (date(2026, 3, 9), "09:00"), (date(2026, 3, 16), "09:00")]
+    assert utc_hours(evs) == [17, 16, 16]
+    assert all(e.end - e.begin == timedelta(minutes=50) for e in evs)
+
+def test_weekly_stays_at_nine_across_fall_back():
+    # DST ends Sunday 2026-11-01: 09:00 PDT is 16:00 UTC, 09:00 PST is 17:00 UTC
+    evs = parse_events(ics(WEEKLY), window(date(2026, 10, 25), date(2026, 11, 10)))
+    assert local(evs) == [(date(2026, 10, 26), "09:00"), (date(2026, 11, 2), "09:00"), (date(2026, 11, 9), "09:00")]
+    assert utc_hours(evs) == [16, 17, 17]
+
+def test_exdate_removes_the_occurrence_after_the_switch():
+    ev = vevent("ex@test", "20260105T090000", "RRULE:FREQ=WEEKLY;BYDAY=MO",
+                "EXDATE;TZID=America/Los_Angeles:20260309T090000")
+    evs = parse_events(ics(ev), window(date(2026, 3, 1), date(2026, 3, 17)))
+    assert local(evs) == [(date(2026, 3, 2), "09:00"), (date(2026, 3, 16), "09:00")]
+
+def test_rdate_adds_an_extra_occurrence():
+    ev = vevent("rd@test", "20260105T090000", "RRULE:FREQ=WEEKLY;BYDAY=MO",
+                "RDATE;TZID=America/Los_Angeles:20260311T090000")
+    evs = parse_events(ics(ev), window(date(2026, 3, 8), date(2026, 3, 14)))
+    assert local(evs) == [(date(2026, 3, 9), "09:00"), (date(2026, 3, 11), "09:00")]
+    assert utc_hours(evs) == [16, 16]
+
+def test_recurrence_id_override_moves_one_instance():
+    master = vevent("mv@test", "20260105T090000", "RRULE:FREQ=WEEKLY;BYDAY=MO")
+    moved = vevent("mv@test", "20260310T140000", "RECURRENCE-ID;TZID=America/Los_Angeles:20260309T090000",
+                   summary="Class (moved)")
+    evs = parse_events(ics(master, moved), window(date(2026, 3, 1), date(2026, 3, 17)))
+    assert [(d, t, e.title) for (d, t), e in zip(local(evs), evs)] == [
+        (date(2026, 3, 2), "09:00", "Class"),
+        (date(2026, 3, 10), "14:00", "Class (moved)"),
+        (date(2026, 3, 16), "09:00", "Class"),
+    ]
+
+def test_fast_forward_keeps_biweekly_phase():
+    rule = "FREQ=WEEKLY;INTERVAL=2;BYDAY=MO"
+    first = datetime(2020, 1, 6, 9, 0)                 # a Monday, six years before the window
+    lo = datetime(2026, 3, 1)
+    ff = recurrence._fast_forward(rule, first, lo)
+    assert first < ff <= lo
+    assert (ff - first).days % 14 == 0
+    assert lo - ff < timedelta(days=28)
+
+    ev = vevent("bi@test", "20200106T090000", "RRULE:" + rule)
+    evs = parse_events(ics(ev), window(date(2026, 3, 1), date(2026, 11, 15)))
+    # same dates as iterating from the original DTSTART
+    full = [d for d in rrulestr(rule, dtstart=first).between(lo, datetime(2026, 11, 16))]
+    assert local(evs) == [(d.date(), "09:00") for d in full]
+    assert all((d - first.date()).days % 14 == 0 for d, _ in local(evs))
+    assert {date(2026, 3, 9), date(2026, 11, 2)} & {d for d, _ in local(evs)}   # spans both switches
+
+def test_fast_forward_leaves_count_rules_alone():
+    first = datetime(2020, 1, 6, 9, 0)
+    assert recurrence._fast_forward("FREQ=WEEKLY;COUNT=10", first, datetime(2026, 3, 1)) == first
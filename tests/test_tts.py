@@ -0,0 +1,25 @@
+"""Sentence splitting for segmented TTS (services/tts)."""
+import pytest
+
+from app.services.tts import MAX_CHARS, sentences, split_segments
+
+@pytest.mark.parametrize("text, expected", [
+    ("The U.S. Senate voted 3.5 times. Then Dr. Smith left!",
+     ["The U.S. Senate voted 3.5 times.", "Then Dr. Smith left!"]),
+    ("Take vitamin C. Then rest.", ["Take vitamin C.", "Then rest."]),
+    ("Plan A. Plan B.", ["Plan A.", "Plan B."]),
+    ("Bring snacks, e.g. fruit. Start at 7 p.m. Friday.", ["Bring snacks, e.g. fruit.", "Start at 7 p.m. Friday."]),
+    ('He said "go now." Then we left.', ['He said "go now."', "Then we left."]),
+    ("Meet Mr. Lee at St. Mary's. It's on Main St.", ["Meet Mr. Lee at St. Mary's.", "It's on Main St."]),
+    ("Line one\nLine two. Still two", ["Line one", "Line two.", "Still two"]),
+])
+def test_sentences(text, expected):
+    assert sentences(text) == expected
+
+def test_split_segments_keeps_first_and_last_alone_and_packs_the_middle():
+    middle = [f"Headline number {i} about the city budget." for i in range(20)]
+    text = " ".join(["Good morning.", *middle, "Have a good day."])
+    segs = split_segments(text)
+    assert segs[0] == "Good morning." and segs[-1] == "Have a good day."
+    assert all(len(s) <= MAX_CHARS for s in segs[1:-1])
+    assert "\n".join(segs[1:-1]).split("\n") == middle
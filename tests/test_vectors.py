@@ -0,0 +1,73 @@
+"""Memory-mapped vector index (services/vectors): round trips, row reuse, growth, several processes."""
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from app.services import vectors
+from app.services.vectors import VectorIndex, embed
+
+TEXTS = ["tides and the moon", "photosynthesis in leaves", "the french revolution", "prime numbers"]
+
+@pytest.fixture(autouse=True)
+def small_index(monkeypatch):
+    monkeypatch.setattr(vectors, "INIT_CAPACITY", 4)
+
+def test_add_search_delete_round_trip(tmp_path):
+    idx = VectorIndex(str(tmp_path))
+    idx.add([10, 11, 12, 13], owner=1, vectors=embed(TEXTS))
+    idx.add([20], owner=2, vectors=embed(["tides and the moon"]))
+    hits = idx.search(embed(["moon tides"]), owner=1, k=2)[0]
+    assert hits[0][0] == 10 and hits[0][1] > hits[1][1]
+    assert all(cid != 20 for cid, _ in hits)                      # other owners never show up
+    assert [c for c, _ in idx.search(embed(["moon"]), owner=1, k=4, allow=[12, 13])[0]] in ([12, 13], [13, 12])
+
+    assert idx.delete([10, 99]) == 1
+    assert 10 not in [c for c, _ in idx.search(embed(["moon tides"]), owner=1, k=4)[0]]
+    assert len(idx) == 4
+    assert len(VectorIndex(str(tmp_path))) == 4                    # reopened from disk
+
+def test_deleted_rows_are_reused_and_the_file_grows(tmp_path):
+    idx = VectorIndex(str(tmp_path))
+    idx.add([1, 2, 3, 4], owner=1, vectors=embed(TEXTS))
+    idx.delete([2])
+    idx.add([5], owner=1, vectors=embed(["cell walls"]))
+    assert idx.capacity == 4                                       # took row of 2
+    idx.add(list(range(100, 110)), owner=1, vectors=embed([f"note {i}" for i in range(10)]))
+    assert idx.capacity == 16 and len(idx) == 14
+    assert idx.search(embed(["prime numbers"]), owner=1, k=1)[0][0][0] == 4
+
+def test_two_handles_see_each_others_writes(tmp_path):
+    a, b = VectorIndex(str(tmp_path)), VectorIndex(str(tmp_path))
+    a.add([1, 2], owner=1, vectors=embed(TEXTS[:2]))
+    b.add([3, 4], owner=1, vectors=embed(TEXTS[2:]))               # must not land on a's rows
+    b.add(list(range(100, 110)), owner=1, vectors=embed([f"note {i}" for i in range(10)]))   # b grows the files
+    for idx in (a, b):
+        assert len(idx) == 14
+        assert idx.search(embed(["tides moon"]), owner=1, k=1)[0][0][0] == 1
+        assert idx.search(embed(["french revolution"]), owner=1, k=1)[0][0][0] == 3
+    a.delete([3])
+    assert 3 not in [c for c, _ in b.search(embed(["french revolution"]), owner=1, k=14)[0]]
+
+def _writer(path, base, n):
+    idx = VectorIndex(path)
+    for i in range(n):
+        idx.add([base + i], owner=1, vectors=embed([f"worker {base} note {i}"]))
+
+def test_concurrent_processes_do_not_share_rows(tmp_path):
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_writer, args=(str(tmp_path), base, 60)) for base in (1000, 2000, 3000)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(60)
+        assert p.exitcode == 0
+    idx = VectorIndex(str(tmp_path))
+    assert len(idx) == 180
+    for base in (1000, 2000, 3000):
+        for i in (0, 31, 59):
+            q = embed([f"worker {base} note {i}"])
+            cid, score = idx.search(q, owner=1, k=1)[0][0]
+            assert cid == base + i and score == pytest.approx(1.0, abs=1e-5)
+    ids = np.asarray(idx._ids[:])
+    assert sorted(ids[ids >= 0].tolist()) == sorted(b + i for b in (1000, 2000, 3000) for i in range(60))